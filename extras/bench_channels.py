@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+"""
+Benchmark opening and closing channels on a single connection.
+
+Keeps a number of channels open and repeatedly closes one of them and
+opens a new one, so the time includes finding a free channel id among
+the open ones as well as the channel.open/channel.close round trips.
+
+"""
+import random
+import time
+from optparse import OptionParser
+
+import kamqp.client_0_8 as amqp
+
+
+def main():
+    parser = OptionParser(usage='usage: %prog [options]')
+    parser.add_option('--host', dest='host',
+                        help='AMQP server to connect to (default: %default)',
+                        default='localhost')
+    parser.add_option('-u', '--userid', dest='userid',
+                        help='userid to authenticate as (default: %default)',
+                        default='guest')
+    parser.add_option('-p', '--password', dest='password',
+                        help='password to authenticate with (default: %default)',
+                        default='guest')
+    parser.add_option('--ssl', dest='ssl', action='store_true',
+                        help='Enable SSL (default: not enabled)',
+                        default=False)
+    parser.add_option('-o', '--open', dest='open', type='int',
+                        help='number of channels kept open (default: %default)',
+                        default=1000)
+    parser.add_option('-n', '--count', dest='count', type='int',
+                        help='number of channels to open and close '
+                             '(default: %default)',
+                        default=10000)
+
+    options, args = parser.parse_args()
+
+    conn = amqp.Connection(options.host, userid=options.userid,
+                           password=options.password, ssl=options.ssl)
+
+    start = time.time()
+    channels = [conn.channel() for i in xrange(options.open)]
+    elapsed = time.time() - start
+    print '%-28s %10.0f ch/s  (%d channels in %.3fs)' % (
+        'open', options.open / elapsed, options.open, elapsed)
+
+    start = time.time()
+    for i in xrange(options.count):
+        channels.pop(random.randrange(len(channels))).close()
+        channels.append(conn.channel())
+    elapsed = time.time() - start
+    print '%-28s %10.0f ch/s  (%d channels in %.3fs)' % (
+        'close and reopen', options.count / elapsed, options.count, elapsed)
+
+    for ch in channels:
+        ch.close()
+    conn.close()
+
+if __name__ == '__main__':
+    main()
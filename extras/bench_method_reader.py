@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark of MethodReader.read_method, without a broker.
+
+Feeds canned basic.deliver frames (method, content header and body)
+to a MethodReader and reports frames/sec, with the default deque
+based queue and with the thread-safe Queue.Queue.
+
+"""
+import time
+from optparse import OptionParser
+
+from kamqp.client_0_8 import Message
+from kamqp.client_0_8.method_framing import MethodReader, MethodWriter
+from kamqp.client_0_8.serialization import AMQPWriter
+
+
+class _Recorder(object):
+    """Transport stand-in collecting the frames a MethodWriter
+    sends, and playing them back in a loop to a MethodReader."""
+
+    def __init__(self):
+        self.frames = []
+        self.pos = 0
+
+    def write_frames(self, frames):
+        self.frames.extend(frames)
+
+    def read_frame(self):
+        frame = self.frames[self.pos]
+        self.pos = (self.pos + 1) % len(self.frames)
+        return frame
+
+    def read_frames(self):
+        return [self.read_frame()]
+
+
+def main():
+    parser = OptionParser(usage='usage: %prog [options]')
+    parser.add_option('-n', '--count', dest='count', type='int',
+                        help='number of messages to read (default: %default)',
+                        default=100000)
+    parser.add_option('-s', '--size', dest='size', type='int',
+                        help='message body size (default: %default)',
+                        default=64)
+
+    options, args = parser.parse_args()
+    count = options.count
+
+    source = _Recorder()
+    args = AMQPWriter()
+    args.write_shortstr('ctag')
+    args.write_longlong(1)
+    args.write_bit(False)
+    args.write_shortstr('amq.direct')
+    args.write_shortstr('routing.key')
+    msg = Message('x' * options.size, content_type='text/plain')
+    MethodWriter(source, 131072).write_method(1, (60, 60), args.getvalue(),
+                                              msg)
+    frames = count * len(source.frames)
+
+    for label, thread_safe in [('deque', False), ('Queue.Queue', True)]:
+        reader = MethodReader(source, thread_safe=thread_safe)
+        read_method = reader.read_method
+        start = time.time()
+        for i in xrange(count):
+            read_method()
+        elapsed = time.time() - start
+        print '%-28s %10.0f frames/s  (%d frames in %.3fs)' % (
+            label, frames / elapsed, frames, elapsed)
+
+if __name__ == '__main__':
+    main()
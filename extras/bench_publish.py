@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+"""
+Benchmark publishing messages one at a time with Channel.basic_publish
+against publishing them in batches with Channel.basic_publish_many.
+
+Each run publishes the messages to a temporary queue and ends with a
+synchronous queue_purge, so the time includes the broker having
+received every message.
+
+"""
+import time
+from optparse import OptionParser
+
+import kamqp.client_0_8 as amqp
+
+
+def bench(label, ch, qname, count, publish):
+    start = time.time()
+    publish()
+    purged = ch.queue_purge(qname)
+    elapsed = time.time() - start
+    assert purged == count, (purged, count)
+    print '%-28s %10.0f msg/s  (%d messages in %.3fs)' % (
+        label, count / elapsed, count, elapsed)
+
+
+def main():
+    parser = OptionParser(usage='usage: %prog [options]')
+    parser.add_option('--host', dest='host',
+                        help='AMQP server to connect to (default: %default)',
+                        default='localhost')
+    parser.add_option('-u', '--userid', dest='userid',
+                        help='userid to authenticate as (default: %default)',
+                        default='guest')
+    parser.add_option('-p', '--password', dest='password',
+                        help='password to authenticate with (default: %default)',
+                        default='guest')
+    parser.add_option('--ssl', dest='ssl', action='store_true',
+                        help='Enable SSL (default: not enabled)',
+                        default=False)
+    parser.add_option('-n', '--count', dest='count', type='int',
+                        help='number of messages per run (default: %default)',
+                        default=20000)
+    parser.add_option('-b', '--batch', dest='batch', type='int',
+                        help='basic_publish_many batch size (default: %default)',
+                        default=100)
+    parser.add_option('-s', '--size', dest='size', type='int',
+                        help='message body size (default: %default)',
+                        default=64)
+
+    options, args = parser.parse_args()
+    count, batch = options.count, options.batch
+
+    conn = amqp.Connection(options.host, userid=options.userid,
+                           password=options.password, ssl=options.ssl)
+    ch = conn.channel()
+    qname, _, _ = ch.queue_declare(exclusive=True)
+
+    messages = [amqp.Message('x' * options.size, content_type='text/plain',
+                             delivery_mode=1) for i in xrange(count)]
+
+    def per_call():
+        for msg in messages:
+            ch.basic_publish(msg, routing_key=qname)
+
+    def batched():
+        for i in xrange(0, count, batch):
+            ch.basic_publish_many(messages[i:i + batch], routing_key=qname)
+
+    bench('basic_publish', ch, qname, count, per_call)
+    bench('basic_publish_many (%d)' % batch, ch, qname, count, batched)
+
+    ch.close()
+    conn.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark of AMQPReader, without a broker.
+
+Decodes basic.deliver arguments, once reading the payload in place
+(AMQPReader on the bytes) and once through a file-like object (what
+AMQPReader did for every frame before it learned to read at an
+offset).  The basic.publish and basic.deliver arguments are also
+encoded and decoded with the generated method_codecs.
+
+Content properties, with application_headers and with just a
+content_type and delivery_mode, are encoded and decoded with the
+compiled property codec of Message and with its generic loop, and
+looked up in a HeaderCache.  The lazy decoding of received messages
+is measured by loading the properties and reading the content_type.
+
+"""
+import time
+from io import BytesIO
+from optparse import OptionParser
+
+from kamqp.client_0_8 import Message
+from kamqp.client_0_8.method_framing import HeaderCache
+from kamqp.client_0_8.method_codecs import (decode_basic_deliver,
+                                            encode_basic_publish)
+from kamqp.client_0_8.serialization import AMQPReader, AMQPWriter
+
+
+def read_deliver(reader):
+    reader.read_shortstr()
+    reader.read_longlong()
+    reader.read_bit()
+    reader.read_shortstr()
+    reader.read_shortstr()
+
+
+def write_publish():
+    args = AMQPWriter()
+    args.write_short(0)
+    args.write_shortstr('amq.direct')
+    args.write_shortstr('routing.key')
+    args.write_bit(False)
+    args.write_bit(False)
+    return args.getvalue()
+
+
+def load_lazily(raw):
+    msg = Message()
+    msg._load_properties(raw, lazy=True)
+    return msg.content_type
+
+
+def main():
+    parser = OptionParser(usage='usage: %prog [options]')
+    parser.add_option('-n', '--count', dest='count', type='int',
+                        help='number of payloads to decode (default: %default)',
+                        default=100000)
+    parser.add_option('-t', '--headers', dest='headers', type='int',
+                        help='number of application headers (default: %default)',
+                        default=8)
+
+    options, args = parser.parse_args()
+    count = options.count
+
+    args = AMQPWriter()
+    args.write_shortstr('ctag')
+    args.write_longlong(1)
+    args.write_bit(False)
+    args.write_shortstr('amq.direct')
+    args.write_shortstr('routing.key')
+    deliver = args.getvalue()
+
+    headers = dict(('header-%d' % i, 'value %d' % i)
+                    for i in xrange(options.headers))
+    headers['count'] = 42
+    codec = Message._property_codec()
+    with_headers = {'content_type': 'text/plain', 'delivery_mode': 2,
+                    'application_headers': headers}
+    common = {'content_type': 'text/plain', 'delivery_mode': 2}
+    encoded_headers = codec.encode(with_headers)
+    cache = HeaderCache()
+    msg_with_headers = Message('', **with_headers)
+    msg_common = Message('', **common)
+    encoded_common = codec.encode(common)
+
+    for label, run in [
+            ('basic.deliver, in place',
+             lambda: read_deliver(AMQPReader(deliver))),
+            ('basic.deliver, stream',
+             lambda: read_deliver(AMQPReader(BytesIO(deliver)))),
+            ('basic.deliver, generated',
+             lambda: decode_basic_deliver(deliver)),
+            ('basic.publish, AMQPWriter', write_publish),
+            ('basic.publish, generated',
+             lambda: encode_basic_publish(0, 'amq.direct', 'routing.key',
+                                          False, False)),
+            ('encode headers, compiled',
+             lambda: codec.encode(with_headers)),
+            ('encode headers, generic',
+             lambda: codec._encode_generic(with_headers)),
+            ('encode headers, cached',
+             lambda: cache.serialize(msg_with_headers)),
+            ('decode headers, compiled',
+             lambda: codec.decode(encoded_headers)),
+            ('decode headers, generic',
+             lambda: codec._decode_generic(encoded_headers)),
+            ('decode headers, lazy',
+             lambda: load_lazily(encoded_headers)),
+            ('encode common, compiled', lambda: codec.encode(common)),
+            ('encode common, generic',
+             lambda: codec._encode_generic(common)),
+            ('encode common, cached', lambda: cache.serialize(msg_common)),
+            ('decode common, compiled',
+             lambda: codec.decode(encoded_common)),
+            ('decode common, generic',
+             lambda: codec._decode_generic(encoded_common))]:
+        start = time.time()
+        for i in xrange(count):
+            run()
+        elapsed = time.time() - start
+        print '%-28s %10.0f /s  (%d in %.3fs)' % (
+            label, count / elapsed, count, elapsed)
+
+if __name__ == '__main__':
+    main()
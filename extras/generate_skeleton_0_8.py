@@ -8,6 +8,10 @@ to be run once.
 
 2007-11-10 Barry Pederson <bp@barryp.org>
 
+With --codecs it generates kamqp/client_0_8/method_codecs.py
+instead, the encoders and decoders of the method arguments, which
+is meant to be rerun whenever the spec changes.
+
 """
 # Copyright (C) 2007 Barry Pederson <bp@barryp.org>
 #
@@ -28,6 +32,7 @@ to be run once.
 import sys
 import textwrap
 from optparse import OptionParser
+from struct import Struct
 from xml.etree import ElementTree
 
 
@@ -320,21 +325,307 @@ def generate_module(spec, out):
     out.write('}\n')
 
 
+#########
+#
+# Method argument codecs
+#
+
+#: struct format characters of the fixed size AMQP types
+_FIXED_FORMATS = {
+    'octet': 'B',
+    'short': 'H',
+    'long': 'I',
+    'longlong': 'Q',
+    }
+
+#: Length prefix of the AMQP strings
+_STRING_FORMATS = {
+    'shortstr': 'B',
+    'longstr': 'I',
+    }
+
+_CODECS_HEADER = """\
+# Copyright (C) 2007-2008 Barry Pederson <bp@barryp.org>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+# Generated from the AMQP spec by extras/generate_skeleton_0_8.py --codecs,
+# don't edit.
+\"\"\"
+Encoders and decoders of AMQP method arguments.
+
+``encode_<class>_<method>()`` takes the arguments of a method the
+client sends and returns them encoded, ``decode_<class>_<method>()``
+takes the payload of a method frame the client receives and the offset
+of the arguments in it, and returns the decoded arguments as a tuple.
+Consecutive fixed size arguments, bits and string lengths are packed
+and unpacked with a single :class:`struct.Struct`.
+
+\"\"\"
+from __future__ import absolute_import
+
+from struct import Struct
+
+from .serialization import AMQPReader, AMQPWriter
+
+try:
+    bytes
+except NameError:
+    # Python 2.5 and lower
+    bytes = str
+
+_EMPTY = bytes()
+
+
+def _shortstr(s):
+    if isinstance(s, unicode):
+        s = s.encode('utf-8')
+    if len(s) > 255:
+        raise ValueError('String too long (0..255)')
+    return s
+
+
+def _longstr(s):
+    if isinstance(s, unicode):
+        s = s.encode('utf-8')
+    return s
+
+
+def _encode(amqp_type, value):
+    w = AMQPWriter()
+    getattr(w, 'write_' + amqp_type)(value)
+    return w.getvalue()
+
+"""
+
+
+def _wrap(line):
+    """Wrap a long line of generated code, inside its parentheses."""
+    if len(line) <= 79:
+        return line
+    indent = ' ' * (line.index('(') + 1)
+    return '\n'.join(textwrap.wrap(line, 79, subsequent_indent=indent,
+                                   break_long_words=False))
+
+
+def _codec_name(class_element, method_element):
+    return ('%s_%s' % (class_element.attrib['name'],
+                       method_element.attrib['name'])).replace('-', '_')
+
+
+def _struct_name(fmt):
+    return '_s_' + fmt
+
+
+def _encoder_source(name, fields, structs):
+    """Source of the encoder function of a method."""
+    fieldnames = [_fixup_field_name(f) for f in fields]
+    lines = ['def encode_%s(%s):' % (name, ', '.join(fieldnames))]
+    parts = []          # ('fixed', format, expression) or ('raw', expression)
+    bits = []
+    for f, fieldname in zip(fields, fieldnames):
+        amqp_type = _field_type(f)
+        if amqp_type == 'bit':
+            if len(bits) == 8:
+                bits = []
+            if not bits:
+                parts.append(['fixed', 'B', bits])
+            bits.append(fieldname)
+            continue
+        bits = []
+        if amqp_type in _FIXED_FORMATS:
+            parts.append(('fixed', _FIXED_FORMATS[amqp_type], fieldname))
+        elif amqp_type in _STRING_FORMATS:
+            lines.append('    %s = _%s(%s)' % (fieldname, amqp_type, fieldname))
+            parts.append(('fixed', _STRING_FORMATS[amqp_type],
+                          'len(%s)' % fieldname))
+            parts.append(('raw', fieldname))
+        else:
+            parts.append(('raw', "_encode('%s', %s)" % (amqp_type, fieldname)))
+
+    # merge the consecutive fixed size parts
+    chunks = []
+    for part in parts:
+        kind, value = part[0], part[-1]
+        if kind == 'fixed':
+            if part[1] == 'B' and isinstance(value, list):
+                value = ' | '.join(
+                    ['bool(%s)' % value[0]] +
+                    ['bool(%s) << %d' % (bit, i)
+                        for i, bit in enumerate(value) if i])
+            if chunks and chunks[-1][0] == 'fixed':
+                chunks[-1][1] += part[1]
+                chunks[-1][2].append(value)
+            else:
+                chunks.append(['fixed', part[1], [value]])
+        else:
+            chunks.append(['raw', value])
+
+    exprs = []
+    for chunk in chunks:
+        if chunk[0] == 'fixed':
+            structs.add(chunk[1])
+            exprs.append('%s.pack(%s)' % (_struct_name(chunk[1]),
+                                          ', '.join(chunk[2])))
+        else:
+            exprs.append(chunk[1])
+    if not exprs:
+        lines.append('    return _EMPTY')
+    elif len(exprs) == 1:
+        lines.append('    return %s' % exprs[0])
+    else:
+        lines.append('    return _EMPTY.join([')
+        for expr in exprs:
+            lines.append('        %s,' % expr)
+        lines.append('        ])')
+    return lines
+
+
+def _decoder_source(name, fields, structs):
+    """Source of the decoder function of a method."""
+    lines = ['def decode_%s(buf, offset=0):' % name]
+    fieldnames = [_fixup_field_name(f) for f in fields]
+    if not fields:
+        lines.append('    return ()')
+        return lines
+
+    # Group the fields into runs read by a single unpack_from(): the
+    # fixed size fields and bits, up to and including the length of
+    # a string, followed by the statements run after the unpacking.
+    groups = []
+    group = None
+    bits = None
+    bit_octets = 0
+    for i, (f, fieldname) in enumerate(zip(fields, fieldnames)):
+        amqp_type = _field_type(f)
+        last = i == len(fields) - 1
+        if group is None:
+            group = {'format': '', 'targets': [], 'after': [],
+                     'reads_buf': False}
+            groups.append(group)
+        if amqp_type == 'bit':
+            if bits is None or bits[1] == 8:
+                bit_octets += 1
+                bits = ['bits%d' % bit_octets if bit_octets > 1 else 'bits', 0]
+                group['format'] += 'B'
+                group['targets'].append(bits[0])
+            group['after'].append('%s = bool(%s & %d)'
+                                  % (fieldname, bits[0], 1 << bits[1]))
+            bits[1] += 1
+            continue
+        bits = None
+        if amqp_type in _FIXED_FORMATS:
+            group['format'] += _FIXED_FORMATS[amqp_type]
+            group['targets'].append(fieldname)
+        elif amqp_type in _STRING_FORMATS:
+            group['format'] += _STRING_FORMATS[amqp_type]
+            group['targets'].append('n')
+            group['reads_buf'] = True
+            group['after'].append(
+                "%s = buf[offset:offset + n].decode('utf-8')" % fieldname)
+            if not last:
+                group['after'].append('offset += n')
+            group = None
+        else:
+            if group['format']:
+                group = {'format': '', 'targets': [], 'after': []}
+                groups.append(group)
+            group['reads_buf'] = True
+            group['after'].extend([
+                'r = AMQPReader(buf, offset)',
+                '%s = r.read_%s()' % (fieldname, amqp_type)])
+            if not last:
+                group['after'].append('offset = r.offset')
+            group = None
+
+    for i, group in enumerate(groups):
+        fmt = group['format']
+        if fmt:
+            structs.add(fmt)
+            targets = group['targets']
+            lines.append('    %s%s = %s.unpack_from(buf, offset)' % (
+                ', '.join(targets), ',' if len(targets) == 1 else '',
+                _struct_name(fmt)))
+            if group['reads_buf'] or i < len(groups) - 1:
+                lines.append('    offset += %d' % Struct('>' + fmt).size)
+        for stmt in group['after']:
+            lines.append('    ' + stmt)
+    lines.append('    return (%s%s)' % (', '.join(fieldnames),
+                                        ',' if len(fieldnames) == 1 else ''))
+    return lines
+
+
+def generate_codecs(spec, out):
+    """
+    Given an AMQP spec parsed into an xml.etree.ElemenTree, and a
+    file-like 'out' object to write to, generate the module of the
+    method argument codecs.
+
+    """
+    for domain in spec.findall('domain'):
+        domains[domain.attrib['name']] = domain.attrib['type']
+
+    functions = []
+    structs = set()
+    for amqp_class in spec.findall('class'):
+        for amqp_method in amqp_class.findall('method'):
+            name = _codec_name(amqp_class, amqp_method)
+            fields = amqp_method.findall('field')
+            chassis = [x.attrib['name'] for x in amqp_method.findall('chassis')]
+            if 'server' in chassis:
+                functions.append(_encoder_source(name, fields, structs))
+            if 'client' in chassis:
+                functions.append(_decoder_source(name, fields, structs))
+
+    out.write(_CODECS_HEADER + '\n')
+    for fmt in sorted(structs):
+        out.write("%s = Struct('>%s')\n" % (_struct_name(fmt), fmt))
+    for lines in functions:
+        out.write('\n\n' + '\n'.join(_wrap(line) for line in lines) + '\n')
+
+#
+#
+#########
+
+
 def main(argv=None):
     if argv is None:
         argv = sys.argv
 
-    if len(argv) < 2:
-        print 'Usage: %s <amqp-spec> [<output-file>]' % argv[0]
+    parser = OptionParser(usage='usage: %prog [options] <amqp-spec> '
+                                '[<output-file>]')
+    parser.add_option('-c', '--codecs', dest='codecs', action='store_true',
+                        help='generate the method argument codecs instead '
+                             'of a module skeleton',
+                        default=False)
+    options, args = parser.parse_args(argv[1:])
+
+    if not args:
+        parser.print_usage()
         return 1
 
-    spec = ElementTree.parse(argv[1])
-    if len(argv) < 3:
+    spec = ElementTree.parse(args[0])
+    if len(args) < 2:
         out = sys.stdout
     else:
-        out = open(argv[2], 'w')
+        out = open(args[1], 'w')
 
-    generate_module(spec, out)
+    if options.codecs:
+        generate_codecs(spec, out)
+    else:
+        generate_module(spec, out)
 
 if __name__ == '__main__':
     sys.exit(main())
@@ -22,8 +22,15 @@ from .basic_message import Message
 from .channel import Channel
 from .connection import Connection
 from .exceptions import (AMQPError, AMQPConnectionError,
-                         AMQPChannelError, AMQPInternalError)
+                         AMQPChannelError, AMQPInternalError,
+                         ChannelPoolExhausted)
+from .failover import BrokerList
+from .hub import Hub
+from .pool import ChannelPool
+from .recovery import RecoveringConnection
+from .threaded import ThreadedConnection
 
-__all__ = ["Connection", "Channel", "Message", "AMQPError",
+__all__ = ["Connection", "Channel", "Message", "BrokerList", "AMQPError",
            "AMQPConnectionError", "AMQPChannelError",
-           "AMQPInternalError"]
+           "AMQPInternalError", "ChannelPool", "ChannelPoolExhausted",
+           "Hub", "RecoveringConnection", "ThreadedConnection"]
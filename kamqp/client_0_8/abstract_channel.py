@@ -15,6 +15,8 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
 from __future__ import absolute_import
 
+from collections import deque
+
 from .serialization import AMQPWriter
 
 try:
@@ -23,7 +25,96 @@ except NameError:
     # Python 2.5 and lower
     bytes = str
 
-__all__ = ["AbstractChannel"]
+__all__ = ["AbstractChannel", "MethodQueue"]
+
+
+class MethodQueue(object):
+    """Methods received for a channel that nobody was waiting for yet.
+
+    Queued methods are kept in a deque per method signature, each
+    tagged with a sequence number, so the oldest method matching any
+    of a few allowed signatures can be found and removed without
+    scanning everything that was queued before it (typically a lot of
+    ``basic_deliver`` methods).
+
+    """
+
+    def __init__(self):
+        self.by_sig = {}
+        # (seq, method_sig) of everything queued, in arrival order.
+        # Entries of methods already taken by get() with a list of
+        # allowed methods are skipped lazily.
+        self.order = deque()
+        self.seq = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        by_sig = self.by_sig
+        queued = [item for queue in by_sig.values() for item in queue]
+        queued.sort()
+        return iter([method for seq, method in queued])
+
+    def append(self, method):
+        """Queue a ``(method_sig, args, content)`` tuple."""
+        self.seq += 1
+        method_sig = method[0]
+        try:
+            queue = self.by_sig[method_sig]
+        except KeyError:
+            queue = self.by_sig[method_sig] = deque()
+        queue.append((self.seq, method))
+        self.order.append((self.seq, method_sig))
+        self.count += 1
+
+    def _is_queued(self, seq, method_sig):
+        queue = self.by_sig.get(method_sig)
+        # Methods of a signature are taken oldest first, so anything
+        # older than the first one still queued is gone.
+        return bool(queue) and queue[0][0] <= seq
+
+    def get(self, allowed_methods=None):
+        """Remove and return the oldest queued method whose signature
+        is in ``allowed_methods`` (any method if it's None), or None
+        if there is no such method."""
+        if not self.count:
+            return None
+        order = self.order
+        if allowed_methods is None:
+            while order:
+                seq, method_sig = order.popleft()
+                if self._is_queued(seq, method_sig):
+                    return self._pop(method_sig)
+            return None
+
+        by_sig = self.by_sig
+        oldest = None
+        for method_sig in allowed_methods:
+            queue = by_sig.get(method_sig)
+            if queue and (oldest is None or queue[0][0] < oldest[0]):
+                oldest = (queue[0][0], method_sig)
+        if oldest is None:
+            return None
+        method = self._pop(oldest[1])
+        # Drop the stale entries at the start of the ordering, and
+        # compact it if stale entries pile up behind a method nobody
+        # is waiting for.
+        while order and not self._is_queued(*order[0]):
+            order.popleft()
+        if len(order) > 2 * self.count + 16:
+            self.order = deque([entry for entry in order
+                                    if self._is_queued(*entry)])
+        return method
+
+    def _pop(self, method_sig):
+        queue = self.by_sig[method_sig]
+        method = queue.popleft()[1]
+        if not queue:
+            del self.by_sig[method_sig]
+        self.count -= 1
+        return method
 
 
 class AbstractChannel(object):
@@ -38,7 +129,7 @@ class AbstractChannel(object):
         self.connection = connection
         self.channel_id = channel_id
         connection.channels[channel_id] = self
-        self.method_queue = []  # higher level queue for methods
+        self.method_queue = MethodQueue()  # higher level queue for methods
         self.auto_decode = False
 
     def __enter__(self):
@@ -55,14 +146,25 @@ class AbstractChannel(object):
         self.connection.method_writer.write_method(self.channel_id,
             method_sig, args, content)
 
+    def _send_methods(self, methods):
+        """Send a sequence of ``(method_sig, args, content)`` methods
+        for our channel using a single write."""
+        self.connection.method_writer.write_methods(self.channel_id,
+            methods)
+
     def close(self):
         raise NotImplementedError("must be overriden in subclass")
 
-    def wait(self, allowed_methods=None):
+    def wait(self, allowed_methods=None, timeout=None):
         """Wait for a method that matches our allowed_methods parameter (the
-        default value of None means match any method), and dispatch to it."""
+        default value of None means match any method), and dispatch to it.
+
+        Raises :exc:`socket.timeout` if no method arrived within
+        ``timeout`` seconds (the default of None means wait forever).
+
+        """
         method_sig, args, content = self.connection._wait_method(
-            self.channel_id, allowed_methods)
+            self.channel_id, allowed_methods, timeout=timeout)
 
         return self.dispatch_method(method_sig, args, content)
 
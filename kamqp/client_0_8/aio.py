@@ -0,0 +1,507 @@
+# Copyright (C) 2007-2008 Barry Pederson <bp@barryp.org>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+"""AMQP client running on an :mod:`asyncio` event loop.
+
+Needs Python 3.5.2 or later.  The methods that wait for a reply from the
+server return :class:`asyncio.Future` objects, which can be awaited
+from coroutines::
+
+    conn = await aio.connect('localhost', userid='guest',
+                             password='guest')
+    ch = await conn.channel()
+    qname, _, _ = await ch.queue_declare()
+    ch.basic_publish(Message('hello'), routing_key=qname)
+    msg = await ch.basic_get(qname, no_ack=True)
+    await ch.close()
+    await conn.close()
+
+Framing and method assembly is done by :class:`~.protocol.Protocol`,
+and the method arguments use the :mod:`.serialization` codec, so
+nothing here ever blocks the loop.
+
+"""
+from __future__ import absolute_import
+
+import asyncio
+import logging
+import sys
+
+from collections import deque
+
+from .connection import (DEFAULT_CHANNEL_MAX, DEFAULT_FRAME_MAX,
+                         LIBRARY_PROPERTIES)
+from .exceptions import AMQPChannelError, AMQPConnectionError
+from .method_codecs import (decode_basic_deliver, encode_basic_ack,
+                            encode_basic_publish)
+from .protocol import Protocol
+from .serialization import AMQPWriter
+from .transport import AMQP_PORT, IPV6_LITERAL
+
+__all__ = ["connect", "Connection", "Channel"]
+
+if sys.version_info < (3, 5, 2):
+    # for loop.create_future()
+    raise ImportError('kamqp.client_0_8.aio needs Python 3.5.2 or later')
+
+AMQP_LOGGER = logging.getLogger('amqplib')
+
+
+def connect(host='localhost', userid=None, password=None,
+        login_method='AMQPLAIN', login_response=None, virtual_host='/',
+        locale='en_US', client_properties=None, frame_max=DEFAULT_FRAME_MAX,
+        channel_max=DEFAULT_CHANNEL_MAX, loop=None):
+    """Connect to the broker at ``host`` (a ``'host[:port]'`` string),
+    returns a future resolving to an open :class:`Connection`.
+
+    The arguments mean the same as for the blocking
+    :class:`~.connection.Connection`.
+
+    """
+    if loop is None:
+        loop = asyncio.get_event_loop()
+    if (login_response is None) and (userid is not None) \
+            and (password is not None):
+        login_response = AMQPWriter()
+        login_response.write_table({"LOGIN": userid, "PASSWORD": password})
+        login_response = login_response.getvalue()[4:]
+
+    properties = dict(LIBRARY_PROPERTIES)
+    if client_properties:
+        properties.update(client_properties)
+
+    port = AMQP_PORT
+    m = IPV6_LITERAL.match(host)
+    if m:
+        host = m.group(1)
+        if m.group(2):
+            port = int(m.group(2))
+    elif ':' in host:
+        host, port = host.rsplit(':', 1)
+        port = int(port)
+
+    conn = Connection(loop, virtual_host, properties, login_method,
+                      login_response, locale, frame_max, channel_max)
+    connected = loop.create_connection(lambda: _AMQPProtocol(conn),
+                                       host, port)
+
+    def on_connected(fut):
+        if fut.cancelled():
+            conn._opened.cancel()
+        elif fut.exception() is not None:
+            conn._opened.set_exception(fut.exception())
+    asyncio.ensure_future(connected, loop=loop).add_done_callback(
+        on_connected)
+    return conn._opened
+
+
+class _AMQPProtocol(asyncio.Protocol):
+    """Hands the asyncio transport events to the :class:`Connection`."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def connection_made(self, transport):
+        self.connection._connection_made(transport)
+
+    def data_received(self, data):
+        self.connection._data_received(data)
+
+    def connection_lost(self, exc):
+        self.connection._connection_lost(exc)
+
+
+class _RPCChannel(object):
+    """Replies to synchronous methods arrive in the order the
+    methods were sent, so each channel keeps a queue of
+    ``(reply_sigs, future, parse)`` for the calls waiting."""
+
+    def __init__(self, connection, channel_id):
+        self.connection = connection
+        self.channel_id = channel_id
+        self.rpcs = deque()
+        self.is_open = True
+
+    def _send_method(self, method_sig, args=b'', content=None):
+        if not self.is_open:
+            raise AMQPChannelError(0, 'Channel is closed', method_sig)
+        self.connection._send(self.channel_id, method_sig, args, content)
+
+    def _rpc(self, method_sig, args, reply_sigs, parse=None):
+        future = self.connection.loop.create_future()
+        self._send_method(method_sig, args)
+        self.rpcs.append((reply_sigs, future, parse))
+        return future
+
+    def _reply(self, method_sig, args, content):
+        """Complete the oldest call waiting, if ``method_sig`` is
+        one of its replies."""
+        if self.rpcs and method_sig in self.rpcs[0][0]:
+            reply_sigs, future, parse = self.rpcs.popleft()
+            if not future.cancelled():
+                if parse is None:
+                    future.set_result(None)
+                else:
+                    future.set_result(parse(method_sig, args, content))
+            return True
+        return False
+
+    def _fail(self, exc):
+        self.is_open = False
+        rpcs, self.rpcs = self.rpcs, deque()
+        for reply_sigs, future, parse in rpcs:
+            if not future.done():
+                future.set_exception(exc)
+
+
+class Connection(_RPCChannel):
+    """AMQP connection running on an asyncio loop, created with
+    :func:`connect`."""
+
+    def __init__(self, loop, virtual_host, client_properties,
+            login_method, login_response, locale, frame_max, channel_max):
+        super(Connection, self).__init__(self, 0)
+        self.loop = loop
+        self.virtual_host = virtual_host
+        self.client_properties = client_properties
+        self.login_method = login_method
+        self.login_response = login_response
+        self.locale = locale
+        self.frame_max = frame_max
+        self.channel_max = channel_max
+        self.server_properties = {}
+        self.known_hosts = ''
+
+        self.channels = {0: self}
+        self.protocol = Protocol(frame_max)
+        self.transport = None
+        self._flush_scheduled = False
+        self._next_channel_id = 1
+        self._opened = loop.create_future()
+        self._closed = None
+
+    def _connection_made(self, transport):
+        self.transport = transport
+        self.protocol.initiate()
+        self._flush()
+
+    def _data_received(self, data):
+        try:
+            events = self.protocol.receive_data(data)
+        except Exception as exc:
+            return self._abort(exc)
+        channels = self.channels
+        for event in events:
+            if self.transport is None:
+                return
+            if len(event) == 2:
+                # unexpected frame type
+                return self._abort(event[1])
+            channel_id, method_sig, args, content = event
+            channel = channels.get(channel_id)
+            if channel is None:
+                AMQP_LOGGER.debug('Method %r for unknown channel %d' % (
+                    method_sig, channel_id))
+                continue
+            channel._dispatch(method_sig, args, content)
+        self._flush()
+
+    def _connection_lost(self, exc):
+        self.transport = None
+        if self._closed is not None and self._closed.done():
+            return
+        self._abort(exc or AMQPConnectionError(0, 'Connection lost', (0, 0)))
+
+    def _abort(self, exc):
+        """Fail everything that's waiting, and drop the connection."""
+        for channel in list(self.channels.values()):
+            channel._fail(exc)
+        self.channels = {}
+        if not self._opened.done():
+            self._opened.set_exception(exc)
+        if self._closed is not None and not self._closed.done():
+            self._closed.set_exception(exc)
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+
+    def _send(self, channel_id, method_sig, args=b'', content=None):
+        if self.transport is None:
+            raise AMQPConnectionError(0, 'Connection is closed', method_sig)
+        if isinstance(args, AMQPWriter):
+            args = args.getvalue()
+        self.protocol.send_method(channel_id, method_sig, args, content)
+        # Everything sent until the loop gets control back goes out
+        # in a single write.
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            self.loop.call_soon(self._flush)
+
+    def _flush(self):
+        self._flush_scheduled = False
+        data = self.protocol.data_to_send()
+        if data and self.transport is not None:
+            self.transport.write(data)
+
+    def _dispatch(self, method_sig, args, content):
+        if self._reply(method_sig, args, content):
+            return
+        if method_sig == (10, 10):
+            self._start(args)
+        elif method_sig == (10, 30):
+            self._tune(args)
+        elif method_sig == (10, 41):
+            self.known_hosts = args.read_shortstr()
+            self._opened.set_result(self)
+        elif method_sig == (10, 60):
+            reply_code = args.read_short()
+            reply_text = args.read_shortstr()
+            class_id = args.read_short()
+            method_id = args.read_short()
+            self._send(0, (10, 61))
+            self._flush()
+            self._abort(AMQPConnectionError(reply_code, reply_text,
+                                            (class_id, method_id)))
+        else:
+            AMQP_LOGGER.debug('Unexpected method %r on channel 0' % (
+                method_sig, ))
+
+    def _start(self, args):
+        args.read_octet()
+        args.read_octet()
+        self.server_properties = args.read_table()
+        reply = AMQPWriter()
+        reply.write_table(self.client_properties)
+        reply.write_shortstr(self.login_method)
+        reply.write_longstr(self.login_response)
+        reply.write_shortstr(self.locale)
+        self._send(0, (10, 11), reply)
+
+    def _tune(self, args):
+        self.channel_max = args.read_short() or self.channel_max
+        self.frame_max = args.read_long() or self.frame_max
+        self.protocol.frame_max = self.frame_max
+        reply = AMQPWriter()
+        reply.write_short(self.channel_max)
+        reply.write_long(self.frame_max)
+        reply.write_short(0)
+        self._send(0, (10, 31), reply)
+
+        reply = AMQPWriter()
+        reply.write_shortstr(self.virtual_host)
+        reply.write_shortstr('')
+        reply.write_bit(False)
+        self._send(0, (10, 40), reply)
+
+    def _get_free_channel_id(self):
+        # Hand out ids round robin, so it's rare to have to skip any.
+        for i in range(self.channel_max):
+            channel_id = self._next_channel_id
+            self._next_channel_id = channel_id % self.channel_max + 1
+            if channel_id not in self.channels:
+                return channel_id
+        raise ValueError(
+            "No free channel ids, current=%d, channel_max=%d" % (
+                len(self.channels), self.channel_max))
+
+    def channel(self, channel_id=None):
+        """Open a channel, returns a future resolving to the
+        :class:`Channel`."""
+        if channel_id is None:
+            channel_id = self._get_free_channel_id()
+        channel = Channel(self, channel_id)
+        args = AMQPWriter()
+        args.write_shortstr('')
+        return channel._rpc((20, 10), args, [(20, 11)],
+                            lambda method_sig, args, content: channel)
+
+    def close(self, reply_code=0, reply_text='', method_sig=(0, 0)):
+        """Close the connection, returns a future resolving once the
+        server has confirmed it."""
+        if self._closed is None:
+            self._closed = self.loop.create_future()
+            if self.transport is None:
+                self._closed.set_result(None)
+                return self._closed
+            args = AMQPWriter()
+            args.write_short(reply_code)
+            args.write_shortstr(reply_text)
+            args.write_short(method_sig[0])
+            args.write_short(method_sig[1])
+            self._rpc((10, 60), args, [(10, 61)],
+                      lambda *reply: self._close_ok())
+        return self._closed
+
+    def _close_ok(self):
+        for channel in list(self.channels.values()):
+            if channel is not self:
+                channel._fail(AMQPConnectionError(0, 'Connection closed',
+                                                  (10, 60)))
+        self.channels = {}
+        self.is_open = False
+        if self.transport is not None:
+            self.transport.close()
+        self._closed.set_result(None)
+
+
+class Channel(_RPCChannel):
+    """AMQP channel on an asyncio :class:`Connection`, created with
+    :meth:`Connection.channel`.
+
+    Consumer callbacks are called on the loop, a callback returning
+    a coroutine has it scheduled as a task.
+
+    """
+
+    def __init__(self, connection, channel_id):
+        super(Channel, self).__init__(connection, channel_id)
+        connection.channels[channel_id] = self
+        self.callbacks = {}
+
+    def _dispatch(self, method_sig, args, content):
+        if method_sig == (60, 60):
+            return self._basic_deliver(args, content)
+        if self._reply(method_sig, args, content):
+            return
+        if method_sig == (20, 40):
+            reply_code = args.read_short()
+            reply_text = args.read_shortstr()
+            class_id = args.read_short()
+            method_id = args.read_short()
+            self.connection._send(self.channel_id, (20, 41))
+            self._closed(AMQPChannelError(reply_code, reply_text,
+                                          (class_id, method_id)))
+        else:
+            AMQP_LOGGER.debug('Unexpected method %r on channel %d' % (
+                method_sig, self.channel_id))
+
+    def _closed(self, exc):
+        self._fail(exc)
+        self.callbacks = {}
+        self.connection.channels.pop(self.channel_id, None)
+
+    def close(self, reply_code=0, reply_text='', method_sig=(0, 0)):
+        """Close the channel, returns a future resolving once the
+        server has confirmed it."""
+        args = AMQPWriter()
+        args.write_short(reply_code)
+        args.write_shortstr(reply_text)
+        args.write_short(method_sig[0])
+        args.write_short(method_sig[1])
+
+        def close_ok(method_sig, args, content):
+            self._closed(AMQPChannelError(0, 'Channel closed', (20, 40)))
+        return self._rpc((20, 40), args, [(20, 41)], close_ok)
+
+    def queue_declare(self, queue='', passive=False, durable=False,
+            exclusive=False, auto_delete=True, arguments=None, ticket=0):
+        """Declare a queue, returns a future resolving to a
+        ``(queue, message_count, consumer_count)`` tuple."""
+        args = AMQPWriter()
+        args.write_short(ticket)
+        args.write_shortstr(queue)
+        args.write_bit(passive)
+        args.write_bit(durable)
+        args.write_bit(exclusive)
+        args.write_bit(auto_delete)
+        args.write_bit(False)
+        args.write_table(arguments or {})
+
+        def declare_ok(method_sig, args, content):
+            return (args.read_shortstr(), args.read_long(),
+                    args.read_long())
+        return self._rpc((50, 10), args, [(50, 11)], declare_ok)
+
+    def basic_publish(self, msg, exchange='', routing_key='',
+            mandatory=False, immediate=False, ticket=0):
+        """Publish a message, there's no reply to wait for."""
+        args = encode_basic_publish(ticket, exchange, routing_key,
+                                    mandatory, immediate)
+        self._send_method((60, 40), args, msg)
+
+    def basic_get(self, queue='', no_ack=False, ticket=0):
+        """Get a message from a queue, returns a future resolving to
+        the :class:`Message`, or None if the queue was empty."""
+        args = AMQPWriter()
+        args.write_short(ticket)
+        args.write_shortstr(queue)
+        args.write_bit(no_ack)
+
+        def get_ok(method_sig, args, msg):
+            if method_sig == (60, 72):
+                return None
+            msg.delivery_info = {"channel": self,
+                                 "delivery_tag": args.read_longlong(),
+                                 "redelivered": args.read_bit(),
+                                 "exchange": args.read_shortstr(),
+                                 "routing_key": args.read_shortstr(),
+                                 "message_count": args.read_long()}
+            return msg
+        return self._rpc((60, 70), args, [(60, 71), (60, 72)], get_ok)
+
+    def basic_ack(self, delivery_tag, multiple=False):
+        self._send_method((60, 80), encode_basic_ack(delivery_tag, multiple))
+
+    def basic_consume(self, queue='', consumer_tag='', no_local=False,
+            no_ack=False, exclusive=False, callback=None, ticket=0):
+        """Start a consumer calling ``callback`` with each message,
+        returns a future resolving to the consumer tag."""
+        args = AMQPWriter()
+        args.write_short(ticket)
+        args.write_shortstr(queue)
+        args.write_shortstr(consumer_tag)
+        args.write_bit(no_local)
+        args.write_bit(no_ack)
+        args.write_bit(exclusive)
+        args.write_bit(False)
+
+        def consume_ok(method_sig, args, content):
+            consumer_tag = args.read_shortstr()
+            self.callbacks[consumer_tag] = callback
+            return consumer_tag
+        return self._rpc((60, 20), args, [(60, 21)], consume_ok)
+
+    def basic_cancel(self, consumer_tag):
+        """Cancel a consumer, returns a future resolving once the
+        server has confirmed it."""
+        args = AMQPWriter()
+        args.write_shortstr(consumer_tag)
+        args.write_bit(False)
+
+        def cancel_ok(method_sig, args, content):
+            self.callbacks.pop(consumer_tag, None)
+        return self._rpc((60, 30), args, [(60, 31)], cancel_ok)
+
+    def _basic_deliver(self, args, msg):
+        (consumer_tag, delivery_tag, redelivered, exchange,
+         routing_key) = decode_basic_deliver(args.buf, args.offset)
+        msg.delivery_info = {"channel": self,
+                             "consumer_tag": consumer_tag,
+                             "delivery_tag": delivery_tag,
+                             "redelivered": redelivered,
+                             "exchange": exchange,
+                             "routing_key": routing_key}
+        callback = self.callbacks.get(consumer_tag)
+        if callback is not None:
+            # Called from the protocol's data_received(), an exception
+            # getting out would close the connection.
+            try:
+                result = callback(msg)
+            except Exception:
+                AMQP_LOGGER.exception(
+                    'Error in the callback of consumer %r' % consumer_tag)
+                return
+            if asyncio.iscoroutine(result):
+                asyncio.ensure_future(result, loop=self.connection.loop)
@@ -16,17 +16,37 @@
 from __future__ import absolute_import
 
 import logging
+import socket
 
+from collections import defaultdict, deque
+from heapq import heapify, heappop, heappush
 from Queue import Queue
+from time import time
 
 from .abstract_channel import AbstractChannel
 from .exceptions import AMQPChannelError
+from .method_codecs import (decode_basic_deliver, decode_basic_get_ok,
+                            decode_basic_return, encode_basic_ack,
+                            encode_basic_get, encode_basic_publish,
+                            encode_basic_reject)
 from .serialization import AMQPWriter
+from .topology import table_key
 
-__all__ = ["Channel"]
+try:
+    bytes
+except NameError:
+    # Python 2.5 and lower
+    bytes = str
+
+__all__ = ["Channel", "Pipeline", "AckAccumulator"]
 
 AMQP_LOGGER = logging.getLogger('amqplib')
 
+#: Default thresholds for sending coalesced acknowledgements,
+#: see :meth:`Channel.enable_ack_coalescing`.
+DEFAULT_ACK_COUNT = 64
+DEFAULT_ACK_DELAY = 0.25
+
 
 class Channel(AbstractChannel):
     """Create a channel bound to a connection and using the specified
@@ -71,9 +91,31 @@ class Channel(AbstractChannel):
         self.returned_messages = Queue()
         self.callbacks = {}
         self.auto_decode = auto_decode
-        self.events = {"basic_return": []}
+        self.events = {"basic_return": [], "basic_ack": [], "basic_nack": []}
         self.no_ack_consumers = set()
 
+        # publisher confirms
+        self.confirm_mode = False
+        self.next_publish_seq_no = 1
+        self.unconfirmed = set()
+        self._confirm_callbacks = {}
+        self._confirm_floor = 1
+        self._nacked = False
+
+        #: The :class:`Pipeline` currently collecting methods, if any.
+        self._pipeline = None
+
+        #: Declaration cache keys of the declare methods waiting for
+        #: a reply, by reply method signature.
+        self._declare_keys = defaultdict(deque)
+
+        #: :class:`AckAccumulator` if ack coalescing is enabled.
+        self.ack_accumulator = None
+        self._basic_get_no_ack = False
+        #: Set while waiting for the reply to a basic_get, still set
+        #: if the wait was interrupted.
+        self._basic_get_pending = False
+
         self._x_open()
 
     def _do_close(self):
@@ -82,8 +124,44 @@ class Channel(AbstractChannel):
         AMQP_LOGGER.debug('Closed channel #%d' % self.channel_id)
         self.is_open = False
         self.connection.channels.pop(self.channel_id, None)
+        self.connection._release_channel_id(self.channel_id)
+        self.connection._pending_ack_channels.discard(self)
         self.channel_id = self.connection = None
         self.callbacks = {}
+        self.unconfirmed.clear()
+        self._confirm_callbacks.clear()
+        self._declare_keys.clear()
+
+    def _send_method(self, method_sig, args=bytes(), content=None):
+        if self._pipeline is not None:
+            return self._pipeline._add_method(method_sig, args, content)
+        super(Channel, self)._send_method(method_sig, args, content)
+
+    def wait(self, allowed_methods=None, timeout=None):
+        if self._pipeline is not None:
+            return self._pipeline._add_reply(allowed_methods)
+        return super(Channel, self).wait(allowed_methods, timeout=timeout)
+
+    def pipeline(self):
+        """Create a :class:`Pipeline` for this channel, used to send
+        many declare and bind methods without waiting for the
+        reply of each one."""
+        return Pipeline(self)
+
+    def _expect_declare_ok(self, reply_sig, cache_key):
+        """Remember the declaration cache key of a declare method,
+        so it can be cached when the reply arrives."""
+        if self.connection.declaration_cache is not None:
+            self._declare_keys[reply_sig].append(cache_key)
+
+    def _declare_ok(self, reply_sig, result):
+        keys = self._declare_keys.get(reply_sig)
+        if keys:
+            cache_key = keys.popleft()
+            cache = self.connection.declaration_cache
+            if cache_key is not None and cache is not None:
+                cache.add(cache_key, result)
+        return result
 
     #################
 
@@ -173,6 +251,8 @@ class Channel(AbstractChannel):
             return
 
         try:
+            if self.ack_accumulator is not None:
+                self.ack_accumulator.flush()
             args = AMQPWriter()
             args.write_short(reply_code)
             args.write_shortstr(reply_text)
@@ -236,6 +316,10 @@ class Channel(AbstractChannel):
         cls_id = args.read_short()
         method_id = args.read_short()
 
+        cache = self.connection.declaration_cache
+        if cache is not None:
+            cache.clear()
+
         # close_ok
         self._send_method((20, 41))
         self._do_close()
@@ -767,6 +851,15 @@ class Channel(AbstractChannel):
         """
         arguments = {} if arguments is None else arguments
 
+        cache_key = None
+        if self.connection.declaration_cache is not None and not passive:
+            cache_key = ("exchange", exchange, type, durable, auto_delete,
+                         internal, table_key(arguments))
+            try:
+                return self.connection.declaration_cache.lookup(cache_key)
+            except KeyError:
+                pass
+
         args = AMQPWriter()
         args.write_short(self.default_ticket if ticket is None else ticket)
         args.write_shortstr(exchange)
@@ -781,6 +874,7 @@ class Channel(AbstractChannel):
 
         if not nowait:
             # wait for Channel.exchange_declare_ok
+            self._expect_declare_ok((40, 11), cache_key)
             return self.wait(allowed_methods=[(40, 11)])
 
     def _exchange_declare_ok(self, args):
@@ -790,7 +884,7 @@ class Channel(AbstractChannel):
         the exchange, essential for automatically-named exchanges.
 
         """
-        pass
+        self._declare_ok((40, 11), None)
 
     def exchange_delete(self, exchange, if_unused=False,
             nowait=False, ticket=None):
@@ -850,6 +944,8 @@ class Channel(AbstractChannel):
         args.write_bit(if_unused)
         args.write_bit(nowait)
         self._send_method((40, 20), args)
+        if self.connection.declaration_cache is not None:
+            self.connection.declaration_cache.discard_exchange(exchange)
 
         if not nowait:
             # wait for Channel.exchange_delete_ok
@@ -1003,6 +1099,15 @@ class Channel(AbstractChannel):
         if arguments is None:
             arguments = {}
 
+        cache_key = None
+        if self.connection.declaration_cache is not None:
+            cache_key = ("binding", queue, exchange, routing_key,
+                         table_key(arguments))
+            try:
+                return self.connection.declaration_cache.lookup(cache_key)
+            except KeyError:
+                pass
+
         args = AMQPWriter()
         args.write_short(self.default_ticket if ticket is None else ticket)
         args.write_shortstr(queue)
@@ -1014,6 +1119,7 @@ class Channel(AbstractChannel):
 
         if not nowait:
             # wait for Channel.queue_bind_ok
+            self._expect_declare_ok((50, 21), cache_key)
             return self.wait(allowed_methods=[(50, 21)])
 
     def _queue_bind_ok(self, args):
@@ -1022,7 +1128,7 @@ class Channel(AbstractChannel):
         This method confirms that the bind was successful.
 
         """
-        pass
+        self._declare_ok((50, 21), None)
 
     def queue_unbind(self, queue, exchange, routing_key='',
             nowait=False, arguments=None, ticket=None):
@@ -1090,6 +1196,9 @@ class Channel(AbstractChannel):
         #args.write_bit(nowait)
         args.write_table(arguments)
         self._send_method((50, 50), args)
+        if self.connection.declaration_cache is not None:
+            self.connection.declaration_cache.discard_binding(
+                queue, exchange, routing_key)
 
         if not nowait:
             # wait for Channel.queue_unbind_ok
@@ -1265,10 +1374,27 @@ class Channel(AbstractChannel):
             message count
             consumer count
 
+        If the connection has a declaration cache and the declaration
+        is found in it, the counts are not live and are returned as 0.
+        Use a passive declare to get the current counts.
+
         """
         if arguments is None:
             arguments = {}
 
+        cache_key = None
+        # server-named queues are never the same queue twice.
+        if self.connection.declaration_cache is not None and \
+                queue and not passive:
+            cache_key = ("queue", queue, durable, exclusive, auto_delete,
+                         table_key(arguments))
+            try:
+                qname = self.connection.declaration_cache.lookup(cache_key)[0]
+            except KeyError:
+                pass
+            else:
+                return qname, 0, 0
+
         args = AMQPWriter()
         args.write_short(self.default_ticket if ticket is None else ticket)
         args.write_shortstr(queue)
@@ -1282,6 +1408,7 @@ class Channel(AbstractChannel):
 
         if not nowait:
             # wait for Channel.queue_declare_ok
+            self._expect_declare_ok((50, 11), cache_key)
             return self.wait(allowed_methods=[(50, 11)])
 
     def _queue_declare_ok(self, args):
@@ -1317,7 +1444,8 @@ class Channel(AbstractChannel):
         message_count = args.read_long()
         consumer_count = args.read_long()
 
-        return queue, message_count, consumer_count
+        return self._declare_ok((50, 11),
+                                (queue, message_count, consumer_count))
 
     def queue_delete(self, queue='', if_unused=False, if_empty=False,
             nowait=False, ticket=None):
@@ -1398,6 +1526,8 @@ class Channel(AbstractChannel):
         args.write_bit(if_empty)
         args.write_bit(nowait)
         self._send_method((50, 40), args)
+        if self.connection.declaration_cache is not None:
+            self.connection.declaration_cache.discard_queue(queue)
 
         if not nowait:
             # Channel.queue_delete_ok
@@ -1616,11 +1746,50 @@ class Channel(AbstractChannel):
                     tag refers to an delivered message, and raise a
                     channel exception if this is not the case.
 
+        If ack coalescing is enabled (see :meth:`enable_ack_coalescing`)
+        the acknowledgement may be sent later, together with others.
+
         """
-        args = AMQPWriter()
-        args.write_longlong(delivery_tag)
-        args.write_bit(multiple)
-        self._send_method((60, 80), args)
+        if self.ack_accumulator is not None:
+            return self.ack_accumulator.ack(delivery_tag, multiple)
+        self._send_method((60, 80), self._basic_ack_args(delivery_tag,
+                                                         multiple))
+
+    def _basic_ack_args(self, delivery_tag, multiple=False):
+        return encode_basic_ack(delivery_tag, multiple)
+
+    def enable_ack_coalescing(self, max_count=DEFAULT_ACK_COUNT,
+            max_delay=DEFAULT_ACK_DELAY):
+        """Coalesce the acknowledgements sent by :meth:`basic_ack`.
+
+        Instead of sending one ``basic_ack`` per message, acknowledged
+        delivery tags are collected and sent as a single
+        ``basic_ack(multiple=True)`` covering all of them, when more
+        than ``max_count`` acks are pending, when the oldest pending ack
+        is older than ``max_delay`` seconds, when the connection blocks
+        waiting for the server, when :meth:`flush_acks` is called, or
+        when the channel is closed.
+
+        The delay is only checked on the next call to :meth:`basic_ack`
+        and by :meth:`Connection.heartbeat_tick`, so a consumer going
+        idle without waiting on the connection should call one of
+        those (or :meth:`flush_acks`) to bound it.
+
+        A multiple ack only covers tags the channel knows have been
+        delivered and settled, so the acks of messages received before
+        coalescing was enabled are sent one by one, and the following
+        ones too until every earlier message has been acked through
+        :meth:`basic_ack` or rejected.
+
+        """
+        if self.ack_accumulator is None:
+            self.ack_accumulator = AckAccumulator(self, max_count, max_delay)
+        return self.ack_accumulator
+
+    def flush_acks(self):
+        """Send any coalesced acknowledgements right away."""
+        if self.ack_accumulator is not None:
+            self.ack_accumulator.flush()
 
     def basic_cancel(self, consumer_tag, nowait=False):
         """End a queue consumer.
@@ -1910,11 +2079,8 @@ class Channel(AbstractChannel):
                 message was published.
 
         """
-        consumer_tag = args.read_shortstr()
-        delivery_tag = args.read_longlong()
-        redelivered = args.read_bit()
-        exchange = args.read_shortstr()
-        routing_key = args.read_shortstr()
+        (consumer_tag, delivery_tag, redelivered, exchange,
+         routing_key) = decode_basic_deliver(args.buf, args.offset)
 
         msg.delivery_info = {"channel": self,
                              "consumer_tag": consumer_tag,
@@ -1923,6 +2089,10 @@ class Channel(AbstractChannel):
                              "exchange": exchange,
                              "routing_key": routing_key}
 
+        if self.ack_accumulator is not None:
+            self.ack_accumulator.delivered(
+                delivery_tag, consumer_tag in self.no_ack_consumers)
+
         fun = self.callbacks.get(consumer_tag, None)
         if fun is not None:
             fun(msg)
@@ -1972,13 +2142,15 @@ class Channel(AbstractChannel):
         Non-blocking, returns a message object, or None.
 
         """
-        args = AMQPWriter()
-        args.write_short(self.default_ticket if ticket is None else ticket)
-        args.write_shortstr(queue)
-        args.write_bit(no_ack)
+        args = encode_basic_get(
+            self.default_ticket if ticket is None else ticket, queue, no_ack)
         self._send_method((60, 70), args)
+        self._basic_get_no_ack = no_ack
+        self._basic_get_pending = True
         # wait for Channel.basic_get_ok | Channel.basic_get_empty
-        return self.wait(allowed_methods=[(60, 71), (60, 72)])
+        msg = self.wait(allowed_methods=[(60, 71), (60, 72)])
+        self._basic_get_pending = False
+        return msg
 
     def _basic_get_empty(self, args):
         """Indicate that no messages are available.
@@ -2055,21 +2227,22 @@ class Channel(AbstractChannel):
                 queue and removed by other clients.
 
         """
-        delivery_tag = args.read_longlong()
-        redelivered = args.read_bit()
-        exchange = args.read_shortstr()
-        routing_key = args.read_shortstr()
-        message_count = args.read_long()
+        (delivery_tag, redelivered, exchange, routing_key,
+         message_count) = decode_basic_get_ok(args.buf, args.offset)
 
         msg.delivery_info = {"delivery_tag": delivery_tag,
                              "redelivered": redelivered,
                              "exchange": exchange,
                              "routing_key": routing_key,
                              "message_count": message_count}
+        if self.ack_accumulator is not None:
+            self.ack_accumulator.delivered(delivery_tag,
+                                           self._basic_get_no_ack)
         return msg
 
     def basic_publish(self, msg, exchange='', routing_key='',
-            mandatory=False, immediate=False, ticket=None):
+            mandatory=False, immediate=False, ticket=None,
+            confirm_callback=None):
         """Publish a message.
 
         This method publishes a message to a specific exchange. The
@@ -2148,15 +2321,76 @@ class Channel(AbstractChannel):
                     giving "write" access rights to the access realm
                     for the exchange.
 
-        """
-        args = AMQPWriter()
-        args.write_short(self.default_ticket if ticket is None else ticket)
-        args.write_shortstr(exchange)
-        args.write_shortstr(routing_key)
-        args.write_bit(mandatory)
-        args.write_bit(immediate)
+            confirm_callback: callable
 
+                Only used if the channel is in confirm mode (see
+                :meth:`confirm_select`), called with the sequence
+                number of the message and a boolean that is True if
+                the server acknowledged the message, or False if the
+                server rejected it.
+
+        If the channel is in confirm mode, returns the publish
+        sequence number of the message.
+
+        """
+        args = encode_basic_publish(
+            self.default_ticket if ticket is None else ticket,
+            exchange, routing_key, mandatory, immediate)
         self._send_method((60, 40), args, msg)
+        if self.confirm_mode:
+            return self._track_publish(confirm_callback)
+
+    def basic_publish_many(self, messages, exchange='', routing_key='',
+            mandatory=False, immediate=False, ticket=None,
+            confirm_callback=None):
+        """Publish a batch of messages.
+
+        Works like calling :meth:`basic_publish` for every message,
+        but all the messages are sent to the server using a single
+        write, and the method arguments are only encoded once for
+        every distinct destination.
+
+        PARAMETERS:
+            messages: iterable
+
+                The messages to publish.  An item can either be a
+                :class:`Message`, which is published using the
+                ``exchange`` and ``routing_key`` arguments of this
+                method, or a ``(message, exchange, routing_key)``
+                tuple.
+
+            exchange, routing_key, mandatory, immediate, ticket,
+            confirm_callback:
+
+                See :meth:`basic_publish`.
+
+        If the channel is in confirm mode, returns the list of
+        publish sequence numbers of the messages.
+
+        """
+        ticket = self.default_ticket if ticket is None else ticket
+        encoded = {}
+
+        def _encode_args(exchange, routing_key):
+            try:
+                return encoded[exchange, routing_key]
+            except KeyError:
+                args = encoded[exchange, routing_key] = encode_basic_publish(
+                    ticket, exchange, routing_key, mandatory, immediate)
+                return args
+
+        methods = []
+        for msg in messages:
+            if isinstance(msg, tuple):
+                msg, msg_exchange, msg_routing_key = msg
+                args = _encode_args(msg_exchange, msg_routing_key)
+            else:
+                args = _encode_args(exchange, routing_key)
+            methods.append(((60, 40), args, msg))
+
+        self._send_methods(methods)
+        if self.confirm_mode:
+            return [self._track_publish(confirm_callback) for _ in methods]
 
     def basic_qos(self, prefetch_size, prefetch_count, a_global):
         """Specify quality of service.
@@ -2272,6 +2506,10 @@ class Channel(AbstractChannel):
         """
         args = AMQPWriter()
         args.write_bit(requeue)
+        if self.ack_accumulator is not None:
+            # unacked messages are redelivered with new delivery tags
+            self.ack_accumulator.flush()
+            self.ack_accumulator.reset()
         self._send_method((60, 100), args)
 
     def basic_reject(self, delivery_tag, requeue):
@@ -2344,10 +2582,9 @@ class Channel(AbstractChannel):
                     later stage.
 
         """
-        args = AMQPWriter()
-        args.write_longlong(delivery_tag)
-        args.write_bit(requeue)
-        self._send_method((60, 90), args)
+        self._send_method((60, 90), encode_basic_reject(delivery_tag, requeue))
+        if self.ack_accumulator is not None:
+            self.ack_accumulator.settled(delivery_tag)
 
     def _basic_return(self, args, msg):
         """Return a failed message.
@@ -2382,10 +2619,8 @@ class Channel(AbstractChannel):
                 message was published.
 
         """
-        reply_code = args.read_short()
-        reply_text = args.read_shortstr()
-        exchange = args.read_shortstr()
-        routing_key = args.read_shortstr()
+        reply_code, reply_text, exchange, routing_key = \
+            decode_basic_return(args.buf, args.offset)
 
         exc = AMQPChannelError(reply_code, reply_text, (50, 60))
         if self.events["basic_return"]:
@@ -2491,6 +2726,15 @@ class Channel(AbstractChannel):
 
         The client can only use this method on a non-transactional channel.
 
+        Once in confirm mode every published message is given a
+        sequence number (starting at 1), which is kept in
+        :attr:`unconfirmed` until the server acknowledges (``basic_ack``)
+        or rejects (``basic_nack``) it.  Use :meth:`wait_for_confirms`
+        to wait for all outstanding messages, and the ``basic_ack`` and
+        ``basic_nack`` :attr:`events` or the ``confirm_callback``
+        argument to :meth:`basic_publish` to be notified about
+        individual messages.
+
         :param nowait:
             If set, the server will not respond to the method.
             The client should not wait for a reply method.  If the server
@@ -2501,6 +2745,9 @@ class Channel(AbstractChannel):
         args = AMQPWriter()
         args.write_bit(nowait)
         self._send_method((85, 10), args)
+        if not self.confirm_mode:
+            self.confirm_mode = True
+            self.next_publish_seq_no = self._confirm_floor = 1
         if not nowait:
             # wait for Confirm.select_ok
             self.wait(allowed_methods=[(85, 11)])
@@ -2510,6 +2757,120 @@ class Channel(AbstractChannel):
         set to use publisher acknowledgements."""
         pass
 
+    def wait_for_confirms(self, timeout=None):
+        """Wait until all messages published on this channel have been
+        acknowledged or rejected by the server.
+
+        Returns :const:`True` if all messages published since the last
+        call were acknowledged, and :const:`False` if the server
+        rejected any of them.  Raises :exc:`socket.timeout` if there
+        are still unconfirmed messages after ``timeout`` seconds.
+
+        """
+        if not self.confirm_mode:
+            raise ValueError("Channel is not in confirm mode")
+        if timeout is not None:
+            deadline = time() + timeout
+        while self.unconfirmed:
+            if timeout is not None:
+                timeout = deadline - time()
+                if timeout <= 0:
+                    raise socket.timeout()
+            self.wait(allowed_methods=[(60, 50),      # basic_return
+                                       (60, 80),      # basic_ack
+                                       (60, 120)],    # basic_nack
+                      timeout=timeout)
+        nacked, self._nacked = self._nacked, False
+        return not nacked
+
+    def _track_publish(self, callback=None):
+        seq_no = self.next_publish_seq_no
+        self.next_publish_seq_no += 1
+        self.unconfirmed.add(seq_no)
+        if callback is not None:
+            self._confirm_callbacks[seq_no] = callback
+        return seq_no
+
+    def _basic_ack(self, args):
+        """Acknowledge one or more published messages.
+
+        Sent by the server to a channel in confirm mode when it has
+        taken responsibility for one or more published messages.
+
+        PARAMETERS:
+            delivery_tag: longlong
+
+                the publish sequence number of the message
+
+            multiple: boolean
+
+                If set, the delivery tag is treated as "up to and
+                including", acknowledging all outstanding messages
+                with lower sequence numbers as well.
+
+        """
+        delivery_tag = args.read_longlong()
+        multiple = args.read_bit()
+        self._confirm_publishes(delivery_tag, multiple, True)
+
+    def _basic_nack(self, args):
+        """Reject one or more published messages.
+
+        Sent by the server to a channel in confirm mode when it could
+        not take responsibility for one or more published messages.
+
+        PARAMETERS:
+            delivery_tag: longlong
+
+                the publish sequence number of the message
+
+            multiple: boolean
+
+                If set, the delivery tag is treated as "up to and
+                including", rejecting all outstanding messages with
+                lower sequence numbers as well.
+
+            requeue: boolean
+
+                Not used by the server when rejecting publishes.
+
+        """
+        delivery_tag = args.read_longlong()
+        multiple = args.read_bit()
+        args.read_bit()  # requeue
+        self._nacked = True
+        self._confirm_publishes(delivery_tag, multiple, False)
+
+    def _confirm_publishes(self, delivery_tag, multiple, acked):
+        unconfirmed = self.unconfirmed
+        if multiple:
+            if not delivery_tag:
+                delivery_tag = self.next_publish_seq_no - 1
+            # sequence numbers below the floor are already confirmed,
+            # so we only have to look at the range since the last one.
+            tags = [tag for tag in xrange(self._confirm_floor,
+                                          delivery_tag + 1)
+                        if tag in unconfirmed]
+            self._confirm_floor = max(self._confirm_floor, delivery_tag + 1)
+        else:
+            tags = [delivery_tag] if delivery_tag in unconfirmed else []
+            if delivery_tag == self._confirm_floor:
+                floor = delivery_tag + 1
+                while floor < self.next_publish_seq_no and \
+                        floor not in unconfirmed:
+                    floor += 1
+                self._confirm_floor = floor
+
+        event = self.events["basic_ack" if acked else "basic_nack"]
+        callbacks = self._confirm_callbacks
+        for tag in tags:
+            unconfirmed.discard(tag)
+            callback = callbacks.pop(tag, None)
+            if callback is not None:
+                callback(tag, acked)
+            for callback in event:
+                callback(tag)
+
     _METHOD_MAP = {
         (20, 11): _open_ok,
         (20, 20): _flow,
@@ -2535,7 +2896,255 @@ class Channel(AbstractChannel):
         (90, 11): _tx_select_ok,
         (90, 21): _tx_commit_ok,
         (90, 31): _tx_rollback_ok,
+        (60, 80): _basic_ack,
+        (60, 120): _basic_nack,
         (85, 11): _confirm_select_ok,
         }
 
     _IMMEDIATE_METHODS = [(60, 50)]     # basic_return
+
+
+class AckAccumulator(object):
+    """Collects the acknowledgements of a channel, and sends them
+    using as few ``basic_ack`` methods as possible.
+
+    Created by :meth:`Channel.enable_ack_coalescing`.
+
+    The delivery tags of received messages that need to be acknowledged
+    are kept in :attr:`outstanding` until they're acknowledged (or
+    rejected), and the tags up to :attr:`highest` that the channel
+    hasn't seen yet (received before coalescing was enabled, or still
+    queued behind a method picked out of order) are kept in
+    :attr:`gaps`.  A ``basic_ack(multiple=True)`` can only cover the
+    pending acks below the lowest outstanding tag and the lowest gap,
+    the others are kept back and sent one by one if they can't be
+    coalesced by the time the accumulator is flushed.
+
+    """
+
+    def __init__(self, channel, max_count=DEFAULT_ACK_COUNT,
+            max_delay=DEFAULT_ACK_DELAY):
+        self.channel = channel
+        self.max_count = max_count
+        self.max_delay = max_delay
+        self.outstanding = set()
+        self.gaps = set()
+        self.highest = 0
+        self.pending = []
+        self.pending_since = None
+        self.acks_sent = 0
+        self._heap = []  # outstanding tags, with lazy removal
+
+    def delivered(self, delivery_tag, no_ack=False):
+        """A message was passed to the application, its tag needs to
+        be acknowledged unless it was consumed with ``no_ack``."""
+        if delivery_tag > self.highest:
+            self.gaps.update(xrange(self.highest + 1, delivery_tag))
+            self.highest = delivery_tag
+        else:
+            self.gaps.discard(delivery_tag)
+        if no_ack:
+            return
+        self.outstanding.add(delivery_tag)
+        heappush(self._heap, delivery_tag)
+        if len(self._heap) > 2 * len(self.outstanding):
+            # Settled tags are only popped once they reach the top,
+            # which never happens while an old message stays unacked.
+            self._heap = list(self.outstanding)
+            heapify(self._heap)
+
+    def settled(self, delivery_tag):
+        """The message was rejected, so stop waiting for its ack."""
+        self.outstanding.discard(delivery_tag)
+        self.gaps.discard(delivery_tag)
+
+    def reset(self):
+        self.outstanding.clear()
+        self.gaps.clear()
+        self._heap = []
+
+    def lowest_outstanding(self):
+        heap, outstanding = self._heap, self.outstanding
+        while heap and heap[0] not in outstanding:
+            heappop(heap)
+        return heap[0] if heap else None
+
+    def ack(self, delivery_tag, multiple=False):
+        if multiple:
+            # Already covers everything acked before it, so send it
+            # right away along with the acks it doesn't cover.
+            covers = lambda tag: not delivery_tag or tag <= delivery_tag
+            self.outstanding.difference_update(
+                [tag for tag in self.outstanding if covers(tag)])
+            self.gaps.difference_update(
+                [tag for tag in self.gaps if covers(tag)])
+            self.pending = [tag for tag in self.pending if not covers(tag)]
+            self.channel._send_method((60, 80),
+                self.channel._basic_ack_args(delivery_tag, True))
+            self.acks_sent += 1
+            if not self.pending:
+                self._sent()
+            return
+
+        self.outstanding.discard(delivery_tag)
+        self.gaps.discard(delivery_tag)
+        self.pending.append(delivery_tag)
+        if self.pending_since is None:
+            self.pending_since = time()
+            self.channel.connection._pending_ack_channels.add(self.channel)
+        if time() - self.pending_since >= self.max_delay:
+            self.flush()
+        elif len(self.pending) >= self.max_count:
+            self.flush(partial=True)
+
+    def tick(self):
+        """Send the pending acks if the oldest has been kept back for
+        ``max_delay`` seconds."""
+        if self.pending_since is not None and \
+                time() - self.pending_since >= self.max_delay:
+            self.flush()
+
+    def flush(self, partial=False):
+        """Send the pending acks.
+
+        If ``partial`` is set, out of order acks that can't be
+        covered by a multiple ack yet are kept back, unless there
+        are ``max_count`` of them.
+
+        """
+        if not self.pending:
+            return
+        # Only tags the channel has seen settled can be covered.
+        limit = self.highest + 1
+        lowest = self.lowest_outstanding()
+        if lowest is not None:
+            limit = min(limit, lowest)
+        if self.gaps:
+            limit = min(limit, min(self.gaps))
+        covered = [tag for tag in self.pending if tag < limit]
+        rest = [tag for tag in self.pending if tag >= limit]
+        if partial and len(rest) < self.max_count:
+            if not covered:
+                return
+            self.pending = rest
+        else:
+            self.pending = []
+
+        ack_args = self.channel._basic_ack_args
+        methods = []
+        if len(covered) == 1:
+            methods.append(ack_args(covered[0]))
+        elif covered:
+            methods.append(ack_args(max(covered), True))
+        if not self.pending:
+            methods.extend(ack_args(tag) for tag in rest)
+            self._sent()
+        self.channel._send_methods([((60, 80), args, None)
+                                        for args in methods])
+        self.acks_sent += len(methods)
+
+    def _sent(self):
+        self.pending_since = None
+        self.channel.connection._pending_ack_channels.discard(self.channel)
+
+class Pipeline(object):
+    """Send a batch of synchronous methods back-to-back, and then
+    collect the replies in order.
+
+    The supported methods have the same signature as the corresponding
+    :class:`Channel` methods, but only record the method.  Nothing is
+    sent until :meth:`execute` is called, which writes all the methods
+    using a single write and then waits for the replies.
+
+    *Example*:
+
+    .. code-block:: python
+
+        p = channel.pipeline()
+        p.exchange_declare('logs', 'topic')
+        p.queue_declare('logs.errors', auto_delete=False)
+        p.queue_bind('logs.errors', 'logs', routing_key='*.error')
+        _, (queue, message_count, consumer_count), _ = p.execute()
+
+    When used as a context manager, the methods are executed
+    on exit and the replies stored in :attr:`results`.
+
+    If the server responds to a method with a channel exception, then
+    the :exc:`AMQPChannelError` is raised from :meth:`execute`, with a
+    ``pipeline_call`` attribute set to the ``(method_name, args,
+    kwargs)`` of the method that caused it.  Since the server closes
+    the channel, the replies to the remaining methods are lost.
+
+    """
+
+    #: Channel methods that can be added to a pipeline.
+    METHODS = frozenset(["exchange_declare", "exchange_delete",
+                         "queue_declare", "queue_bind", "queue_unbind",
+                         "queue_purge", "queue_delete", "basic_qos"])
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.methods = []
+        self.calls = []
+        self.results = None
+        self._current = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if type is None:
+            self.execute()
+
+    def __getattr__(self, name):
+        if name not in self.METHODS:
+            raise AttributeError(name)
+
+        def record(*args, **kwargs):
+            self._record(name, args, kwargs)
+        record.__name__ = name
+        return record
+
+    def __len__(self):
+        return len(self.calls)
+
+    def _record(self, name, args, kwargs):
+        channel = self.channel
+        self._current = [(name, args, kwargs), None, None]
+        channel._pipeline = self
+        try:
+            # the return value is only used if nothing was sent,
+            # e.g. if the declaration was cached.
+            self._current[2] = getattr(channel, name)(*args, **kwargs)
+        finally:
+            channel._pipeline = None
+        self.calls.append(self._current)
+
+    def _add_method(self, method_sig, args, content):
+        if isinstance(args, AMQPWriter):
+            args = args.getvalue()
+        self.methods.append((method_sig, args, content))
+
+    def _add_reply(self, allowed_methods):
+        # the reply we'll have to wait for in execute()
+        self._current[1] = allowed_methods
+
+    def execute(self):
+        """Send the recorded methods, and return a list with the
+        replies of each method in order (None for ``nowait`` methods)."""
+        methods, calls = self.methods, self.calls
+        self.methods, self.calls = [], []
+        channel = self.channel
+        channel._send_methods(methods)
+        results = []
+        for call, allowed_methods, result in calls:
+            if allowed_methods is None:
+                results.append(result)
+                continue
+            try:
+                results.append(channel.wait(allowed_methods=allowed_methods))
+            except AMQPChannelError, exc:
+                exc.pipeline_call = call
+                raise
+        self.results = results
+        return results
@@ -18,6 +18,8 @@ from __future__ import absolute_import
 
 import logging
 import socket
+from heapq import heappop, heappush
+from time import time
 try:
     from ssl import SSLError
 except ImportError:
@@ -29,9 +31,12 @@ from .. import __version__
 from .abstract_channel import AbstractChannel
 from .channel import Channel
 from .exceptions import AMQPConnectionError
+from .failover import BrokerList
 from .heartbeats import Heartbeat
-from .method_framing import MethodReader, MethodWriter
+from .method_framing import HeaderCache, MethodReader, MethodWriter
+from .pool import ChannelPool
 from .serialization import AMQPWriter
+from .topology import DeclarationCache
 from .transport import create_transport
 
 __all__ = ["Connection"]
@@ -47,6 +52,11 @@ AMQP_LOGGER = logging.getLogger('amqplib')
 DEFAULT_CHANNEL_MAX = 0xffff
 DEFAULT_FRAME_MAX = 2 ** 17
 
+#: Reply codes of a handshake refused because of the credentials or
+#: the virtual host (invalid path, access refused, not allowed).  Any
+#: other broker would refuse it too, so the others aren't tried.
+CONFIG_REPLY_CODES = frozenset([402, 403, 530])
+
 
 class Connection(AbstractChannel):
     """The connection class provides methods for a client to establish a
@@ -73,12 +83,22 @@ class Connection(AbstractChannel):
             login_method='AMQPLAIN', login_response=None, virtual_host='/',
             locale='en_US', client_properties=None, ssl=False, insist=False,
             connect_timeout=None, heartbeat=0, frame_max=DEFAULT_FRAME_MAX,
-            channel_max=DEFAULT_CHANNEL_MAX, heartbeat_checker=Heartbeat, **kwargs):
+            channel_max=DEFAULT_CHANNEL_MAX, heartbeat_checker=Heartbeat,
+            coalesce_writes=False, declaration_cache=False,
+            header_cache_size=0, **kwargs):
         """Create a connection to the specified host, which should be
         a 'host[:port]', such as 'localhost', or '1.2.3.4:5672'
         (defaults to 'localhost', if a port is not specified then
         5672 is used)
 
+        'host' may also be a list of such hosts, or a
+        :class:`~.failover.BrokerList`: the brokers are tried in turn,
+        fastest first, until a connection is made, and the one
+        connected to is stored in the 'host' attribute.  A redirect
+        is tried before the remaining brokers.  A handshake refused
+        because of the credentials or virtual host (see
+        :data:`CONFIG_REPLY_CODES`) is raised right away.
+
         If login_response is not specified, one is built up for you from
         userid and password if they are present.
 
@@ -86,6 +106,22 @@ class Connection(AbstractChannel):
         a dictionary of options to pass to ssl.wrap_socket() such as
         requiring certain certificates.
 
+        If 'coalesce_writes' is set, outgoing methods are buffered
+        and written together, either when the buffer is full, when
+        :meth:`flush` is called, or before blocking to wait for
+        a reply from the server.
+
+        If 'declaration_cache' is set, exchange, queue and binding
+        declarations are remembered, and repeating an identical
+        declaration returns the cached reply without contacting the
+        server, see :class:`~.topology.DeclarationCache`.  The message
+        and consumer counts of a cached queue_declare are returned
+        as 0, passive declarations are never cached.
+
+        If 'header_cache_size' is set, the serialized properties of
+        up to that many distinct property sets of published messages
+        are kept and reused, see :class:`~.method_framing.HeaderCache`.
+
         """
         if (login_response is None) and (userid is not None) \
                 and (password is not None):
@@ -101,15 +137,47 @@ class Connection(AbstractChannel):
         self.known_hosts = ''
         self.transport = None
 
+        if isinstance(host, BrokerList):
+            brokers = host
+        elif isinstance(host, (list, tuple)):
+            brokers = BrokerList(host)
+        else:
+            brokers = None
+        if brokers is None:
+            candidates = [host]
+        else:
+            candidates = brokers.candidates()
+            if not candidates:
+                raise socket.error(
+                    'All brokers failed too often lately: %s' % (
+                        ', '.join(brokers.hosts), ))
+
         while 1:
+            host = candidates.pop(0)
             self.channels = {}
+            # Channel ids released by closed channels, and the lowest
+            # id that was never handed out.
+            self._free_channel_ids = []
+            self._next_channel_id = 1
             # The connection object itself is treated as channel 0
             super(Connection, self).__init__(self, 0)
 
+            self.declaration_cache = (DeclarationCache()
+                                        if declaration_cache else None)
+            header_cache = (HeaderCache(header_cache_size)
+                                if header_cache_size else None)
+
+            # Channels with coalesced acks waiting to be sent.
+            self._pending_ack_channels = set()
+
             self._close_transport()
 
+            # Set once the connection is open, if heartbeats are used
+            self.heartbeat_checker = None
+
             # Properties set in the Tune method
             self.heartbeat = heartbeat or 0
+            self.server_heartbeat = 0
             self.frame_max = frame_max or DEFAULT_FRAME_MAX
             self.channel_max = channel_max or DEFAULT_CHANNEL_MAX
 
@@ -123,24 +191,48 @@ class Connection(AbstractChannel):
             # Let the transport.py module setup the actual
             # socket connection to the broker.
             #
-            self.transport = create_transport(host, connect_timeout, ssl)
-
-            self.method_reader = MethodReader(self.transport)
-            self.method_writer = MethodWriter(self.transport, self.frame_max)
-
-            self.wait(allowed_methods=[(10, 10)])  # start
-            self._x_start_ok(d, login_method, login_response, locale)
-
-            self._wait_tune_ok = True
-            while self._wait_tune_ok:
-                self.wait(allowed_methods=[(10, 20), (10, 30)])  # secure|tune
-
-            host = self._x_open(virtual_host, insist=insist)
-            if host is None:
+            started = time()
+            try:
+                self.transport = create_transport(host, connect_timeout, ssl)
+
+                self.method_reader = MethodReader(self.transport)
+                self.method_writer = MethodWriter(self.transport,
+                                                  self.frame_max,
+                                                  coalesce=coalesce_writes,
+                                                  header_cache=header_cache)
+
+                self.wait(allowed_methods=[(10, 10)])  # start
+                self._x_start_ok(d, login_method, login_response, locale)
+
+                self._wait_tune_ok = True
+                while self._wait_tune_ok:
+                    # secure|tune
+                    self.wait(allowed_methods=[(10, 20), (10, 30)])
+
+                redirect_host = self._x_open(virtual_host, insist=insist)
+            except (IOError, socket.error, AMQPConnectionError), exc:
+                if brokers is None or (
+                        isinstance(exc, AMQPConnectionError) and
+                        exc.amqp_reply_code in CONFIG_REPLY_CODES):
+                    raise
+                brokers.failed(host)
+                AMQP_LOGGER.debug('Failed to connect to [%s]: %r' % (
+                                    host, exc))
+                if not candidates:
+                    self._close_transport()
+                    raise
+                continue
+
+            if brokers is not None:
+                brokers.connected(host, time() - started)
+            if redirect_host is None:
                 # we weren't redirected
+                self.host = host
                 break
 
-            # we were redirected, close the socket, loop and try again
+            # we were redirected, close the socket, loop and try again,
+            # the other brokers are still there if the redirect fails
+            candidates.insert(0, redirect_host)
             try:
                 self.close()
             except Exception:
@@ -153,6 +245,11 @@ class Connection(AbstractChannel):
             self.transport.close()
             self.transport = None
 
+    def flush(self):
+        """Write any buffered outgoing methods to the server
+        (only used if ``coalesce_writes`` is enabled)."""
+        self.method_writer.flush()
+
     def drain_events(self, allowed_methods=None, timeout=None):
         """Wait for an event on any channel."""
         return self.wait_multi(self.channels.values(), timeout=timeout)
@@ -183,6 +280,28 @@ class Connection(AbstractChannel):
             return amqp_method(channel, args, content)
 
     def read_timeout(self, timeout=None):
+        checker = self.heartbeat_checker
+        if checker is None or timeout == 0:
+            return self._read_timeout(timeout)
+        # Wait in slices, so heartbeats get sent and a silent server
+        # is noticed while waiting for a method.  This relies on the
+        # transport keeping a partly received frame when a slice times
+        # out (see _AbstractTransport.read_frame).
+        deadline = None if timeout is None else time() + timeout
+        while 1:
+            checker.tick()
+            wait = checker.time_to_next()
+            if deadline is not None:
+                remaining = deadline - time()
+                if remaining <= 0:
+                    raise socket.timeout()
+                wait = min(wait, remaining)
+            try:
+                return self._read_timeout(max(wait, 0.001))
+            except socket.timeout:
+                pass
+
+    def _read_timeout(self, timeout=None):
         if timeout is None:
             return self.method_reader.read_method()
         sock = self.transport.sock
@@ -198,21 +317,37 @@ class Connection(AbstractChannel):
         finally:
             sock.settimeout(prev)
 
+    def heartbeat_tick(self):
+        """Send a heartbeat to the server if one is due, and raise
+        :exc:`AMQPConnectionError` if the server has been silent for
+        more than two heartbeat delays.  Coalesced acks kept back for
+        longer than their ``max_delay`` are sent too.  Called while
+        waiting in :meth:`drain_events` and friends, only needs calling
+        explicitly when the connection is left alone for a while."""
+        for channel in list(self._pending_ack_channels):
+            channel.ack_accumulator.tick()
+        if self.heartbeat_checker is not None:
+            self.heartbeat_checker.tick()
+
     def _wait(self, channel_ids, allowed_methods, timeout=None):
         channels = self.channels
 
+        # A channel.close is always acceptable.
+        queue_allowed = allowed_methods
+        if allowed_methods is not None:
+            queue_allowed = list(allowed_methods) + [(20, 40)]
         for channel_id in channel_ids:
-            method_queue = channels[channel_id].method_queue
-            for queued_method in method_queue:
-                method_sig = queued_method[0]
-                if (allowed_methods is None) \
-                        or (method_sig in allowed_methods) \
-                        or (method_sig == (20, 40)):
-                    method_queue.remove(queued_method)
-                    method_sig, args, content = queued_method
-                    return channel_id, method_sig, args, content
-
-        # Nothing queued, need to wait for a method from the peer
+            queued_method = channels[channel_id].method_queue.get(
+                queue_allowed)
+            if queued_method is not None:
+                method_sig, args, content = queued_method
+                return channel_id, method_sig, args, content
+
+        # Nothing queued, need to wait for a method from the peer,
+        # so first make sure the peer has everything we sent.
+        for channel in list(self._pending_ack_channels):
+            channel.flush_acks()
+        self.method_writer.flush()
         read_timeout = self.read_timeout
         wait = self.wait
         while 1:
@@ -246,18 +381,35 @@ class Connection(AbstractChannel):
         self.connection = self.channels = None
 
     def _get_free_channel_id(self):
-        for i in xrange(1, self.channel_max + 1):
-            if i not in self.channels:
-                return i
+        channels = self.channels
+        free = self._free_channel_ids
+        # Ids of closed channels first (lowest first), skipping any
+        # that were taken again by asking for a specific channel_id.
+        while free:
+            channel_id = heappop(free)
+            if channel_id not in channels and \
+                    channel_id <= self.channel_max:
+                return channel_id
+        channel_id = self._next_channel_id
+        while channel_id in channels:
+            channel_id += 1
+        if channel_id <= self.channel_max:
+            self._next_channel_id = channel_id + 1
+            return channel_id
         raise ValueError(
                 "No free channel ids, current=%d, channel_max=%d" % (
                     len(self.channels), self.channel_max))
 
-    def _wait_method(self, channel_id, allowed_methods):
+    def _release_channel_id(self, channel_id):
+        if channel_id < self._next_channel_id:
+            heappush(self._free_channel_ids, channel_id)
+
+    def _wait_method(self, channel_id, allowed_methods, timeout=None):
         """Wait for a method from the server destined for
         a particular channel."""
         channel, method_sig, args, content = self._wait([channel_id],
-                                                        allowed_methods)
+                                                        allowed_methods,
+                                                        timeout=timeout)
         assert channel == channel_id
         return method_sig, args, content
 
@@ -269,6 +421,11 @@ class Connection(AbstractChannel):
         except KeyError:
             return self.Channel(self, channel_id)
 
+    def channel_pool(self, max_size=None):
+        """Create a :class:`ChannelPool` handing out open channels
+        of this connection, at most ``max_size`` at a time."""
+        return ChannelPool(self, max_size)
+
     def close(self, reply_code=0, reply_text='', method_sig=(0, 0)):
         """Request a connection close.
 
@@ -394,6 +551,8 @@ class Connection(AbstractChannel):
         class_id = args.read_short()
         method_id = args.read_short()
 
+        if self.declaration_cache is not None:
+            self.declaration_cache.clear()
         self._x_close_ok()
         raise AMQPConnectionError(reply_code,
                                       reply_text,
@@ -413,6 +572,7 @@ class Connection(AbstractChannel):
 
         """
         self._send_method((10, 61))
+        self.method_writer.flush()
         self._do_close()
 
     def _close_ok(self, args):
@@ -769,7 +929,7 @@ class Connection(AbstractChannel):
         self.channel_max = args.read_short() or self.channel_max
         self.frame_max = args.read_long() or self.frame_max
         self.method_writer.frame_max = self.frame_max
-        #_heartbeat = args.read_short()
+        self.server_heartbeat = args.read_short()
 
         self._x_tune_ok(self.channel_max, self.frame_max, self.heartbeat)
 
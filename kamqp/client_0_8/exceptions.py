@@ -17,7 +17,8 @@
 from __future__ import absolute_import
 
 __all__ = ["AMQPError", "AMQPConnectionError",
-            "AMQPChannelError", "AMQPInternalError"]
+            "AMQPChannelError", "AMQPInternalError",
+            "ChannelPoolExhausted"]
 
 
 class AMQPRecoverableError(Exception):
@@ -51,6 +52,14 @@ class AMQPChannelError(AMQPError):
     pass
 
 
+class AMQPInternalError(AMQPError):
+    pass
+
+
+class ChannelPoolExhausted(Exception):
+    """No channel could be acquired from a :class:`ChannelPool`."""
+
+
 METHOD_NAME_MAP = {
     (10, 10): 'Connection.start',
     (10, 11): 'Connection.start_ok',
@@ -99,6 +108,9 @@ METHOD_NAME_MAP = {
     (60, 80): 'Channel.basic_ack',
     (60, 90): 'Channel.basic_reject',
     (60, 100): 'Channel.basic_recover',
+    (60, 120): 'Channel.basic_nack',
+    (85, 10): 'Channel.confirm_select',
+    (85, 11): 'Channel.confirm_select_ok',
     (90, 10): 'Channel.tx_select',
     (90, 11): 'Channel.tx_select_ok',
     (90, 20): 'Channel.tx_commit',
@@ -0,0 +1,125 @@
+# Copyright (C) 2007-2008 Barry Pederson <bp@barryp.org>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+from __future__ import absolute_import
+
+from time import time
+
+__all__ = ["BrokerList"]
+
+#: Consecutive failures after which a broker isn't tried for a while.
+DEFAULT_FAILURE_THRESHOLD = 3
+
+#: Seconds a broker isn't tried for, once it failed too often.
+DEFAULT_RETRY_AFTER = 30.0
+
+
+class _Broker(object):
+
+    def __init__(self, host, index):
+        self.host = host
+        self.index = index
+        self.latency = None
+        self.connections = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+
+    def as_dict(self):
+        return {"latency": self.latency,
+                "connections": self.connections,
+                "failures": self.failures,
+                "consecutive_failures": self.consecutive_failures,
+                "available": self.open_until <= time()}
+
+
+class BrokerList(object):
+    """The brokers a :class:`Connection` may connect to, passed as its
+    ``host`` (a plain list of hosts works too, but then nothing is
+    remembered from one connection to the next)::
+
+        brokers = BrokerList(['rabbit1', 'rabbit2:5673', 'rabbit3'])
+        conn = Connection(host=brokers)
+
+    Brokers never connected to are tried first, in the order given, so
+    each of them gets measured, then the others in order of latency,
+    the time it took to connect to them and complete the handshake (a
+    moving average).  Brokers whose last connection attempt failed
+    come last.  A broker that failed ``failure_threshold`` times in a
+    row isn't tried again for ``retry_after`` seconds, and after that
+    only once until a connection to it succeeds.
+
+    """
+
+    def __init__(self, hosts, failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+                 retry_after=DEFAULT_RETRY_AFTER, smoothing=0.3):
+        if not hosts:
+            raise ValueError('No brokers')
+        self.brokers = {}
+        for host in hosts:
+            self.brokers.setdefault(host, _Broker(host, len(self.brokers)))
+        self.failure_threshold = failure_threshold
+        self.retry_after = retry_after
+        self.smoothing = smoothing
+
+    def __len__(self):
+        return len(self.brokers)
+
+    @property
+    def hosts(self):
+        return [broker.host for broker in
+                    sorted(self.brokers.values(),
+                           key=lambda broker: broker.index)]
+
+    def candidates(self):
+        """The hosts to try, best first, leaving out those that failed
+        too often lately."""
+        now = time()
+        available = [broker for broker in self.brokers.values()
+                        if broker.open_until <= now]
+        available.sort(key=lambda broker: (broker.consecutive_failures,
+                                           broker.latency is not None,
+                                           broker.latency, broker.index))
+        return [broker.host for broker in available]
+
+    def connected(self, host, elapsed):
+        """Record a successful connection, made in ``elapsed``
+        seconds."""
+        broker = self.brokers.get(host)
+        if broker is None:
+            # e.g. redirected to a host that isn't in the list
+            return
+        if broker.latency is None:
+            broker.latency = elapsed
+        else:
+            broker.latency += self.smoothing * (elapsed - broker.latency)
+        broker.connections += 1
+        broker.consecutive_failures = 0
+        broker.open_until = 0.0
+
+    def failed(self, host):
+        """Record a failed connection attempt."""
+        broker = self.brokers.get(host)
+        if broker is None:
+            return
+        broker.failures += 1
+        broker.consecutive_failures += 1
+        if broker.consecutive_failures >= self.failure_threshold:
+            broker.open_until = time() + self.retry_after
+
+    @property
+    def stats(self):
+        return dict((host, broker.as_dict())
+                        for host, broker in self.brokers.items())
@@ -0,0 +1,77 @@
+# Copyright (C) 2007-2008 Barry Pederson <bp@barryp.org>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+from __future__ import absolute_import
+
+from time import time
+
+from .exceptions import AMQPConnectionError
+
+__all__ = ["Heartbeat"]
+
+
+class Heartbeat(object):
+    """Sends heartbeats, and notices a dead peer, for a connection
+    that negotiated a heartbeat delay.
+
+    There's no thread involved: :meth:`tick` is called by the
+    :class:`Connection` while it waits for the server (the wait is cut
+    into slices no longer than :meth:`time_to_next`), and by a
+    :class:`Hub` the connection is registered with.
+
+    A heartbeat frame is sent when nothing was written for
+    ``heartbeat`` seconds, and the peer is considered dead when nothing
+    at all was received from it for twice that long.
+
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.interval = connection.heartbeat
+        self.heartbeats_sent = 0
+        self._last_sent = connection.method_writer.bytes_sent
+        self._last_recv = connection.method_reader.bytes_recv
+        self.last_send_time = self.last_recv_time = time()
+
+    def tick(self):
+        """Send a heartbeat if it's time to, and raise
+        :exc:`AMQPConnectionError` (after closing the connection) if
+        the peer has been silent too long."""
+        connection = self.connection
+        writer, reader = connection.method_writer, connection.method_reader
+        now = time()
+
+        if writer.bytes_sent != self._last_sent:
+            self._last_sent = writer.bytes_sent
+            self.last_send_time = now
+        elif now - self.last_send_time >= self.interval:
+            writer.send_heartbeat()
+            self.heartbeats_sent += 1
+            self.last_send_time = now
+
+        if reader.bytes_recv != self._last_recv:
+            self._last_recv = reader.bytes_recv
+            self.last_recv_time = now
+        elif now - self.last_recv_time > 2 * self.interval:
+            connection._do_close()
+            raise AMQPConnectionError(0,
+                'No heartbeat from the server for %.1f seconds' % (
+                    now - self.last_recv_time), (0, 0))
+
+    def time_to_next(self):
+        """Seconds until :meth:`tick` may have something to do."""
+        now = time()
+        return max(0, min(self.last_send_time + self.interval,
+                          self.last_recv_time + 2 * self.interval) - now)
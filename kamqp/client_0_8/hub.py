@@ -0,0 +1,304 @@
+# Copyright (C) 2007-2008 Barry Pederson <bp@barryp.org>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+from __future__ import absolute_import
+
+import errno
+import select
+import socket
+
+from heapq import heappop, heappush
+from itertools import count
+from time import time
+
+try:
+    from ssl import SSLError, SSL_ERROR_WANT_READ
+except ImportError:
+    class SSLError(Exception):  # noqa
+        pass
+    SSL_ERROR_WANT_READ = None
+
+from .exceptions import AMQPChannelError
+
+__all__ = ["Hub", "Timer"]
+
+
+def _would_block(exc):
+    """Did a read with a zero timeout fail only because there
+    was no complete method to read yet?"""
+    if isinstance(exc, socket.timeout):
+        return True
+    if isinstance(exc, SSLError):
+        return exc.args and exc.args[0] == SSL_ERROR_WANT_READ
+    if isinstance(exc, socket.error):
+        return exc.args and exc.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK)
+    return False
+
+
+class _EPoller(object):
+
+    def __init__(self):
+        self._epoll = select.epoll()
+
+    def register(self, fd):
+        self._epoll.register(fd, select.EPOLLIN)
+
+    def unregister(self, fd):
+        self._epoll.unregister(fd)
+
+    def poll(self, timeout):
+        return [fd for fd, events in self._epoll.poll(
+                    -1 if timeout is None else timeout)]
+
+
+class _Poller(object):
+
+    def __init__(self):
+        self._poll = select.poll()
+
+    def register(self, fd):
+        self._poll.register(fd, select.POLLIN)
+
+    def unregister(self, fd):
+        self._poll.unregister(fd)
+
+    def poll(self, timeout):
+        return [fd for fd, events in self._poll.poll(
+                    None if timeout is None else timeout * 1000)]
+
+
+class _Selector(object):
+
+    def __init__(self):
+        self._fds = set()
+
+    def register(self, fd):
+        self._fds.add(fd)
+
+    def unregister(self, fd):
+        self._fds.discard(fd)
+
+    def poll(self, timeout):
+        return select.select(list(self._fds), [], [], timeout)[0]
+
+
+def _create_poller():
+    if hasattr(select, 'epoll'):
+        return _EPoller()
+    if hasattr(select, 'poll'):
+        return _Poller()
+    return _Selector()
+
+
+class Timer(object):
+    """A call scheduled on a :class:`Hub`, see :meth:`Hub.call_later`
+    and :meth:`Hub.call_repeatedly`."""
+
+    def __init__(self, deadline, interval, callback, args):
+        self.deadline = deadline
+        self.interval = interval
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class Hub(object):
+    """Services many :class:`Connection` objects from a single thread.
+
+    The sockets of all the registered connections are waited on
+    together (with epoll, poll or select, whichever is available), and
+    the methods received on a connection are dispatched to its channels
+    the same way :meth:`Connection.drain_events` does, so consumer
+    callbacks get called.  Timers can be scheduled on the hub, and are
+    used to check the heartbeats of connections that asked for them
+    (see :meth:`Connection.heartbeat_tick`)::
+
+        hub = Hub()
+        for conn in connections:
+            hub.register(conn)
+        hub.run()
+
+    Other file descriptors can be watched with :meth:`add_reader`.
+    Methods written on a connection with ``coalesce_writes`` are
+    flushed before the hub waits.
+
+    An exception raised while dispatching a method is passed to
+    ``on_error(connection, exc)`` if set, otherwise it's raised from
+    :meth:`run_once`.  Connections that were closed are unregistered.
+
+    """
+
+    def __init__(self, on_error=None):
+        self.on_error = on_error
+        self.connections = {}  # fd -> Connection
+        self.readers = {}  # fd -> (callback, args)
+        self.timers = []
+        self.poller = _create_poller()
+        self._running = False
+        self._timer_ids = count()
+        self._heartbeats = {}
+
+    def __len__(self):
+        return len(self.connections)
+
+    def register(self, connection):
+        fd = connection.transport.sock.fileno()
+        self.connections[fd] = connection
+        self.poller.register(fd)
+        if connection.heartbeat:
+            self._heartbeats[connection] = self.call_repeatedly(
+                connection.heartbeat / 2.0, self._heartbeat_tick, connection)
+
+    def unregister(self, connection):
+        for fd, conn in self.connections.items():
+            if conn is connection:
+                del self.connections[fd]
+                self.poller.unregister(fd)
+        timer = self._heartbeats.pop(connection, None)
+        if timer is not None:
+            timer.cancel()
+
+    def add_reader(self, fd, callback, *args):
+        """Call ``callback(*args)`` whenever ``fd`` is readable."""
+        self.readers[fd] = (callback, args)
+        self.poller.register(fd)
+
+    def remove_reader(self, fd):
+        if self.readers.pop(fd, None) is not None:
+            self.poller.unregister(fd)
+
+    def call_later(self, delay, callback, *args):
+        """Call ``callback(*args)`` in ``delay`` seconds."""
+        return self._schedule(Timer(time() + delay, None, callback, args))
+
+    def call_repeatedly(self, interval, callback, *args):
+        """Call ``callback(*args)`` every ``interval`` seconds."""
+        return self._schedule(Timer(time() + interval, interval,
+                                    callback, args))
+
+    def _schedule(self, timer):
+        heappush(self.timers, (timer.deadline, next(self._timer_ids), timer))
+        return timer
+
+    def _run_timers(self):
+        """Run the timers that are due, and return the number of
+        seconds until the next one (None if there's none)."""
+        timers = self.timers
+        now = time()
+        while timers:
+            deadline, _, timer = timers[0]
+            if timer.cancelled:
+                heappop(timers)
+                continue
+            if deadline > now:
+                return deadline - now
+            heappop(timers)
+            if timer.interval is not None:
+                timer.deadline = deadline + timer.interval
+                self._schedule(timer)
+            timer.callback(*timer.args)
+        return None
+
+    def _heartbeat_tick(self, connection):
+        try:
+            connection.heartbeat_tick()
+        except Exception, exc:
+            self.unregister(connection)
+            if self.on_error is None:
+                raise
+            self.on_error(connection, exc)
+
+    def _has_pending(self, connection):
+        """Are there methods already received, which the socket
+        becoming readable won't tell us about?"""
+        if connection.channels is None or connection.method_reader.queue:
+            return True
+        for channel in connection.channels.values():
+            if channel.method_queue:
+                return True
+        return False
+
+    def _drain(self, connection):
+        """Dispatch every method that can be read from the connection
+        without blocking, return how many there were."""
+        dispatched = 0
+        while 1:
+            try:
+                connection.drain_events(timeout=0)
+            except Exception, exc:
+                if _would_block(exc):
+                    return dispatched
+                if connection.channels is None or \
+                        not isinstance(exc, AMQPChannelError):
+                    # the connection is gone
+                    self.unregister(connection)
+                if self.on_error is None:
+                    raise
+                self.on_error(connection, exc)
+                return dispatched
+            dispatched += 1
+            if connection.channels is None:
+                # closed by a callback
+                self.unregister(connection)
+                return dispatched
+
+    def _flush(self, connection):
+        try:
+            connection.flush()
+        except Exception, exc:
+            self.unregister(connection)
+            if self.on_error is None:
+                raise
+            self.on_error(connection, exc)
+
+    def run_once(self, timeout=None):
+        """Run the timers that are due, and dispatch the methods
+        received on any connection, waiting at most ``timeout`` seconds
+        for one (forever if None).  Returns the number of methods
+        dispatched."""
+        delay = self._run_timers()
+        dispatched = 0
+        for connection in self.connections.values():
+            if self._has_pending(connection):
+                dispatched += self._drain(connection)
+        if dispatched:
+            return dispatched
+
+        for connection in self.connections.values():
+            self._flush(connection)
+        if delay is None or (timeout is not None and timeout < delay):
+            delay = timeout
+        for fd in self.poller.poll(delay):
+            connection = self.connections.get(fd)
+            if connection is not None:
+                dispatched += self._drain(connection)
+            elif fd in self.readers:
+                callback, args = self.readers[fd]
+                callback(*args)
+        return dispatched
+
+    def run(self):
+        """Keep servicing the connections until :meth:`stop` is called,
+        or there are no more connections, readers or timers."""
+        self._running = True
+        while self._running and \
+                (self.connections or self.readers or self.timers):
+            self.run_once()
+
+    def stop(self):
+        self._running = False
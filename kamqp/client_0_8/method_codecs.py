@@ -0,0 +1,544 @@
+# Copyright (C) 2007-2008 Barry Pederson <bp@barryp.org>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+# Generated from the AMQP spec by extras/generate_skeleton_0_8.py --codecs,
+# don't edit.
+"""
+Encoders and decoders of AMQP method arguments.
+
+``encode_<class>_<method>()`` takes the arguments of a method the
+client sends and returns them encoded, ``decode_<class>_<method>()``
+takes the payload of a method frame the client receives and the offset
+of the arguments in it, and returns the decoded arguments as a tuple.
+Consecutive fixed size arguments, bits and string lengths are packed
+and unpacked with a single :class:`struct.Struct`.
+
+"""
+from __future__ import absolute_import
+
+from struct import Struct
+
+from .serialization import AMQPReader, AMQPWriter
+
+try:
+    bytes
+except NameError:
+    # Python 2.5 and lower
+    bytes = str
+
+_EMPTY = bytes()
+
+
+def _shortstr(s):
+    if isinstance(s, unicode):
+        s = s.encode('utf-8')
+    if len(s) > 255:
+        raise ValueError('String too long (0..255)')
+    return s
+
+
+def _longstr(s):
+    if isinstance(s, unicode):
+        s = s.encode('utf-8')
+    return s
+
+
+def _encode(amqp_type, value):
+    w = AMQPWriter()
+    getattr(w, 'write_' + amqp_type)(value)
+    return w.getvalue()
+
+
+_s_B = Struct('>B')
+_s_BB = Struct('>BB')
+_s_H = Struct('>H')
+_s_HB = Struct('>HB')
+_s_HH = Struct('>HH')
+_s_HIH = Struct('>HIH')
+_s_I = Struct('>I')
+_s_IHB = Struct('>IHB')
+_s_II = Struct('>II')
+_s_QB = Struct('>QB')
+_s_QBB = Struct('>QBB')
+
+
+def decode_connection_start(buf, offset=0):
+    version_major, version_minor = _s_BB.unpack_from(buf, offset)
+    offset += 2
+    r = AMQPReader(buf, offset)
+    server_properties = r.read_table()
+    offset = r.offset
+    n, = _s_I.unpack_from(buf, offset)
+    offset += 4
+    mechanisms = buf[offset:offset + n].decode('utf-8')
+    offset += n
+    n, = _s_I.unpack_from(buf, offset)
+    offset += 4
+    locales = buf[offset:offset + n].decode('utf-8')
+    return (version_major, version_minor, server_properties, mechanisms,
+            locales)
+
+
+def encode_connection_start_ok(client_properties, mechanism, response, locale):
+    mechanism = _shortstr(mechanism)
+    response = _longstr(response)
+    locale = _shortstr(locale)
+    return _EMPTY.join([
+        _encode('table', client_properties),
+        _s_B.pack(len(mechanism)),
+        mechanism,
+        _s_I.pack(len(response)),
+        response,
+        _s_B.pack(len(locale)),
+        locale,
+        ])
+
+
+def decode_connection_secure(buf, offset=0):
+    n, = _s_I.unpack_from(buf, offset)
+    offset += 4
+    challenge = buf[offset:offset + n].decode('utf-8')
+    return (challenge,)
+
+
+def encode_connection_secure_ok(response):
+    response = _longstr(response)
+    return _EMPTY.join([
+        _s_I.pack(len(response)),
+        response,
+        ])
+
+
+def decode_connection_tune(buf, offset=0):
+    channel_max, frame_max, heartbeat = _s_HIH.unpack_from(buf, offset)
+    return (channel_max, frame_max, heartbeat)
+
+
+def encode_connection_tune_ok(channel_max, frame_max, heartbeat):
+    return _s_HIH.pack(channel_max, frame_max, heartbeat)
+
+
+def encode_connection_open(virtual_host, capabilities, insist):
+    virtual_host = _shortstr(virtual_host)
+    capabilities = _shortstr(capabilities)
+    return _EMPTY.join([
+        _s_B.pack(len(virtual_host)),
+        virtual_host,
+        _s_B.pack(len(capabilities)),
+        capabilities,
+        _s_B.pack(bool(insist)),
+        ])
+
+
+def decode_connection_open_ok(buf, offset=0):
+    n, = _s_B.unpack_from(buf, offset)
+    offset += 1
+    known_hosts = buf[offset:offset + n].decode('utf-8')
+    return (known_hosts,)
+
+
+def decode_connection_redirect(buf, offset=0):
+    n, = _s_B.unpack_from(buf, offset)
+    offset += 1
+    host = buf[offset:offset + n].decode('utf-8')
+    offset += n
+    n, = _s_B.unpack_from(buf, offset)
+    offset += 1
+    known_hosts = buf[offset:offset + n].decode('utf-8')
+    return (host, known_hosts)
+
+
+def encode_connection_close(reply_code, reply_text, class_id, method_id):
+    reply_text = _shortstr(reply_text)
+    return _EMPTY.join([
+        _s_HB.pack(reply_code, len(reply_text)),
+        reply_text,
+        _s_HH.pack(class_id, method_id),
+        ])
+
+
+def decode_connection_close(buf, offset=0):
+    reply_code, n = _s_HB.unpack_from(buf, offset)
+    offset += 3
+    reply_text = buf[offset:offset + n].decode('utf-8')
+    offset += n
+    class_id, method_id = _s_HH.unpack_from(buf, offset)
+    return (reply_code, reply_text, class_id, method_id)
+
+
+def encode_connection_close_ok():
+    return _EMPTY
+
+
+def decode_connection_close_ok(buf, offset=0):
+    return ()
+
+
+def encode_channel_open(out_of_band):
+    out_of_band = _shortstr(out_of_band)
+    return _EMPTY.join([
+        _s_B.pack(len(out_of_band)),
+        out_of_band,
+        ])
+
+
+def decode_channel_open_ok(buf, offset=0):
+    return ()
+
+
+def encode_channel_flow(active):
+    return _s_B.pack(bool(active))
+
+
+def decode_channel_flow(buf, offset=0):
+    bits, = _s_B.unpack_from(buf, offset)
+    active = bool(bits & 1)
+    return (active,)
+
+
+def encode_channel_flow_ok(active):
+    return _s_B.pack(bool(active))
+
+
+def decode_channel_flow_ok(buf, offset=0):
+    bits, = _s_B.unpack_from(buf, offset)
+    active = bool(bits & 1)
+    return (active,)
+
+
+def decode_channel_alert(buf, offset=0):
+    reply_code, n = _s_HB.unpack_from(buf, offset)
+    offset += 3
+    reply_text = buf[offset:offset + n].decode('utf-8')
+    offset += n
+    r = AMQPReader(buf, offset)
+    details = r.read_table()
+    return (reply_code, reply_text, details)
+
+
+def encode_channel_close(reply_code, reply_text, class_id, method_id):
+    reply_text = _shortstr(reply_text)
+    return _EMPTY.join([
+        _s_HB.pack(reply_code, len(reply_text)),
+        reply_text,
+        _s_HH.pack(class_id, method_id),
+        ])
+
+
+def decode_channel_close(buf, offset=0):
+    reply_code, n = _s_HB.unpack_from(buf, offset)
+    offset += 3
+    reply_text = buf[offset:offset + n].decode('utf-8')
+    offset += n
+    class_id, method_id = _s_HH.unpack_from(buf, offset)
+    return (reply_code, reply_text, class_id, method_id)
+
+
+def encode_channel_close_ok():
+    return _EMPTY
+
+
+def decode_channel_close_ok(buf, offset=0):
+    return ()
+
+
+def encode_access_request(realm, exclusive, passive, active, write, read):
+    realm = _shortstr(realm)
+    return _EMPTY.join([
+        _s_B.pack(len(realm)),
+        realm,
+        _s_B.pack(bool(exclusive) | bool(passive) << 1 | bool(active) << 2 |
+                  bool(write) << 3 | bool(read) << 4),
+        ])
+
+
+def decode_access_request_ok(buf, offset=0):
+    ticket, = _s_H.unpack_from(buf, offset)
+    return (ticket,)
+
+
+def encode_exchange_declare(ticket, exchange, type, passive, durable,
+                            auto_delete, internal, nowait, arguments):
+    exchange = _shortstr(exchange)
+    type = _shortstr(type)
+    return _EMPTY.join([
+        _s_HB.pack(ticket, len(exchange)),
+        exchange,
+        _s_B.pack(len(type)),
+        type,
+        _s_B.pack(bool(passive) | bool(durable) << 1 | bool(auto_delete) << 2 |
+                  bool(internal) << 3 | bool(nowait) << 4),
+        _encode('table', arguments),
+        ])
+
+
+def decode_exchange_declare_ok(buf, offset=0):
+    return ()
+
+
+def encode_exchange_delete(ticket, exchange, if_unused, nowait):
+    exchange = _shortstr(exchange)
+    return _EMPTY.join([
+        _s_HB.pack(ticket, len(exchange)),
+        exchange,
+        _s_B.pack(bool(if_unused) | bool(nowait) << 1),
+        ])
+
+
+def decode_exchange_delete_ok(buf, offset=0):
+    return ()
+
+
+def encode_queue_declare(ticket, queue, passive, durable, exclusive,
+                         auto_delete, nowait, arguments):
+    queue = _shortstr(queue)
+    return _EMPTY.join([
+        _s_HB.pack(ticket, len(queue)),
+        queue,
+        _s_B.pack(bool(passive) | bool(durable) << 1 | bool(exclusive) << 2 |
+                  bool(auto_delete) << 3 | bool(nowait) << 4),
+        _encode('table', arguments),
+        ])
+
+
+def decode_queue_declare_ok(buf, offset=0):
+    n, = _s_B.unpack_from(buf, offset)
+    offset += 1
+    queue = buf[offset:offset + n].decode('utf-8')
+    offset += n
+    message_count, consumer_count = _s_II.unpack_from(buf, offset)
+    return (queue, message_count, consumer_count)
+
+
+def encode_queue_bind(ticket, queue, exchange, routing_key, nowait, arguments):
+    queue = _shortstr(queue)
+    exchange = _shortstr(exchange)
+    routing_key = _shortstr(routing_key)
+    return _EMPTY.join([
+        _s_HB.pack(ticket, len(queue)),
+        queue,
+        _s_B.pack(len(exchange)),
+        exchange,
+        _s_B.pack(len(routing_key)),
+        routing_key,
+        _s_B.pack(bool(nowait)),
+        _encode('table', arguments),
+        ])
+
+
+def decode_queue_bind_ok(buf, offset=0):
+    return ()
+
+
+def encode_queue_purge(ticket, queue, nowait):
+    queue = _shortstr(queue)
+    return _EMPTY.join([
+        _s_HB.pack(ticket, len(queue)),
+        queue,
+        _s_B.pack(bool(nowait)),
+        ])
+
+
+def decode_queue_purge_ok(buf, offset=0):
+    message_count, = _s_I.unpack_from(buf, offset)
+    return (message_count,)
+
+
+def encode_queue_delete(ticket, queue, if_unused, if_empty, nowait):
+    queue = _shortstr(queue)
+    return _EMPTY.join([
+        _s_HB.pack(ticket, len(queue)),
+        queue,
+        _s_B.pack(bool(if_unused) | bool(if_empty) << 1 | bool(nowait) << 2),
+        ])
+
+
+def decode_queue_delete_ok(buf, offset=0):
+    message_count, = _s_I.unpack_from(buf, offset)
+    return (message_count,)
+
+
+def encode_queue_unbind(ticket, queue, exchange, routing_key, arguments):
+    queue = _shortstr(queue)
+    exchange = _shortstr(exchange)
+    routing_key = _shortstr(routing_key)
+    return _EMPTY.join([
+        _s_HB.pack(ticket, len(queue)),
+        queue,
+        _s_B.pack(len(exchange)),
+        exchange,
+        _s_B.pack(len(routing_key)),
+        routing_key,
+        _encode('table', arguments),
+        ])
+
+
+def decode_queue_unbind_ok(buf, offset=0):
+    return ()
+
+
+def encode_basic_qos(prefetch_size, prefetch_count, a_global):
+    return _s_IHB.pack(prefetch_size, prefetch_count, bool(a_global))
+
+
+def decode_basic_qos_ok(buf, offset=0):
+    return ()
+
+
+def encode_basic_consume(ticket, queue, consumer_tag, no_local, no_ack,
+                         exclusive, nowait):
+    queue = _shortstr(queue)
+    consumer_tag = _shortstr(consumer_tag)
+    return _EMPTY.join([
+        _s_HB.pack(ticket, len(queue)),
+        queue,
+        _s_B.pack(len(consumer_tag)),
+        consumer_tag,
+        _s_B.pack(bool(no_local) | bool(no_ack) << 1 | bool(exclusive) << 2 |
+                  bool(nowait) << 3),
+        ])
+
+
+def decode_basic_consume_ok(buf, offset=0):
+    n, = _s_B.unpack_from(buf, offset)
+    offset += 1
+    consumer_tag = buf[offset:offset + n].decode('utf-8')
+    return (consumer_tag,)
+
+
+def encode_basic_cancel(consumer_tag, nowait):
+    consumer_tag = _shortstr(consumer_tag)
+    return _EMPTY.join([
+        _s_B.pack(len(consumer_tag)),
+        consumer_tag,
+        _s_B.pack(bool(nowait)),
+        ])
+
+
+def decode_basic_cancel_ok(buf, offset=0):
+    n, = _s_B.unpack_from(buf, offset)
+    offset += 1
+    consumer_tag = buf[offset:offset + n].decode('utf-8')
+    return (consumer_tag,)
+
+
+def encode_basic_publish(ticket, exchange, routing_key, mandatory, immediate):
+    exchange = _shortstr(exchange)
+    routing_key = _shortstr(routing_key)
+    return _EMPTY.join([
+        _s_HB.pack(ticket, len(exchange)),
+        exchange,
+        _s_B.pack(len(routing_key)),
+        routing_key,
+        _s_B.pack(bool(mandatory) | bool(immediate) << 1),
+        ])
+
+
+def decode_basic_return(buf, offset=0):
+    reply_code, n = _s_HB.unpack_from(buf, offset)
+    offset += 3
+    reply_text = buf[offset:offset + n].decode('utf-8')
+    offset += n
+    n, = _s_B.unpack_from(buf, offset)
+    offset += 1
+    exchange = buf[offset:offset + n].decode('utf-8')
+    offset += n
+    n, = _s_B.unpack_from(buf, offset)
+    offset += 1
+    routing_key = buf[offset:offset + n].decode('utf-8')
+    return (reply_code, reply_text, exchange, routing_key)
+
+
+def decode_basic_deliver(buf, offset=0):
+    n, = _s_B.unpack_from(buf, offset)
+    offset += 1
+    consumer_tag = buf[offset:offset + n].decode('utf-8')
+    offset += n
+    delivery_tag, bits, n = _s_QBB.unpack_from(buf, offset)
+    offset += 10
+    redelivered = bool(bits & 1)
+    exchange = buf[offset:offset + n].decode('utf-8')
+    offset += n
+    n, = _s_B.unpack_from(buf, offset)
+    offset += 1
+    routing_key = buf[offset:offset + n].decode('utf-8')
+    return (consumer_tag, delivery_tag, redelivered, exchange, routing_key)
+
+
+def encode_basic_get(ticket, queue, no_ack):
+    queue = _shortstr(queue)
+    return _EMPTY.join([
+        _s_HB.pack(ticket, len(queue)),
+        queue,
+        _s_B.pack(bool(no_ack)),
+        ])
+
+
+def decode_basic_get_ok(buf, offset=0):
+    delivery_tag, bits, n = _s_QBB.unpack_from(buf, offset)
+    offset += 10
+    redelivered = bool(bits & 1)
+    exchange = buf[offset:offset + n].decode('utf-8')
+    offset += n
+    n, = _s_B.unpack_from(buf, offset)
+    offset += 1
+    routing_key = buf[offset:offset + n].decode('utf-8')
+    offset += n
+    message_count, = _s_I.unpack_from(buf, offset)
+    return (delivery_tag, redelivered, exchange, routing_key, message_count)
+
+
+def decode_basic_get_empty(buf, offset=0):
+    n, = _s_B.unpack_from(buf, offset)
+    offset += 1
+    cluster_id = buf[offset:offset + n].decode('utf-8')
+    return (cluster_id,)
+
+
+def encode_basic_ack(delivery_tag, multiple):
+    return _s_QB.pack(delivery_tag, bool(multiple))
+
+
+def encode_basic_reject(delivery_tag, requeue):
+    return _s_QB.pack(delivery_tag, bool(requeue))
+
+
+def encode_basic_recover(requeue):
+    return _s_B.pack(bool(requeue))
+
+
+def encode_tx_select():
+    return _EMPTY
+
+
+def decode_tx_select_ok(buf, offset=0):
+    return ()
+
+
+def encode_tx_commit():
+    return _EMPTY
+
+
+def decode_tx_commit_ok(buf, offset=0):
+    return ()
+
+
+def encode_tx_rollback():
+    return _EMPTY
+
+
+def decode_tx_rollback_ok(buf, offset=0):
+    return ()
@@ -15,8 +15,10 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
 from __future__ import absolute_import
 
+from datetime import datetime
+from decimal import Decimal
 from Queue import Queue
-from struct import pack, unpack
+from struct import Struct, pack
 from time import time
 
 try:
@@ -25,27 +27,43 @@ except NameError:
     # Python 2.5 and lower
     bytes = str
 
-from collections import defaultdict
+from collections import defaultdict, deque
 
 from .basic_message import Message
 from .exceptions import AMQPRecoverableError
 from .serialization import AMQPReader
 
-__all__ = ["MethodReader"]
+__all__ = ["HeaderCache", "MethodReader"]
 
 #: MethodReader needs to know which methods are supposed
 #: to be followed by content headers and bodies.
 _CONTENT_METHODS = [
+    (60, 40),   # Basic.publish (only sent by clients, for servers
+                # built on the Protocol class)
     (60, 50),   # Basic.return
     (60, 60),   # Basic.deliver
     (60, 71),   # Basic.get_ok
 ]
 
+#: Method frame: class and method id.  Content header frame:
+#: class id, weight and body size.
+_method_sig = Struct('>HH')
+_content_header = Struct('>HHQ')
+
 FRAME_METHOD = 1
 FRAME_HEADER = 2
 FRAME_BODY = 3
 FRAME_HEARTBEAT = 8
 
+#: Default thresholds for flushing the :class:`MethodWriter`
+#: outbound buffer when write coalescing is enabled.
+DEFAULT_MAX_PENDING_BYTES = 2 ** 16
+DEFAULT_MAX_PENDING_METHODS = 256
+
+#: Default number of serialized content properties a
+#: :class:`HeaderCache` keeps.
+DEFAULT_HEADER_CACHE_SIZE = 64
+
 
 class _PartialMessage(object):
     """Helper class to build up a multi-frame method."""
@@ -60,8 +78,9 @@ class _PartialMessage(object):
         self.complete = False
 
     def add_header(self, payload):
-        _, _, self.body_size = unpack('>HHQ', payload[:12])
-        self.msg._load_properties(payload[12:])
+        _, _, self.body_size = _content_header.unpack_from(payload)
+        # decoded when the properties are used
+        self.msg._load_properties(payload, 12, lazy=True)
         self.complete = (self.body_size == 0)
 
     def add_payload(self, payload):
@@ -86,11 +105,25 @@ class MethodReader(object):
     In the case of unexpected frames, a tuple made up of
     ``(channel, AMQPChannelError)`` is placed in the queue.
 
+    The queue is a plain :class:`collections.deque`, as methods are
+    normally queued and read by the same thread.  Set ``thread_safe``
+    to use a :class:`Queue.Queue` instead, if :meth:`read_method`
+    may be called from several threads.
+
     """
 
-    def __init__(self, source):
+    def __init__(self, source, thread_safe=False):
         self.source = source
-        self.queue = Queue()
+        if thread_safe:
+            self.queue = Queue()
+            self._put = self.queue.put
+            self._get = self.queue.get
+            self._empty = self.queue.empty
+        else:
+            self.queue = deque()
+            self._put = self.queue.append
+            self._get = self.queue.popleft
+            self._empty = lambda queue=self.queue: not queue
         self.running = False
         self.partial_messages = {}
         self.last_heartbeat = None
@@ -101,22 +134,34 @@ class MethodReader(object):
 
     def _next_method(self):
         """Read the next method from the source, once one complete method has
-        been assembled it is placed in the internal queue."""
-        while self.queue.empty():
+        been assembled it is placed in the internal queue.
+
+        Every frame the source has already received is processed, so
+        several methods may end up in the queue.
+
+        """
+        while self._empty():
             try:
-                frame_type, channel, payload = self.source.read_frame()
+                frames = self.source.read_frames()
             except Exception, e:
                 # Connection was closed?  Framing Error?
-                self.queue.put(e)
+                self._put(e)
                 break
 
-            self.bytes_recv += 1
-            if frame_type not in (self.expected_types[channel],
+            self._process_frames(frames)
+
+    def _process_frames(self, frames):
+        """Feed ``(frame_type, channel, payload)`` frames to the
+        method assembly, complete methods are put in the queue."""
+        self.bytes_recv += len(frames)
+        expected_types = self.expected_types
+        for frame_type, channel, payload in frames:
+            if frame_type not in (expected_types[channel],
                                   FRAME_HEARTBEAT):
-                self.queue.put((channel,
+                self._put((channel,
                     Exception(
                         "Received frame type %s while expecting type: %s" % (
-                            frame_type, self.expected_types[channel]))))
+                            frame_type, expected_types[channel]))))
             elif frame_type == FRAME_METHOD:
                 self._process_method_frame(channel, payload)
             elif frame_type == FRAME_HEADER:
@@ -127,21 +172,24 @@ class MethodReader(object):
                 self._process_heartbeat(channel, payload)
 
     def _process_heartbeat(self, channel, payload):
-        self.send_heartbeat()
+        # Nothing to answer, receiving it is all that matters, see
+        # heartbeats.Heartbeat.
+        self.last_heartbeat = time()
 
     def send_heartbeat(self):
-        self.source.write_frame(FRAME_HEARTBEAT, 0, '')
+        self.source.write_frame(FRAME_HEARTBEAT, 0, bytes())
 
     def _process_method_frame(self, channel, payload):
-        method_sig = unpack('>HH', payload[:4])
-        args = AMQPReader(payload[4:])
+        method_sig = _method_sig.unpack_from(payload)
+        # the arguments are read in place, after the method signature
+        args = AMQPReader(payload, 4)
 
         if method_sig in _CONTENT_METHODS:
             # Save what we've got so far and wait for the content-header
             self.partial_messages[channel] = _PartialMessage(method_sig, args)
             self.expected_types[channel] = 2
         else:
-            self.queue.put((channel, method_sig, args, None))
+            self._put((channel, method_sig, args, None))
 
     def _process_content_header(self, channel, payload):
         partial = self.partial_messages[channel]
@@ -149,7 +197,7 @@ class MethodReader(object):
 
         if partial.complete:
             # a bodyless message, we're done
-            self.queue.put((channel, partial.method_sig,
+            self._put((channel, partial.method_sig,
                             partial.args, partial.msg))
             self.partial_messages.pop(channel, None)
             self.expected_types[channel] = FRAME_METHOD
@@ -163,7 +211,7 @@ class MethodReader(object):
         if partial.complete:
             # Stick the message in the queue and go back to
             # waiting for method frames
-            self.queue.put((channel, partial.method_sig,
+            self._put((channel, partial.method_sig,
                             partial.args, partial.msg))
             self.partial_messages.pop(channel, None)
             self.expected_types[channel] = FRAME_METHOD
@@ -171,24 +219,143 @@ class MethodReader(object):
     def read_method(self):
         """Read a method from the peer."""
         self._next_method()
-        m = self.queue.get()
+        m = self._get()
         if isinstance(m, Exception):
             raise m
         return m
 
 
+def _fingerprint(value):
+    """Hashable representation of a property value.
+
+    Tells apart values that are equal in Python but serialized
+    differently (``True`` and ``1``, Decimals of different precision,
+    aware datetimes in different timezones), and goes into dicts, so
+    a table modified since it was last seen gets a new fingerprint.
+
+    """
+    if isinstance(value, dict):
+        return (dict, tuple(sorted([(k, _fingerprint(v))
+                                        for k, v in value.items()])))
+    if isinstance(value, Decimal):
+        return (Decimal, value.as_tuple())
+    if isinstance(value, datetime):
+        return (datetime, tuple(value.timetuple()))
+    return (type(value), value)
+
+
+#: Property values that are their own fingerprint, with their type.
+_SCALAR_TYPES = frozenset([str, unicode, int, long])
+
+
+class HeaderCache(object):
+    """Bounded LRU cache of serialized content properties, so messages
+    published with the same properties as a recent message (typically
+    one of a handful of combinations of content_type, delivery_mode,
+    app_id and such) aren't serialized again, just the body size
+    in the content header changes.
+
+    Enabled with the ``header_cache_size`` argument of
+    :class:`~.connection.Connection`.  Entries are keyed by the content
+    class and a fingerprint of the property values, computed for every
+    message, so changes to a message's ``application_headers`` dict
+    are picked up.
+
+    """
+
+    def __init__(self, max_size=DEFAULT_HEADER_CACHE_SIZE):
+        self.max_size = max_size
+        # key: [serialized properties, last use]
+        self.entries = {}
+        self.uses = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def serialize(self, content):
+        """The serialized properties of ``content``, from the cache if
+        possible."""
+        key = [content.__class__]
+        append = key.append
+        try:
+            for name, value in sorted(content.properties.items()):
+                if value is None:
+                    continue
+                if type(value) in _SCALAR_TYPES:
+                    append((name, type(value), value))
+                else:
+                    append((name, _fingerprint(value)))
+            key = tuple(key)
+            entry = self.entries.get(key)
+        except TypeError:
+            # unhashable, such as a list in a table
+            self.misses += 1
+            return content._serialize_properties()
+
+        self.uses += 1
+        if entry is not None:
+            self.hits += 1
+            entry[1] = self.uses
+            return entry[0]
+
+        self.misses += 1
+        raw = content._serialize_properties()
+        entries = self.entries
+        if len(entries) >= self.max_size:
+            del entries[min(entries, key=lambda k: entries[k][1])]
+        entries[key] = [raw, self.uses]
+        return raw
+
+    def clear(self):
+        self.entries.clear()
+
+    @property
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses,
+                "size": len(self.entries)}
+
+
 class MethodWriter(object):
-    """Convert AMQP methods into AMQP frames and send them out to the peer."""
+    """Convert AMQP methods into AMQP frames and send them out to the peer.
+
+    All the frames making up a method (the method frame, the content
+    header and the content body frames) are always sent using a single
+    write.
+
+    If ``coalesce`` is enabled, the frames of consecutive methods are
+    kept in an outbound buffer instead, which is written to the peer
+    in one go by :meth:`flush`.  The buffer is flushed automatically
+    when it holds more than ``max_pending_bytes`` bytes or
+    ``max_pending_methods`` methods, and the :class:`Connection`
+    flushes it before blocking to wait for a reply.
+
+    If ``header_cache`` is a :class:`HeaderCache`, the serialized
+    content properties are looked up in it.
 
-    def __init__(self, dest, frame_max):
+    """
+
+    def __init__(self, dest, frame_max, coalesce=False,
+            max_pending_bytes=DEFAULT_MAX_PENDING_BYTES,
+            max_pending_methods=DEFAULT_MAX_PENDING_METHODS,
+            header_cache=None):
         self.dest = dest
         self.frame_max = frame_max
+        self.coalesce = coalesce
+        self.header_cache = header_cache
+        self.max_pending_bytes = max_pending_bytes
+        self.max_pending_methods = max_pending_methods
+        self.pending = []
+        self.pending_bytes = 0
+        self.pending_methods = 0
         self.bytes_sent = 0  # not actually bytes,
                              # just updated whenever we write.
 
-    def write_method(self, channel, method_sig, args, content=None):
+    def _method_frames(self, channel, method_sig, args, content=None):
+        """Return the list of ``(frame_type, channel, payload)`` frames
+        making up a method."""
         payload = pack('>HH', method_sig[0], method_sig[1]) + args
-        sent = 0
 
         if content:
             # do this early, so we can raise an exception if there's a
@@ -200,20 +367,60 @@ class MethodWriter(object):
                 if coding is None:
                     coding = content.properties['content_encoding'] = 'UTF-8'
                 body = body.encode(coding)
-            properties = content._serialize_properties()
+            if self.header_cache is None:
+                properties = content._serialize_properties()
+            else:
+                properties = self.header_cache.serialize(content)
 
-        self.dest.write_frame(1, channel, payload)
+        frames = [(FRAME_METHOD, channel, payload)]
 
         if content:
-            payload = pack('>HHQ', method_sig[0], 0, len(body)) + properties
-
-            self.dest.write_frame(2, channel, payload)
+            payload = _content_header.pack(method_sig[0], 0,
+                                           len(body)) + properties
+            frames.append((FRAME_HEADER, channel, payload))
 
             chunk_size = self.frame_max - 8
             for i in xrange(0, len(body), chunk_size):
-                self.dest.write_frame(3, channel, body[i:i + chunk_size])
-        self.bytes_sent += 1
+                frames.append((FRAME_BODY, channel, body[i:i + chunk_size]))
+        return frames
 
-    def send_heartbeat(self):
-        self.dest.write_frame(FRAME_HEARTBEAT, 0, '')
+    def write_method(self, channel, method_sig, args, content=None):
+        self._write_frames(
+            self._method_frames(channel, method_sig, args, content), 1)
+
+    def write_methods(self, channel, methods):
+        """Write a sequence of ``(method_sig, args, content)`` methods
+        for the same channel using a single write."""
+        frames = []
+        count = 0
+        for method_sig, args, content in methods:
+            frames.extend(
+                self._method_frames(channel, method_sig, args, content))
+            count += 1
+        if frames:
+            self._write_frames(frames, count)
+
+    def _write_frames(self, frames, method_count):
+        if self.coalesce:
+            self.pending.extend(frames)
+            self.pending_bytes += sum(len(frame[2]) + 8 for frame in frames)
+            self.pending_methods += method_count
+            if self.pending_bytes >= self.max_pending_bytes or \
+                    self.pending_methods >= self.max_pending_methods:
+                self.flush()
+        else:
+            self.dest.write_frames(frames)
+            self.bytes_sent += 1
+
+    def flush(self):
+        """Write all the frames in the outbound buffer to the peer."""
+        if self.pending:
+            frames = self.pending
+            self.pending = []
+            self.pending_bytes = self.pending_methods = 0
+            self.dest.write_frames(frames)
+            self.bytes_sent += 1
 
+    def send_heartbeat(self):
+        self.flush()
+        self.dest.write_frame(FRAME_HEARTBEAT, 0, bytes())
@@ -0,0 +1,237 @@
+# Copyright (C) 2007-2008 Barry Pederson <bp@barryp.org>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+from __future__ import absolute_import
+
+import threading
+from contextlib import contextmanager
+from Queue import Queue
+from time import time
+
+from .exceptions import AMQPChannelError, ChannelPoolExhausted
+from .method_codecs import decode_basic_deliver, decode_basic_get_ok
+
+__all__ = ["ChannelPool"]
+
+
+class ChannelPool(object):
+    """A pool of open channels on a connection, created by
+    :meth:`Connection.channel_pool`.
+
+    Channels are opened when needed, up to ``max_size`` (``None``
+    meaning no limit), and kept open when they're released so the
+    next :meth:`acquire` doesn't have to wait for a ``channel.open``
+    round trip::
+
+        pool = conn.channel_pool(10)
+        with pool.channel() as ch:
+            ch.basic_publish(msg, routing_key='foo')
+
+    When a channel is released its consumers are cancelled, and its
+    ``callbacks``, ``events`` and ``returned_messages`` are reset.
+    Messages received for it that nobody got to see (deliveries still
+    queued on the channel, the reply to an interrupted
+    :meth:`~Channel.basic_get`) are rejected with ``requeue=True``.
+    Channels that were closed (e.g. by a channel error from the
+    server) are discarded instead of being returned to the pool.
+
+    """
+
+    def __init__(self, connection, max_size=None):
+        self.connection = connection
+        self.max_size = max_size
+        self.idle = []
+        self.in_use = set()
+        self.releasing = set()
+        self.opening = 0
+        self.cond = threading.Condition(threading.Lock())
+
+        self.acquired = 0
+        self.created = 0
+        self.discarded = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def __len__(self):
+        return len(self.idle) + len(self.in_use) + self.opening
+
+    def acquire(self, block=True, timeout=None):
+        """Get an open channel from the pool, opening a new one if
+        none is idle and the pool isn't full.
+
+        If the pool is full, wait until a channel is released if
+        ``block`` is true, at most ``timeout`` seconds if it's not
+        None.  Raises :exc:`ChannelPoolExhausted` if no channel
+        could be had.
+
+        """
+        self.cond.acquire()
+        try:
+            started = None
+            while 1:
+                if self.connection is None:
+                    raise ChannelPoolExhausted("The pool is closed")
+                while self.idle:
+                    channel = self.idle.pop()
+                    if channel.is_open:
+                        return self._acquired(channel, started)
+                    self.discarded += 1
+                if self.max_size is None or \
+                        len(self.in_use) + self.opening < self.max_size:
+                    break
+                remaining = timeout
+                if timeout is not None and started is not None:
+                    remaining = started + timeout - time()
+                if not block or (remaining is not None and remaining <= 0):
+                    self._waited(started)
+                    raise ChannelPoolExhausted(
+                        "No free channel, %d in use, max_size=%d" % (
+                            len(self.in_use), self.max_size))
+                if started is None:
+                    started = time()
+                    self.waits += 1
+                self.cond.wait(remaining)
+            # Keep our place while the channel is being opened.
+            self.opening += 1
+            connection = self.connection
+        finally:
+            self.cond.release()
+
+        channel = None
+        try:
+            channel = connection.channel()
+        finally:
+            self.cond.acquire()
+            try:
+                self.opening -= 1
+                if channel is None:
+                    self.cond.notify()
+                else:
+                    self.created += 1
+                    self._acquired(channel, started)
+            finally:
+                self.cond.release()
+        return channel
+
+    def _acquired(self, channel, started):
+        self.in_use.add(channel)
+        self.acquired += 1
+        self._waited(started)
+        return channel
+
+    def _waited(self, started):
+        if started is not None:
+            waited = time() - started
+            self.wait_time += waited
+            self.max_wait_time = max(self.max_wait_time, waited)
+
+    def release(self, channel):
+        """Give a channel obtained from :meth:`acquire` back to
+        the pool.  Raises :exc:`ValueError` if the channel isn't in
+        use (e.g. it was already released)."""
+        self.cond.acquire()
+        try:
+            if channel not in self.in_use or channel in self.releasing:
+                raise ValueError('Channel %d is not in use' %
+                                 channel.channel_id)
+            self.releasing.add(channel)
+        finally:
+            self.cond.release()
+        if channel.is_open:
+            try:
+                self._reset(channel)
+            except AMQPChannelError:
+                pass
+        self.cond.acquire()
+        try:
+            self.releasing.discard(channel)
+            self.in_use.discard(channel)
+            closed = self.connection is None
+            if channel.is_open and not closed:
+                self.idle.append(channel)
+            else:
+                self.discarded += 1
+            self.cond.notify()
+        finally:
+            self.cond.release()
+        if closed and channel.is_open:
+            channel.close()
+
+    def _reset(self, channel):
+        no_ack_consumers = set(channel.no_ack_consumers)
+        for consumer_tag in list(channel.callbacks):
+            channel.basic_cancel(consumer_tag)
+
+        if channel._basic_get_pending:
+            msg = channel.wait(allowed_methods=[(60, 71), (60, 72)])
+            channel._basic_get_pending = False
+            if msg is not None and not channel._basic_get_no_ack:
+                channel.basic_reject(msg.delivery_info['delivery_tag'], True)
+        # Rejected before the pending acks are flushed, a multiple ack
+        # would cover them otherwise.
+        while 1:
+            method = channel.method_queue.get([(60, 60), (60, 71)])
+            if method is None:
+                break
+            method_sig, args, content = method
+            if method_sig == (60, 60):
+                consumer_tag, delivery_tag = decode_basic_deliver(
+                    args.buf, args.offset)[:2]
+                if consumer_tag in no_ack_consumers:
+                    continue
+            else:
+                delivery_tag = decode_basic_get_ok(args.buf, args.offset)[0]
+                if channel._basic_get_no_ack:
+                    continue
+            channel.basic_reject(delivery_tag, True)
+        channel.flush_acks()
+        channel.callbacks = {}
+        channel.returned_messages = Queue()
+        for hooks in channel.events.values():
+            del hooks[:]
+
+    @contextmanager
+    def channel(self, block=True, timeout=None):
+        """Context manager acquiring a channel from the pool, and
+        releasing it at the end of the block."""
+        channel = self.acquire(block, timeout)
+        try:
+            yield channel
+        finally:
+            self.release(channel)
+
+    def close(self):
+        """Close the idle channels, channels still in use are closed
+        when they're released."""
+        self.cond.acquire()
+        try:
+            idle, self.idle = self.idle, []
+            self.connection = None
+            self.cond.notifyAll()
+        finally:
+            self.cond.release()
+        for channel in idle:
+            if channel.is_open:
+                channel.close()
+
+    @property
+    def stats(self):
+        return {"size": len(self), "idle": len(self.idle),
+                "in_use": len(self.in_use) + self.opening, "max_size": self.max_size,
+                "acquired": self.acquired, "created": self.created,
+                "discarded": self.discarded, "waits": self.waits,
+                "wait_time": self.wait_time,
+                "max_wait_time": self.max_wait_time}
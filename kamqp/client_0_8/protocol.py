@@ -0,0 +1,162 @@
+# Copyright (C) 2007-2008 Barry Pederson <bp@barryp.org>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+from __future__ import absolute_import
+
+from struct import unpack_from
+
+try:
+    bytes
+except NameError:
+    # Python 2.5 and lower
+    bytes = str
+
+from .method_framing import FRAME_HEARTBEAT, MethodReader, MethodWriter
+from .serialization import AMQPWriter
+from .transport import AMQP_PROTOCOL_HEADER, FRAME_END, frame_header
+
+__all__ = ["Protocol"]
+
+#: Frame size used until the server tunes the connection.
+DEFAULT_FRAME_MAX = 2 ** 17
+
+
+class Protocol(object):
+    """AMQP framing and method assembly, without any I/O.
+
+    Bytes received from the peer are passed to :meth:`receive_data`,
+    which returns the methods they complete, and the bytes to send to
+    the peer are collected from :meth:`data_to_send`.  When and how the
+    bytes are actually read and written is up to the caller, so the
+    same protocol core can be driven by blocking sockets, a select or
+    epoll loop, an event loop, or recorded byte streams::
+
+        proto = Protocol()
+        proto.initiate()
+        sock.sendall(proto.data_to_send())
+        for channel, method_sig, args, content in \\
+                proto.receive_data(sock.recv(65536)):
+            ...
+
+    Received methods are ``(channel, method_sig, args, content)``
+    tuples, as returned by :meth:`MethodReader.read_method`: ``args``
+    is an :class:`AMQPReader` and ``content`` a :class:`Message` or
+    None.  A frame of an unexpected type results in a
+    ``(channel, Exception)`` tuple instead.  Heartbeats from the peer
+    only update ``reader.last_heartbeat``, sending them is up to the
+    caller (see :meth:`send_heartbeat`).
+
+    """
+
+    def __init__(self, frame_max=DEFAULT_FRAME_MAX):
+        self._inbound = bytearray()
+        self._error = None
+        self._outbound = []
+        self.reader = MethodReader(self)
+        self.writer = MethodWriter(self, frame_max)
+
+    def _get_frame_max(self):
+        return self.writer.frame_max
+
+    def _set_frame_max(self, frame_max):
+        self.writer.frame_max = frame_max
+
+    #: Largest frame sent, set it once the connection is tuned.
+    frame_max = property(_get_frame_max, _set_frame_max)
+
+    def initiate(self):
+        """Queue the protocol header that starts a connection."""
+        self._outbound.append(AMQP_PROTOCOL_HEADER)
+
+    def receive_data(self, data):
+        """Process bytes received from the peer, and return the list
+        of methods completed by them.
+
+        Partial frames are kept until the rest of them is received.
+        If the data isn't properly framed, or a frame can't be
+        processed, the methods completed before it are returned and
+        the exception is raised by the next call (right away if there
+        are none).  The connection should be dropped then: the data
+        after a framing error is never processed, every call raises.
+
+        """
+        error = self._error
+        if error is not None:
+            self._error = None
+            raise error
+
+        buf = self._inbound
+        buf.extend(data)
+        reader = self.reader
+        process = reader._process_frames
+        offset, end = 0, len(buf)
+        try:
+            while end - offset >= 8:
+                frame_type, channel, size = unpack_from('>BHI', buf, offset)
+                frame_end = offset + 7 + size
+                if frame_end >= end:
+                    break
+                if buf[frame_end] != 0xce:
+                    # left in the buffer, it's found again by every call
+                    raise Exception(
+                        "Framing Error, received 0x%02x while expecting 0xce"
+                            % buf[frame_end])
+                frame = (frame_type, channel, bytes(buf[offset + 7:frame_end]))
+                offset = frame_end + 1
+                process([frame])
+        except Exception, exc:
+            if not reader.queue:
+                raise
+            self._error = exc
+        finally:
+            del buf[:offset]
+
+        events = list(reader.queue)
+        reader.queue.clear()
+        return events
+
+    def data_to_send(self):
+        """Return the bytes waiting to be sent to the peer, and
+        forget about them."""
+        data = bytes().join(self._outbound)
+        self._outbound = []
+        return data
+
+    def send_method(self, channel, method_sig, args=bytes(), content=None):
+        """Queue a method, ``args`` may be an :class:`AMQPWriter`."""
+        if isinstance(args, AMQPWriter):
+            args = args.getvalue()
+        self.writer.write_method(channel, method_sig, args, content)
+
+    def send_methods(self, channel, methods):
+        """Queue a sequence of ``(method_sig, args, content)`` methods
+        for a channel."""
+        self.writer.write_methods(channel, methods)
+
+    def send_heartbeat(self):
+        self.write_frame(FRAME_HEARTBEAT, 0, bytes())
+
+    #
+    # Transport interface used by the MethodReader and MethodWriter
+    #
+    def write_frame(self, frame_type, channel, payload):
+        self.write_frames([(frame_type, channel, payload)])
+
+    def write_frames(self, frames):
+        append, pack_header = self._outbound.append, frame_header.pack
+        for frame_type, channel, payload in frames:
+            append(pack_header(frame_type, channel, len(payload)))
+            append(payload)
+            append(FRAME_END)
@@ -0,0 +1,444 @@
+# Copyright (C) 2007-2008 Barry Pederson <bp@barryp.org>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+from __future__ import absolute_import
+
+import logging
+import random
+import socket
+from itertools import count
+from time import sleep, time
+
+from .connection import Connection
+from .exceptions import AMQPConnectionError
+
+__all__ = ["RecoveringConnection", "RecoveringChannel"]
+
+AMQP_LOGGER = logging.getLogger('amqplib')
+
+#: Errors meaning the connection to the server is lost.
+CONNECTION_ERRORS = (socket.error, IOError, AMQPConnectionError)
+
+#: Reply codes of a ``connection.close`` received while connecting
+#: that trying again won't fix: the server refused the virtual host
+#: (402, 530), the credentials (403) or something the client sent
+#: (501-504, 540).  The connection isn't recovered, the error is
+#: raised instead.
+FATAL_REPLY_CODES = frozenset([402, 403, 501, 502, 503, 504, 530, 540])
+
+#: Channel methods that are called again once the connection is
+#: recovered.  Acks, rejects and transactions refer to state of the
+#: lost channel, so they're not.
+RETRY_METHODS = frozenset(["exchange_declare", "exchange_delete",
+                           "queue_declare", "queue_bind", "queue_unbind",
+                           "queue_purge", "queue_delete", "basic_qos",
+                           "basic_consume", "basic_cancel", "basic_get",
+                           "basic_publish"])
+
+
+def _is_connection_error(exc):
+    return isinstance(exc, CONNECTION_ERRORS) and \
+           not isinstance(exc, socket.timeout)
+
+
+def _is_refused(exc):
+    return isinstance(exc, AMQPConnectionError) and \
+           exc.amqp_reply_code in FATAL_REPLY_CODES
+
+
+class RecoveringConnection(object):
+    """A :class:`Connection` that reconnects when the connection to the
+    server is lost, and restores what was set up through its channels.
+
+    The exchanges, queues and bindings declared, the ``basic_qos``
+    settings and the consumers started through a
+    :class:`RecoveringChannel` are recorded (and forgotten when they're
+    deleted, unbound or cancelled).  When the connection is lost, a new
+    one is made, retrying with exponential backoff and jitter (up to
+    ``max_retries`` times, forever if None), the channels are opened
+    again with the same ids, the topology is declared again using
+    pipelines and the consumers are started again with the same
+    consumer tag and callback::
+
+        conn = RecoveringConnection(host='localhost')
+        ch = conn.channel()
+        ch.queue_declare('work', auto_delete=False)
+        ch.basic_consume('work', callback=handle)
+        while True:
+            conn.drain_events()
+
+    A connection error raised by :meth:`drain_events` is handled by
+    recovering.  Channel methods in :data:`RETRY_METHODS` are called
+    again once the connection is recovered, so a message published
+    while the connection was being lost may be published twice.
+    Other methods raise the error, after recovering.
+
+    Server-named queues get a new name when they're declared again,
+    the name they were first given keeps working on the channels:
+    :attr:`queue_names` maps it to the current one.
+
+    The server refusing the new connection (see
+    :data:`FATAL_REPLY_CODES`) isn't retried, the error is raised.
+    Confirm mode and ack coalescing aren't restored, they have to be
+    enabled again on the new channels (from ``on_recover``).
+
+    ``on_recover(connection)`` is called after each recovery.  The
+    keyword arguments are those of :class:`Connection`, the first
+    connection is made without retrying.
+
+    """
+
+    def __init__(self, max_retries=None, retry_delay=0.5,
+                 max_retry_delay=30.0, on_recover=None, **kwargs):
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.on_recover = on_recover
+        self.connection_kwargs = kwargs
+
+        self.channels = {}  # channel_id -> RecoveringChannel
+        self.topology = {}  # key -> (seq, method name, kwargs)
+        self.queue_names = {}
+        self._seq = count()
+
+        self.recoveries = 0
+        self.failed_attempts = 0
+        self.last_recovery_time = 0.0
+        self.total_recovery_time = 0.0
+        self.max_recovery_time = 0.0
+        self.last_error = None
+
+        self.connection = Connection(**kwargs)
+
+    def __getattr__(self, name):
+        if name == "connection":
+            raise AttributeError(name)
+        return getattr(self.connection, name)
+
+    @property
+    def stats(self):
+        return {"recoveries": self.recoveries,
+                "failed_attempts": self.failed_attempts,
+                "last_recovery_time": self.last_recovery_time,
+                "total_recovery_time": self.total_recovery_time,
+                "max_recovery_time": self.max_recovery_time}
+
+    def channel(self, channel_id=None):
+        """Open a :class:`RecoveringChannel`."""
+        if channel_id in self.channels:
+            return self.channels[channel_id]
+        channel = RecoveringChannel(self, channel_id)
+        self.channels[channel.channel_id] = channel
+        return channel
+
+    def drain_events(self, timeout=None):
+        """Wait for an event on any channel, recovering the
+        connection (and returning None) if it's lost."""
+        if self.connection.channels is None:
+            self.recover()
+            return None
+        try:
+            return self.connection.drain_events(timeout=timeout)
+        except Exception, exc:
+            if not _is_connection_error(exc):
+                raise
+            self.recover(exc)
+
+    def close(self):
+        self.channels.clear()
+        if self.connection.channels is not None:
+            self.connection.close()
+
+    def _retry_delay(self, attempt):
+        delay = min(self.max_retry_delay, self.retry_delay * 2 ** attempt)
+        # half of it random, so clients that lost the same server
+        # don't all come back at once
+        return delay / 2.0 + random.uniform(0, delay / 2.0)
+
+    def recover(self, exc=None):
+        """Make a new connection, and restore the channels, topology
+        and consumers."""
+        started = time()
+        self.last_error = exc
+        AMQP_LOGGER.debug('Recovering connection after %r' % (exc, ))
+        self._drop_connection()
+
+        attempt = 0
+        while 1:
+            connected = False
+            try:
+                self.connection = Connection(**self.connection_kwargs)
+                connected = True
+                self._restore()
+                break
+            except Exception, exc:
+                if not _is_connection_error(exc):
+                    raise
+                self.last_error = exc
+                self.failed_attempts += 1
+                self._drop_connection()
+                if not connected and _is_refused(exc):
+                    raise
+                if self.max_retries is not None and \
+                        attempt >= self.max_retries:
+                    raise
+                sleep(self._retry_delay(attempt))
+                attempt += 1
+
+        elapsed = time() - started
+        self.recoveries += 1
+        self.last_recovery_time = elapsed
+        self.total_recovery_time += elapsed
+        self.max_recovery_time = max(self.max_recovery_time, elapsed)
+        if self.on_recover is not None:
+            self.on_recover(self)
+
+    def _drop_connection(self):
+        connection = self.connection
+        if connection.channels is not None:
+            try:
+                connection._do_close()
+            except Exception:
+                pass
+
+    def _restore(self):
+        channels = sorted(self.channels.items())
+        for channel_id, channel in channels:
+            channel.channel = self.connection.channel(channel_id)
+
+        if channels:
+            self._restore_topology(channels[0][1].channel)
+        elif self.topology:
+            channel = self.connection.channel()
+            self._restore_topology(channel)
+            channel.close()
+
+        for channel_id, channel in channels:
+            channel._restore()
+
+    def _restore_topology(self, channel):
+        records = sorted(self.topology.values())
+
+        # Bindings may need the new name of a server-named queue, so
+        # they're declared once the queue declarations are answered.
+        pipeline = channel.pipeline()
+        renamed = []
+        for seq, name, kwargs in records:
+            if name == "queue_declare" and kwargs["queue"] in \
+                    self.queue_names:
+                renamed.append((len(pipeline), kwargs["queue"]))
+                kwargs = dict(kwargs, queue='')
+            if name != "queue_bind":
+                getattr(pipeline, name)(**kwargs)
+        results = pipeline.execute()
+        for index, queue in renamed:
+            self.queue_names[queue] = results[index][0]
+
+        pipeline = channel.pipeline()
+        for seq, name, kwargs in records:
+            if name == "queue_bind":
+                pipeline.queue_bind(**dict(
+                    kwargs, queue=self.queue_name(kwargs["queue"])))
+        if len(pipeline):
+            pipeline.execute()
+
+    def queue_name(self, queue):
+        """Current name of a queue."""
+        return self.queue_names.get(queue, queue)
+
+    def _record(self, key, name, kwargs):
+        self.topology[key] = (next(self._seq), name, kwargs)
+
+    def _forget(self, predicate):
+        for key in [key for key in self.topology if predicate(key)]:
+            del self.topology[key]
+        for channel in self.channels.values():
+            consumers = channel.consumers
+            for consumer_tag in [tag for tag, (seq, kwargs) in
+                                    consumers.items()
+                                    if predicate(("consumer",
+                                                  kwargs["queue"]))]:
+                del consumers[consumer_tag]
+
+
+class RecoveringChannel(object):
+    """A channel of a :class:`RecoveringConnection`, recording what's
+    needed to restore it.
+
+    The methods have the signature of the :class:`Channel` methods,
+    other attributes are those of the current :attr:`channel`.
+
+    """
+
+    def __init__(self, connection, channel_id=None):
+        self.connection = connection
+        self.channel = connection.connection.channel(channel_id)
+        self.channel_id = self.channel.channel_id
+        self.qos = None
+        self.consumers = {}  # consumer_tag -> (seq, kwargs)
+
+    def __getattr__(self, name):
+        if name == "channel":
+            raise AttributeError(name)
+        attr = getattr(self.channel, name)
+        if not callable(attr):
+            return attr
+
+        def method(*args, **kwargs):
+            return self._call(name, args, kwargs)
+        method.__name__ = name
+        return method
+
+    def _call(self, name, args=(), kwargs={}):
+        connection = self.connection
+        retry = name in RETRY_METHODS
+        if connection.connection.channels is None:
+            connection.recover()
+        while 1:
+            try:
+                return getattr(self.channel, name)(*args, **kwargs)
+            except Exception, exc:
+                if not _is_connection_error(exc):
+                    raise
+                connection.recover(exc)
+                if not retry:
+                    raise
+                retry = False
+
+    def _restore(self):
+        channel = self.channel
+        if self.qos is not None:
+            channel.basic_qos(*self.qos)
+        queue_name = self.connection.queue_name
+        for consumer_tag, (seq, kwargs) in sorted(
+                self.consumers.items(), key=lambda item: item[1]):
+            channel.basic_consume(nowait=True, **dict(
+                kwargs, queue=queue_name(kwargs["queue"])))
+
+    def close(self, reply_code=0, reply_text='', method_sig=(0, 0)):
+        self.connection.channels.pop(self.channel_id, None)
+        self.consumers.clear()
+        if self.channel.is_open:
+            self.channel.close(reply_code, reply_text, method_sig)
+
+    def exchange_declare(self, exchange, type, passive=False, durable=False,
+            auto_delete=True, internal=False, nowait=False,
+            arguments=None, ticket=None):
+        kwargs = dict(exchange=exchange, type=type, durable=durable,
+                      auto_delete=auto_delete, internal=internal,
+                      arguments=arguments)
+        result = self._call("exchange_declare", (),
+                            dict(kwargs, passive=passive, nowait=nowait))
+        if not passive:
+            self.connection._record(("exchange", exchange),
+                                    "exchange_declare", kwargs)
+        return result
+
+    def exchange_delete(self, exchange, if_unused=False,
+            nowait=False, ticket=None):
+        result = self._call("exchange_delete", (exchange, if_unused, nowait))
+        self.connection._forget(
+            lambda key: key == ("exchange", exchange) or
+                        (key[0] == "binding" and key[2] == exchange))
+        return result
+
+    def queue_declare(self, queue='', passive=False, durable=False,
+            exclusive=False, auto_delete=True, nowait=False,
+            arguments=None, ticket=None):
+        kwargs = dict(durable=durable, exclusive=exclusive,
+                      auto_delete=auto_delete, arguments=arguments)
+        result = self._call("queue_declare", (), dict(
+            kwargs, queue=self.connection.queue_name(queue),
+            passive=passive, nowait=nowait))
+        if not passive:
+            if not queue and result is not None:
+                # server-named, it'll have a new name next time
+                queue = result[0]
+                self.connection.queue_names[queue] = queue
+            if queue:
+                self.connection._record(("queue", queue), "queue_declare",
+                                        dict(kwargs, queue=queue))
+        return result
+
+    def queue_delete(self, queue='', if_unused=False, if_empty=False,
+            nowait=False, ticket=None):
+        result = self._call("queue_delete", (
+            self.connection.queue_name(queue), if_unused, if_empty, nowait))
+        self.connection._forget(
+            lambda key: key[0] in ("queue", "binding", "consumer") and
+                        key[1] == queue)
+        self.connection.queue_names.pop(queue, None)
+        return result
+
+    def queue_bind(self, queue, exchange, routing_key='',
+            nowait=False, arguments=None, ticket=None):
+        result = self._call("queue_bind", (
+            self.connection.queue_name(queue), exchange, routing_key,
+            nowait, arguments))
+        self.connection._record(("binding", queue, exchange, routing_key),
+                                "queue_bind",
+                                dict(queue=queue, exchange=exchange,
+                                     routing_key=routing_key,
+                                     arguments=arguments))
+        return result
+
+    def queue_unbind(self, queue, exchange, routing_key='',
+            nowait=False, arguments=None, ticket=None):
+        result = self._call("queue_unbind", (
+            self.connection.queue_name(queue), exchange, routing_key,
+            nowait, arguments))
+        self.connection._forget(
+            lambda key: key == ("binding", queue, exchange, routing_key))
+        return result
+
+    def queue_purge(self, queue='', nowait=False, ticket=None):
+        return self._call("queue_purge", (
+            self.connection.queue_name(queue), nowait))
+
+    def basic_qos(self, prefetch_size, prefetch_count, a_global):
+        result = self._call("basic_qos", (
+            prefetch_size, prefetch_count, a_global))
+        self.qos = (prefetch_size, prefetch_count, a_global)
+        return result
+
+    def basic_consume(self, queue='', consumer_tag='', no_local=False,
+            no_ack=False, exclusive=False, nowait=False,
+            callback=None, ticket=None):
+        kwargs = dict(consumer_tag=consumer_tag, no_local=no_local,
+                      no_ack=no_ack, exclusive=exclusive, callback=callback)
+        consumer_tag = self._call("basic_consume", (), dict(
+            kwargs, queue=self.connection.queue_name(queue), nowait=nowait))
+        self.consumers[consumer_tag] = (
+            next(self.connection._seq),
+            dict(kwargs, queue=queue, consumer_tag=consumer_tag))
+        return consumer_tag
+
+    def basic_cancel(self, consumer_tag, nowait=False):
+        self.consumers.pop(consumer_tag, None)
+        return self._call("basic_cancel", (consumer_tag, nowait))
+
+    def basic_get(self, queue='', no_ack=False, ticket=None):
+        return self._call("basic_get", (
+            self.connection.queue_name(queue), no_ack))
+
+    def basic_publish(self, msg, exchange='', routing_key='',
+            mandatory=False, immediate=False, ticket=None,
+            confirm_callback=None):
+        if not exchange:
+            # the default exchange routes by queue name
+            routing_key = self.connection.queue_name(routing_key)
+        return self._call("basic_publish", (
+            msg, exchange, routing_key, mandatory, immediate),
+            dict(confirm_callback=confirm_callback))
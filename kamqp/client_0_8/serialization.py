@@ -18,7 +18,7 @@ import sys
 
 from datetime import datetime
 from decimal import Decimal
-from struct import pack, unpack
+from struct import Struct, error as struct_error, pack
 from time import mktime
 
 IS_PY3K = sys.version_info[0] >= 3
@@ -45,35 +45,69 @@ except NameError:
     # Python 2.5 and lower
     bytes = str
 
+#: What an :class:`AMQPReader` reads in place.
+_BUFFER_TYPES = (bytes, bytearray)
+
+_EMPTY = bytes()
+
+#: Most shapes (sets of properties present) of content headers a
+#: content class keeps compiled property encoders and decoders for.
+MAX_PROPERTY_SHAPES = 256
+
+_octet = Struct('B')
+_short = Struct('>H')
+_long = Struct('>I')
+_longlong = Struct('>Q')
+_int = Struct('>i')
+_decimal = Struct('>Bi')
+
+_unpack_octet = _octet.unpack_from
+_unpack_short = _short.unpack_from
+_unpack_long = _long.unpack_from
+_unpack_longlong = _longlong.unpack_from
+_unpack_int = _int.unpack_from
+_unpack_decimal = _decimal.unpack_from
+
 
 class AMQPReader(object):
     """Read higher-level AMQP types from a bytestream.
 
     :param source: should be either a file-like object with a
                    :meth:`read` method, or a plain (non-unicode) string.
+    :param offset: where to start reading a string from.
+
+    A string is read in place: fields are decoded directly from it at
+    the current :attr:`offset`, with precompiled :class:`struct.Struct`
+    formats, so there's no copying besides the strings returned.
 
     """
 
-    def __init__(self, source):
-        if isinstance(source, bytes):
-            self.input = BytesIO(source)
-        elif hasattr(source, 'read'):
-            self.input = source
-        else:
-            raise ValueError("need a file-like object or plain string")
+    def __new__(cls, source, offset=0):
+        if cls is AMQPReader and not isinstance(source, _BUFFER_TYPES):
+            if not hasattr(source, 'read'):
+                raise ValueError("need a file-like object or plain string")
+            cls = AMQPStreamReader
+        return object.__new__(cls)
+
+    def __init__(self, source, offset=0):
+        self.buf = source
+        self.offset = offset
         self.bitcount = self.bits = 0
 
     def close(self):
-        self.input.close()
+        pass
 
     def read(self, n):
         self.bitcount = self.bits = 0
-        return self.input.read(n)
+        offset = self.offset
+        self.offset = offset + n
+        return self.buf[offset:offset + n]
 
     def read_bit(self):
         """Read a single boolean value."""
         if not self.bitcount:
-            self.bits = ord(self.input.read(1))
+            self.bits = _unpack_octet(self.buf, self.offset)[0]
+            self.offset += 1
             self.bitcount = 8
         result = (self.bits & 1) == 1
         self.bits >>= 1
@@ -83,22 +117,30 @@ class AMQPReader(object):
     def read_octet(self):
         """Read one byte, return as an integer."""
         self.bitcount = self.bits = 0
-        return unpack('B', self.input.read(1))[0]
+        offset = self.offset
+        self.offset = offset + 1
+        return _unpack_octet(self.buf, offset)[0]
 
     def read_short(self):
         """Read an unsigned 16-bit integer."""
         self.bitcount = self.bits = 0
-        return unpack('>H', self.input.read(2))[0]
+        offset = self.offset
+        self.offset = offset + 2
+        return _unpack_short(self.buf, offset)[0]
 
     def read_long(self):
         """Read an unsigned 32-bit integer."""
         self.bitcount = self.bits = 0
-        return unpack('>I', self.input.read(4))[0]
+        offset = self.offset
+        self.offset = offset + 4
+        return _unpack_long(self.buf, offset)[0]
 
     def read_longlong(self):
         """Read an unsigned 64-bit integer."""
         self.bitcount = self.bits = 0
-        return unpack('>Q', self.input.read(8))[0]
+        offset = self.offset
+        self.offset = offset + 8
+        return _unpack_longlong(self.buf, offset)[0]
 
     def read_shortstr(self):
         """Read a short string that's stored in up to 255 bytes.
@@ -108,8 +150,10 @@ class AMQPReader(object):
 
         """
         self.bitcount = self.bits = 0
-        slen = unpack('B', self.input.read(1))[0]
-        return self.input.read(slen).decode('utf-8')
+        offset = self.offset + 1
+        end = offset + _unpack_octet(self.buf, self.offset)[0]
+        self.offset = end
+        return self.buf[offset:end].decode('utf-8')
 
     def read_longstr(self):
         """Read a string that's up to 2**32 bytes.
@@ -119,30 +163,37 @@ class AMQPReader(object):
 
         """
         self.bitcount = self.bits = 0
-        slen = unpack('>I', self.input.read(4))[0]
-        return self.input.read(slen).decode('utf-8')
+        offset = self.offset + 4
+        end = offset + _unpack_long(self.buf, self.offset)[0]
+        self.offset = end
+        return self.buf[offset:end].decode('utf-8')
 
     def read_table(self):
         """Read an AMQP table, and return as a :class:`dict`."""
         self.bitcount = self.bits = 0
-        tlen = unpack('>I', self.input.read(4))[0]
-        table_data = AMQPReader(self.input.read(tlen))
+        buf = self.buf
+        end = self.offset + 4 + _unpack_long(buf, self.offset)[0]
+        self.offset += 4
+        read_shortstr, read_longstr = self.read_shortstr, self.read_longstr
         result = {}
-        while table_data.input.tell() < tlen:
-            name = table_data.read_shortstr()
-            ftype = ord(table_data.input.read(1))
+        while self.offset < end:
+            name = read_shortstr()
+            offset = self.offset
+            ftype = _unpack_octet(buf, offset)[0]
+            self.offset = offset + 1
             if ftype == 83:     # 'S'
-                val = table_data.read_longstr()
+                val = read_longstr()
             elif ftype == 73:   # 'I'
-                val = unpack('>i', table_data.input.read(4))[0]
+                val = _unpack_int(buf, offset + 1)[0]
+                self.offset = offset + 5
             elif ftype == 68:   # 'D'
-                d = table_data.read_octet()
-                n = unpack('>i', table_data.input.read(4))[0]
+                d, n = _unpack_decimal(buf, offset + 1)
+                self.offset = offset + 6
                 val = Decimal(n) / Decimal(10 ** d)
             elif ftype == 84:   # 'T'
-                val = table_data.read_timestamp()
+                val = self.read_timestamp()
             elif ftype == 70:   # 'F'
-                val = table_data.read_table()  # recurse
+                val = self.read_table()  # recurse
             else:
                 raise ValueError("unknown table item type: %r" % (ftype, ))
             result[name] = val
@@ -155,6 +206,58 @@ class AMQPReader(object):
         return datetime.fromtimestamp(self.read_longlong())
 
 
+class AMQPStreamReader(AMQPReader):
+    """:class:`AMQPReader` of a file-like object, reading just
+    the bytes needed for each value from it."""
+
+    def __init__(self, source, offset=0):
+        self.input = source
+        self.bitcount = self.bits = 0
+
+    def close(self):
+        self.input.close()
+
+    def read(self, n):
+        self.bitcount = self.bits = 0
+        return self.input.read(n)
+
+    def _read_value(self, fmt):
+        self.bitcount = self.bits = 0
+        return fmt.unpack(self.input.read(fmt.size))[0]
+
+    def read_bit(self):
+        """Read a single boolean value."""
+        if not self.bitcount:
+            self.bits = _octet.unpack(self.input.read(1))[0]
+            self.bitcount = 8
+        result = (self.bits & 1) == 1
+        self.bits >>= 1
+        self.bitcount -= 1
+        return result
+
+    def read_octet(self):
+        return self._read_value(_octet)
+
+    def read_short(self):
+        return self._read_value(_short)
+
+    def read_long(self):
+        return self._read_value(_long)
+
+    def read_longlong(self):
+        return self._read_value(_longlong)
+
+    def read_shortstr(self):
+        return self.input.read(self.read_octet()).decode('utf-8')
+
+    def read_longstr(self):
+        return self.input.read(self.read_long()).decode('utf-8')
+
+    def read_table(self):
+        tlen = self.read_long()
+        return AMQPReader(_long.pack(tlen) + self.input.read(tlen)).read_table()
+
+
 class AMQPWriter(object):
     """Convert higher-level AMQP types to bytestreams.
 
@@ -311,53 +414,231 @@ class AMQPWriter(object):
         self.out.write(pack('>q', long(mktime(v.timetuple()))))
 
 
-class GenericContent(object):
-    """Abstract base class for AMQP content.
+def _encode_shortstr(s):
+    if isinstance(s, unicode):
+        s = s.encode('utf-8')
+    if len(s) > 255:
+        raise ValueError("String too long (0..255)")
+    return byte(len(s)) + s
 
-    Subclasses should override the :attr:`PROPERTIES` attribute.
 
-    """
-    PROPERTIES = [("dummy", "shortstr")]
+def _writer_encoder(proptype):
+    write = getattr(AMQPWriter, 'write_' + proptype)
 
-    def __init__(self, **props):
-        self.properties = dict((name, props[name])
-                                for name, _ in self.PROPERTIES
-                                    if name in props)
+    def encode(value):
+        w = AMQPWriter()
+        write(w, value)
+        return w.getvalue()
+    return encode
 
-    def __eq__(self, other):
-        return (hasattr(other, 'properties')
-                and self.properties == other.properties)
 
-    def __getattr__(self, name):
-        """Look for additional properties in the 'properties'
-        dict, and if present - the 'delivery_info' dict."""
-        if name == "__setstate__":
-            # Allows pickling/unpickling to work
-            raise AttributeError("__setstate__")
+#: struct formats of the fixed size property types
+_FIXED_FORMATS = {
+    'octet': 'B',
+    'short': 'H',
+    'long': 'I',
+    'longlong': 'Q',
+    }
 
-        try:
-            return self.properties[name]
-        except KeyError:
-            pass
+_PROPERTY_ENCODERS = {
+    'shortstr': _encode_shortstr,
+    'octet': _octet.pack,
+    'short': _short.pack,
+    'long': _long.pack,
+    'longlong': _longlong.pack,
+    }
 
-        if "delivery_info" in self.__dict__:
-            try:
-                return self.delivery_info[name]
-            except KeyError:
-                pass
 
-        raise AttributeError(name)
+class _PropertyCodec(object):
+    """Encodes and decodes the property flags and property list of a
+    content class, see :meth:`GenericContent._load_properties`.
 
+    The encoder and decoder of each shape of the properties, given by
+    the property flag word, are compiled on first use and kept in
+    :attr:`encoders` and :attr:`decoders`: just the present properties
+    in order, with consecutive fixed size properties decoded by a
+    single :class:`struct.Struct`.  Shapes of one or two properties
+    (like ``content_type`` with ``delivery_mode``) and a short string
+    followed by fixed size properties are unrolled.
 
-    def __ne__(self, other):
-        return not self.__eq__(other)
+    Content classes with more than 15 properties, needing more than
+    one flag word, use the generic encoding.
 
+    Decoding may leave the tables (like ``application_headers``) to
+    later, see :meth:`GenericContent._load_properties`.
 
-    def _load_properties(self, raw_bytes):
-        """Given the raw bytes containing the property-flags and property-list
-        from a content-frame-header, parse and insert into a dictionary
-        stored in this object as an attribute named 'properties'."""
-        r = AMQPReader(raw_bytes)
+    """
+
+    def __init__(self, properties):
+        self.properties = properties
+        self.single_word = len(properties) <= 15
+        self.flag_of = dict((name, 1 << (15 - i))
+                            for i, (name, _) in enumerate(properties[:15]))
+        self.encoders = {}
+        self.decoders = {}
+        self.lazy_decoders = {}
+
+    def _fields(self, flags):
+        return [(name, proptype) for name, proptype in self.properties
+                    if flags & self.flag_of[name]]
+
+    def _cached(self, table, flags, compile):
+        fn = compile(flags)
+        if len(table) < MAX_PROPERTY_SHAPES:
+            table[flags] = fn
+        return fn
+
+    def encode(self, props):
+        """The property flags and property list of a dictionary."""
+        if self.single_word:
+            flags = 0
+            flag_of = self.flag_of
+            for name, value in props.items():
+                if value is not None:
+                    flags |= flag_of.get(name, 0)
+            try:
+                encoder = self.encoders[flags]
+            except KeyError:
+                encoder = self._cached(self.encoders, flags,
+                                       self._compile_encoder)
+        else:
+            encoder = self._encode_generic
+        try:
+            return encoder(props)
+        except struct_error, exc:
+            raise ValueError(str(exc))
+
+    def _compile_encoder(self, flags):
+        head = _short.pack(flags)
+        steps = []
+        for name, proptype in self._fields(flags):
+            if proptype == 'bit':
+                # only the flag is sent
+                continue
+            try:
+                steps.append((name, _PROPERTY_ENCODERS[proptype]))
+            except KeyError:
+                steps.append((name, _writer_encoder(proptype)))
+
+        if not steps:
+            return lambda props: head
+        if len(steps) == 1:
+            (name, encode), = steps
+            return lambda props: head + encode(props[name])
+        if len(steps) == 2:
+            (name1, encode1), (name2, encode2) = steps
+            return lambda props: _EMPTY.join([head, encode1(props[name1]),
+                                              encode2(props[name2])])
+
+        def encoder(props):
+            parts = [head]
+            for name, encode in steps:
+                parts.append(encode(props[name]))
+            return _EMPTY.join(parts)
+        return encoder
+
+    def decode(self, buf, offset=0, tables=None):
+        """Decode the property flags and property list at ``offset``
+        in ``buf`` into a dictionary.
+
+        If ``tables`` is a dictionary, the table properties are skipped
+        instead of decoded, and their offsets in ``buf`` stored in it.
+
+        """
+        if not isinstance(buf, _BUFFER_TYPES):
+            # a file-like object
+            return self._decode_generic(buf, offset)
+        flags = _unpack_short(buf, offset)[0]
+        if flags & 1 or not self.single_word:
+            return self._decode_generic(buf, offset)
+        if tables is not None:
+            try:
+                decoder = self.lazy_decoders[flags]
+            except KeyError:
+                decoder = self._cached(self.lazy_decoders, flags,
+                                       self._compile_lazy_decoder)
+            return decoder(buf, offset + 2, tables)
+        try:
+            decoder = self.decoders[flags]
+        except KeyError:
+            decoder = self._cached(self.decoders, flags, self._compile_decoder)
+        return decoder(buf, offset + 2)
+
+    def _compile_lazy_decoder(self, flags):
+        if 'table' in [proptype for _, proptype in self._fields(flags)]:
+            return self._compile_decoder(flags, True)
+        decode = self._compile_decoder(flags)
+        return lambda buf, offset, tables: decode(buf, offset)
+
+    def _compile_decoder(self, flags, lazy_tables=False):
+        # ('struct', Struct, names) for runs of fixed size properties,
+        # ('skip', name, None) for tables left for later, and
+        # ('read', name, AMQPReader method) for the others
+        fields = self._fields(flags)
+        if not lazy_tables and fields and fields[0][1] == 'shortstr' and \
+                all(proptype in _FIXED_FORMATS for _, proptype in fields[1:]):
+            return self._compile_shortstr_decoder(fields)
+
+        steps = []
+        fmt, names = '', []
+        for name, proptype in fields:
+            if proptype in _FIXED_FORMATS:
+                fmt += _FIXED_FORMATS[proptype]
+                names.append(name)
+                continue
+            if fmt:
+                steps.append(('struct', Struct('>' + fmt), tuple(names)))
+                fmt, names = '', []
+            if lazy_tables and proptype == 'table':
+                steps.append(('skip', name, None))
+            else:
+                steps.append(('read', name,
+                              getattr(AMQPReader, 'read_' + proptype)))
+        if fmt:
+            steps.append(('struct', Struct('>' + fmt), tuple(names)))
+
+        if not steps:
+            return lambda buf, offset: {}
+
+        def decoder(buf, offset, tables=None):
+            r = AMQPReader(buf, offset)
+            d = {}
+            for kind, a, b in steps:
+                if kind == 'read':
+                    d[a] = b(r)
+                elif kind == 'struct':
+                    d.update(zip(b, a.unpack_from(buf, r.offset)))
+                    r.offset += a.size
+                else:
+                    tables[a] = r.offset
+                    r.offset += 4 + _unpack_long(buf, r.offset)[0]
+            return d
+        return decoder
+
+    def _compile_shortstr_decoder(self, fields):
+        """Decoder of a short string followed by fixed size properties,
+        like ``content_type`` with ``delivery_mode``."""
+        name = fields[0][0]
+        if len(fields) == 1:
+            def decoder(buf, offset):
+                end = offset + 1 + _unpack_octet(buf, offset)[0]
+                return {name: buf[offset + 1:end].decode('utf-8')}
+            return decoder
+
+        unpack_from = Struct('>' + ''.join(_FIXED_FORMATS[proptype]
+                                           for _, proptype in fields[1:])
+                            ).unpack_from
+        names = [fixed_name for fixed_name, _ in fields[1:]]
+
+        def decoder(buf, offset):
+            end = offset + 1 + _unpack_octet(buf, offset)[0]
+            d = dict(zip(names, unpack_from(buf, end)))
+            d[name] = buf[offset + 1:end].decode('utf-8')
+            return d
+        return decoder
+
+    def _decode_generic(self, buf, offset=0):
+        r = AMQPReader(buf, offset)
 
         # Read 16-bit shorts until we get one with a low bit set to zero
         flags = []
@@ -369,7 +650,7 @@ class GenericContent(object):
 
         shift = 0
         d = {}
-        for key, proptype in self.PROPERTIES:
+        for key, proptype in self.properties:
             if shift == 0:
                 if not flags:
                     break
@@ -378,26 +659,22 @@ class GenericContent(object):
             if flag_bits & (1 << shift):
                 d[key] = getattr(r, 'read_' + proptype)()
             shift -= 1
+        return d
 
-        self.properties = d
-
-
-    def _serialize_properties(self):
-        """Serialize the 'properties' attribute (a dictionary) into
-        the raw bytes making up a set of property flags and a
-        property list, suitable for putting into a content frame header."""
+    def _encode_generic(self, props):
         shift = 15
         flag_bits = 0
         flags = []
         raw_bytes = AMQPWriter()
-        for key, proptype in self.PROPERTIES:
-            val = self.properties.get(key, None)
-            if val is not None:
-                if shift == 0:
-                    flags.append(flag_bits)
-                    flag_bits = 0
-                    shift = 15
+        for key, proptype in self.properties:
+            if shift == 0:
+                # the low bit says another word of flags follows
+                flags.append(flag_bits | 1)
+                flag_bits = 0
+                shift = 15
 
+            val = props.get(key, None)
+            if val is not None:
                 flag_bits |= (1 << shift)
                 if proptype != 'bit':
                     getattr(raw_bytes, 'write_' + proptype)(val)
@@ -411,3 +688,146 @@ class GenericContent(object):
         result.write(raw_bytes.getvalue())
 
         return result.getvalue()
+
+
+class GenericContent(object):
+    """Abstract base class for AMQP content.
+
+    Subclasses should override the :attr:`PROPERTIES` attribute.
+
+    """
+    PROPERTIES = [("dummy", "shortstr")]
+
+    def __init__(self, **props):
+        self.properties = dict((name, props[name])
+                                for name, _ in self.PROPERTIES
+                                    if name in props)
+
+    def __eq__(self, other):
+        return (hasattr(other, 'properties')
+                and self.properties == other.properties)
+
+    def __getattr__(self, name):
+        """Look for additional properties in the 'properties'
+        dict, and if present - the 'delivery_info' dict.
+
+        Properties loaded lazily are decoded here on first use, tables
+        only when they're the property asked for (see
+        :meth:`_load_properties`).
+
+        """
+        if name.startswith('_'):
+            # Keeps pickle and copy from looking for special methods
+            # here, and there are no such properties
+            raise AttributeError(name)
+
+        d = self.__dict__
+        if '_raw_properties' in d:
+            self._decode_properties()
+        if name in d.get('_raw_tables', ()):
+            self._decode_table(name)
+        try:
+            return d['_properties'][name]
+        except KeyError:
+            pass
+
+        if "delivery_info" in d:
+            try:
+                return self.delivery_info[name]
+            except KeyError:
+                pass
+
+        raise AttributeError(name)
+
+    def _get_properties(self):
+        d = self.__dict__
+        if '_raw_properties' in d:
+            self._decode_properties()
+        for name in list(d.get('_raw_tables', ())):
+            self._decode_table(name)
+        return d['_properties']
+
+    def _set_properties(self, properties):
+        self._forget_raw_properties()
+        self.__dict__['_properties'] = properties
+
+    properties = property(_get_properties, _set_properties,
+                          doc="The properties, as a :class:`dict`.")
+
+    def _forget_raw_properties(self):
+        d = self.__dict__
+        for name in ('_raw_properties', '_raw_tables', '_raw_buf'):
+            d.pop(name, None)
+
+    def _decode_properties(self):
+        d = self.__dict__
+        raw = d.get('_raw_properties')
+        if raw is None:
+            return
+        buf, offset = raw
+        tables = {}
+        d['_properties'] = self._property_codec().decode(buf, offset, tables)
+        if tables:
+            d['_raw_tables'] = tables
+            d['_raw_buf'] = buf
+        d.pop('_raw_properties', None)
+
+    def _decode_table(self, name):
+        d = self.__dict__
+        tables = d['_raw_tables']
+        offset = tables.pop(name, None)
+        if offset is not None:
+            d['_properties'][name] = AMQPReader(d['_raw_buf'],
+                                                offset).read_table()
+        if not tables:
+            d.pop('_raw_tables', None)
+            d.pop('_raw_buf', None)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __setstate__(self, state):
+        if 'properties' in state:
+            # Pickled when 'properties' was a plain attribute, it
+            # would be hidden by the property now.
+            state = dict(state)
+            state['_properties'] = state.pop('properties')
+        self.__dict__.update(state)
+
+
+    @classmethod
+    def _property_codec(cls):
+        """The :class:`_PropertyCodec` of this class, compiled from
+        :attr:`PROPERTIES` on first use."""
+        codec = cls.__dict__.get('_codec')
+        if codec is None:
+            codec = cls._codec = _PropertyCodec(cls.PROPERTIES)
+        return codec
+
+
+    def _load_properties(self, raw_bytes, offset=0, lazy=False):
+        """Given the raw bytes containing the property-flags and property-list
+        from a content-frame-header (starting at 'offset'), parse and insert
+        into a dictionary stored in this object as an attribute named
+        'properties'.
+
+        If 'lazy' is set, the raw bytes are kept and only parsed when a
+        property is first used, and then tables (like
+        'application_headers') only when they're used themselves, or
+        when the whole 'properties' dict is.
+
+        """
+        if lazy and isinstance(raw_bytes, _BUFFER_TYPES):
+            self._forget_raw_properties()
+            self.__dict__.pop('_properties', None)
+            self.__dict__['_raw_properties'] = (raw_bytes, offset)
+        else:
+            self.properties = self._property_codec().decode(raw_bytes,
+                                                            offset)
+
+
+    def _serialize_properties(self):
+        """Serialize the 'properties' attribute (a dictionary) into
+        the raw bytes making up a set of property flags and a
+        property list, suitable for putting into a content frame header."""
+        return self._property_codec().encode(self.properties)
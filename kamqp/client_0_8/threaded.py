@@ -0,0 +1,299 @@
+# Copyright (C) 2007-2008 Barry Pederson <bp@barryp.org>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+from __future__ import absolute_import
+
+import logging
+import os
+import threading
+from collections import deque
+
+from .connection import Connection
+from .hub import Hub
+
+__all__ = ["ThreadedConnection", "ThreadedChannel"]
+
+AMQP_LOGGER = logging.getLogger('amqplib')
+
+#: Most commands queued for the I/O thread before posting one blocks.
+DEFAULT_MAX_PENDING = 4096
+
+_WAKEUP = 'x'.encode('latin_1')
+
+
+class Future(object):
+    """The result of a call run by the I/O thread of
+    a :class:`ThreadedConnection`."""
+
+    def __init__(self):
+        self._done = threading.Event()
+        self._result = self._exception = None
+
+    def set_result(self, result):
+        self._result = result
+        self._done.set()
+
+    def set_exception(self, exception):
+        self._exception = exception
+        self._done.set()
+
+    def done(self):
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """Wait for the call to finish, and return its result or
+        raise its exception.  Raises :exc:`threading.ThreadError`
+        if it didn't finish in ``timeout`` seconds."""
+        self._done.wait(timeout)
+        if not self._done.is_set():
+            raise threading.ThreadError('Timed out waiting for the I/O thread')
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+
+class ThreadedConnection(object):
+    """A :class:`Connection` that can be shared by many threads.
+
+    A background I/O thread owns the socket, and runs everything done
+    on the connection and its channels.  Other threads queue commands
+    for it: :meth:`ThreadedChannel.basic_publish`, ``basic_ack`` and
+    ``basic_reject`` return as soon as they're queued, other methods
+    wait for the I/O thread to run them and return their result::
+
+        conn = ThreadedConnection(host='localhost')
+        ch = conn.channel()
+        ch.queue_declare('work')     # waits for the declare-ok
+        ch.basic_publish(msg, routing_key='work')   # doesn't wait
+
+    At most ``max_pending`` commands are queued, posting more blocks
+    until the I/O thread catches up.  The connection is created with
+    ``coalesce_writes`` (unless told otherwise), so publishes queued
+    together are written together.
+
+    Consumer callbacks are called by the I/O thread, and may use the
+    channels.  Errors that can't be returned to a caller (a failed
+    publish, a channel closed by the server) are passed to
+    ``on_error(connection, exc)`` in the I/O thread, or logged.  Once
+    the connection is gone, its error is raised by every call.
+
+    """
+
+    def __init__(self, max_pending=DEFAULT_MAX_PENDING, on_error=None,
+                 **kwargs):
+        kwargs.setdefault('coalesce_writes', True)
+        self.connection = Connection(**kwargs)
+        self.on_error = on_error
+        self.error = None
+
+        self._commands = deque()
+        self._slots = threading.Semaphore(max_pending)
+        self._wakeup_pending = False
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        # held while writing to the wakeup pipe, and while closing
+        self._lock = threading.Lock()
+
+        self.hub = Hub(on_error=self._on_error)
+        self.hub.register(self.connection)
+        self.hub.add_reader(self._wakeup_r, self._run_commands)
+        self._closing = self._stopped = False
+        self.thread = threading.Thread(target=self._io_loop,
+                                       name='kamqp I/O')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _in_io_thread(self):
+        return threading.current_thread() is self.thread
+
+    def _io_loop(self):
+        try:
+            self.hub.run()
+        finally:
+            self._lock.acquire()
+            # nothing would run the commands posted from now on
+            self._closing = True
+            self._lock.release()
+
+    def _post(self, command):
+        if self._closing:
+            raise ValueError('Connection is closed')
+        self._slots.acquire()
+        self._lock.acquire()
+        try:
+            if self._closing:
+                self._slots.release()
+                raise ValueError('Connection is closed')
+            self._commands.append(command)
+            # Only the first command queued since the I/O thread last
+            # looked needs to wake it up.
+            if not self._wakeup_pending:
+                self._wakeup_pending = True
+                os.write(self._wakeup_w, _WAKEUP)
+        finally:
+            self._lock.release()
+
+    def _run_commands(self):
+        os.read(self._wakeup_r, 4096)
+        self._wakeup_pending = False
+        commands, release = self._commands, self._slots.release
+        while commands:
+            func, args, kwargs, future = commands.popleft()
+            release()
+            self._run(func, args, kwargs, future)
+
+    def _run(self, func, args, kwargs, future):
+        try:
+            if self.error is not None:
+                raise self.error
+            result = func(*args, **kwargs)
+        except Exception, exc:
+            if future is not None:
+                future.set_exception(exc)
+            else:
+                self._on_error(self.connection, exc)
+        else:
+            if future is not None:
+                future.set_result(result)
+
+    def _on_error(self, connection, exc):
+        if connection.channels is None or \
+                connection not in self.hub.connections.values():
+            # the connection is gone (the hub dropped it)
+            self.error = exc
+            self.hub.unregister(connection)
+            if connection.channels is not None:
+                connection._do_close()
+        if self.on_error is not None:
+            self.on_error(connection, exc)
+        else:
+            AMQP_LOGGER.error('Error on threaded connection: %r' % (exc, ))
+
+    def post(self, func, *args, **kwargs):
+        """Have the I/O thread call ``func(*args, **kwargs)``,
+        without waiting for it."""
+        if self._in_io_thread():
+            self._run(func, args, kwargs, None)
+        else:
+            self._post((func, args, kwargs, None))
+
+    def submit(self, func, *args, **kwargs):
+        """Have the I/O thread call ``func(*args, **kwargs)``, returns
+        a :class:`Future` for the result."""
+        future = Future()
+        if self._in_io_thread():
+            self._run(func, args, kwargs, future)
+        else:
+            self._post((func, args, kwargs, future))
+        return future
+
+    def call(self, func, *args, **kwargs):
+        """Have the I/O thread call ``func(*args, **kwargs)``, and
+        wait for the result."""
+        return self.submit(func, *args, **kwargs).result()
+
+    def channel(self, channel_id=None):
+        """Fetch (or open) a channel, as a :class:`ThreadedChannel`."""
+        return ThreadedChannel(self,
+                               self.call(self.connection.channel, channel_id))
+
+    def flush(self):
+        """Wait until every command queued so far has been run, and
+        its frames written."""
+        self.call(self.connection.flush)
+
+    def _close_connection(self):
+        self.hub.unregister(self.connection)
+        self.connection.close()
+
+    def close(self):
+        """Close the connection, and stop the I/O thread.
+
+        When called from the I/O thread (by a consumer callback), the
+        thread stops once the callback returns, without being waited
+        for.
+
+        """
+        thread = self.thread
+        if thread is None:
+            return
+        try:
+            if self.error is None and not self._closing:
+                self.call(self._close_connection)
+        finally:
+            self._stop(thread)
+
+    def _stop(self, thread):
+        """Stop the I/O thread, and close the wakeup pipe once nothing
+        can write to it any more."""
+        in_io_thread = threading.current_thread() is thread
+        self._lock.acquire()
+        try:
+            if self._stopped:
+                return
+            self._stopped = self._closing = True
+            self.hub.stop()
+            if not in_io_thread:
+                os.write(self._wakeup_w, _WAKEUP)
+        finally:
+            self._lock.release()
+        if not in_io_thread:
+            thread.join()
+        # fail whatever was posted too late to be run
+        commands = self._commands
+        while commands:
+            future = commands.popleft()[3]
+            self._slots.release()
+            if future is not None:
+                future.set_exception(ValueError('Connection is closed'))
+        self.hub.remove_reader(self._wakeup_r)
+        os.close(self._wakeup_r)
+        os.close(self._wakeup_w)
+        self.thread = None
+
+
+class ThreadedChannel(object):
+    """A :class:`Channel` of a :class:`ThreadedConnection`, usable from
+    any thread.
+
+    ``basic_publish``, ``basic_ack`` and ``basic_reject`` are queued
+    for the I/O thread without waiting, every other method is run by
+    the I/O thread and its result returned.  Attributes are those of
+    the underlying :attr:`channel`.
+
+    """
+
+    def __init__(self, threaded, channel):
+        self.threaded = threaded
+        self.channel = channel
+
+    def basic_publish(self, *args, **kwargs):
+        self.threaded.post(self.channel.basic_publish, *args, **kwargs)
+
+    def basic_ack(self, *args, **kwargs):
+        self.threaded.post(self.channel.basic_ack, *args, **kwargs)
+
+    def basic_reject(self, *args, **kwargs):
+        self.threaded.post(self.channel.basic_reject, *args, **kwargs)
+
+    def __getattr__(self, name):
+        attr = getattr(self.channel, name)
+        if not callable(attr):
+            return attr
+        call = self.threaded.call
+
+        def method(*args, **kwargs):
+            return call(attr, *args, **kwargs)
+        method.__name__ = name
+        return method
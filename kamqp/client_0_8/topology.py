@@ -0,0 +1,100 @@
+# Copyright (C) 2007-2008 Barry Pederson <bp@barryp.org>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+from __future__ import absolute_import
+
+from .serialization import AMQPWriter
+
+__all__ = ["DeclarationCache"]
+
+
+def table_key(arguments):
+    """Hashable representation of a declaration arguments table."""
+    if not arguments:
+        return None
+    w = AMQPWriter()
+    w.write_table(arguments)
+    return w.getvalue()
+
+
+class DeclarationCache(object):
+    """Remembers the exchanges, queues and bindings that were
+    successfully declared on a connection, so that repeating an
+    identical declaration doesn't have to wait for the server.
+
+    Keys are tuples starting with the kind of entity (``"exchange"``,
+    ``"queue"`` or ``"binding"``), followed by its name(s) and the
+    declare arguments, and values are the reply of the declare method.
+
+    The cache is cleared when a channel or connection error is
+    received, and entries are removed when the entity is deleted or
+    the binding removed using the same connection.  Entities deleted
+    by other clients, or by the server (e.g. ``auto_delete``) are
+    not noticed.
+
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self, key):
+        """Return the cached reply for a declaration, or raise
+        :exc:`KeyError` if it's not cached."""
+        try:
+            result = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            raise
+        self.hits += 1
+        return result
+
+    def add(self, key, result=None):
+        self.entries[key] = result
+
+    def discard_exchange(self, exchange):
+        """Forget an exchange and the bindings to it."""
+        self._discard(lambda key: (key[0] == "exchange" and
+                                       key[1] == exchange) or
+                                  (key[0] == "binding" and
+                                       key[2] == exchange))
+
+    def discard_queue(self, queue):
+        """Forget a queue and its bindings."""
+        self._discard(lambda key: key[0] in ("queue", "binding") and
+                                      key[1] == queue)
+
+    def discard_binding(self, queue, exchange, routing_key):
+        self._discard(lambda key: key[:4] == ("binding", queue,
+                                              exchange, routing_key))
+
+    def _discard(self, predicate):
+        for key in [key for key in self.entries if predicate(key)]:
+            del self.entries[key]
+
+    def clear(self):
+        self.entries.clear()
+
+    @property
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses,
+                "size": len(self.entries)}
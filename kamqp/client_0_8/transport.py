@@ -33,10 +33,26 @@ except:
     # Python 2.5 and lower
     bytes = str
 
-from struct import pack, unpack
+from struct import Struct, pack, unpack_from
 
 AMQP_PORT = 5672
 
+#: Scatter/gather writes are used when the platform supports them
+#: (:meth:`socket.socket.sendmsg` is only available in Python 3.3+).
+HAVE_SENDMSG = hasattr(socket.socket, 'sendmsg')
+
+#: Max number of buffers passed to a single :meth:`~socket.socket.sendmsg`
+#: call (``IOV_MAX`` is 1024 on Linux and the BSDs).
+IOV_MAX = 1024
+
+#: Frame header: frame type, channel and payload size.
+frame_header = Struct('>BHI')
+FRAME_END = pack('B', 0xce)
+
+#: Initial size of the transport receive buffer, also the most we ask
+#: for in a single :meth:`~socket.socket.recv_into`.
+READ_BUFFER_SIZE = 65536
+
 # Yes, Advanced Message Queuing Protocol Protocol is redundant
 AMQP_PROTOCOL_HEADER = 'AMQP\x01\x01\x08\x00'.encode('latin_1')
 
@@ -45,7 +61,15 @@ IPV6_LITERAL = re.compile(r'\[([\.0-9a-f:]+)\](?::(\d+))?')
 
 
 class _AbstractTransport(object):
-    """Common superclass for TCP and SSL transports."""
+    """Common superclass for TCP and SSL transports.
+
+    Incoming data is received with :meth:`_recv_into` into a single
+    reusable :class:`bytearray`.  ``_read_start`` and ``_read_end`` mark
+    the pending (not yet consumed) region, which is only moved to the
+    front of the buffer when there's not enough room left at the end
+    for the data we're waiting for.
+
+    """
 
     def __init__(self, host, connect_timeout):
         msg = 'socket.getaddrinfo() for %s returned an empty list' % host
@@ -69,7 +93,9 @@ class _AbstractTransport(object):
                 self.sock = socket.socket(af, socktype, proto)
                 self.sock.settimeout(connect_timeout)
                 self.sock.connect(sa)
-            except socket.error, msg:
+            except socket.error, exc:
+                # keep it past the except clause (Python 3 unbinds exc)
+                msg = exc
                 self.sock.close()
                 self.sock = None
                 continue
@@ -83,13 +109,98 @@ class _AbstractTransport(object):
         self.sock.setsockopt(socket.SOL_TCP, socket.TCP_NODELAY, 1)
         self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
 
+        self._read_buffer = bytearray(READ_BUFFER_SIZE)
+        self._read_view = memoryview(self._read_buffer)
+        self._read_start = self._read_end = 0
+
         self._setup_transport()
 
         self._write(AMQP_PROTOCOL_HEADER)
 
+    def _recv_into(self, view):
+        """Receive at most ``len(view)`` bytes from the peer into
+        view, return how many were received (0 if the peer is gone)."""
+        raise NotImplementedError("must be overriden in subclass")
+
+    def _fill(self, n):
+        """Make sure at least n bytes are pending in the read buffer."""
+        start, end = self._read_start, self._read_end
+        if end - start >= n:
+            return
+        if start == end:
+            start = end = 0
+        buf = self._read_buffer
+        if len(buf) - start < n or len(buf) - end < READ_BUFFER_SIZE // 4:
+            # Not enough room left at the end of the buffer, so move the
+            # pending data to the front, growing the buffer if needed.
+            pending = end - start
+            if len(buf) < n:
+                buf = bytearray(max(n, len(buf) * 2))
+            buf[:pending] = self._read_buffer[start:end]
+            if buf is not self._read_buffer:
+                self._read_buffer = buf
+                self._read_view = memoryview(buf)
+            start, end = 0, pending
+        self._read_start = start
+
+        recv_into, view = self._recv_into, self._read_view
+        try:
+            while end - start < n:
+                received = recv_into(view[end:])
+                if not received:
+                    raise IOError("Socket closed")
+                end += received
+        finally:
+            self._read_end = end
+
     def _read(self, n):
         """Read exactly n bytes from the peer."""
-        raise NotImplementedError("must be overriden in subclass")
+        self._fill(n)
+        start = self._read_start
+        self._read_start = start + n
+        return self._read_view[start:start + n].tobytes()
+
+    def read_frame(self):
+        """Read an AMQP frame.
+
+        The frame is parsed in place in the read buffer, and nothing is
+        consumed until the complete frame has arrived, so a socket
+        timeout (or an SSL WANT_READ on a non-blocking socket) never
+        leaves a partial frame behind.
+
+        """
+        self._fill(7)
+        frame_type, channel, size = unpack_from('>BHI', self._read_buffer,
+                                                self._read_start)
+        self._fill(size + 8)
+        start = self._read_start + 7
+        end = start + size
+        ch = self._read_buffer[end]
+        if ch != 0xce:
+            raise Exception(
+                "Framing Error, received 0x%02x while expecting 0xce" % ch)
+        self._read_start = end + 1
+        return frame_type, channel, self._read_view[start:end].tobytes()
+
+    def read_frames(self):
+        """Read an AMQP frame, and every other complete frame that's
+        already in the read buffer, without reading from the socket
+        again."""
+        frames = [self.read_frame()]
+        append = frames.append
+        buf, view = self._read_buffer, self._read_view
+        start, end = self._read_start, self._read_end
+        while end - start >= 8:
+            frame_type, channel, size = unpack_from('>BHI', buf, start)
+            frame_end = start + 7 + size
+            if frame_end >= end or buf[frame_end] != 0xce:
+                # Incomplete, or a framing error read_frame() will
+                # report next time.
+                break
+            append((frame_type, channel, view[start + 7:frame_end].tobytes()))
+            start = frame_end + 1
+        self._read_start = start
+        return frames
 
     def _setup_transport(self):
         """Do any additional initialization of the class (used
@@ -104,32 +215,44 @@ class _AbstractTransport(object):
         """Completely write a string to the peer."""
         raise NotImplementedError("must be overriden in subclass")
 
+    def _writev(self, buffers):
+        """Completely write a sequence of strings to the peer.
+
+        Subclasses supporting scatter/gather I/O may override this,
+        by default the buffers are joined and sent using :meth:`_write`.
+
+        """
+        self._write(bytes().join(buffers))
+
     def close(self):
         if self.sock is not None:
             self._shutdown_transport()
             # Call shutdown first to make sure that pending messages
             # reach the AMQP broker if the program exits after
             # calling this method.
-            self.sock.shutdown(socket.SHUT_RDWR)
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                # the peer is already gone
+                pass
             self.sock.close()
             self.sock = None
 
-    def read_frame(self):
-        """Read an AMQP frame."""
-        frame_type, channel, size = unpack('>BHI', self._read(7))
-        payload = self._read(size)
-        ch = ord(self._read(1))
-        if ch == 0xce:
-            return frame_type, channel, payload
-        else:
-            raise Exception(
-                "Framing Error, received 0x%02x while expecting 0xce" % ch)
-
     def write_frame(self, frame_type, channel, payload):
         """Write out an AMQP frame."""
-        size = len(payload)
-        self._write(pack('>BHI%dsB' % size,
-                         frame_type, channel, size, payload, 0xce))
+        self._writev([frame_header.pack(frame_type, channel, len(payload)),
+                      payload, FRAME_END])
+
+    def write_frames(self, frames):
+        """Write out a sequence of ``(frame_type, channel, payload)``
+        AMQP frames using a single write."""
+        buffers = []
+        append, pack_header = buffers.append, frame_header.pack
+        for frame_type, channel, payload in frames:
+            append(pack_header(frame_type, channel, len(payload)))
+            append(payload)
+            append(FRAME_END)
+        self._writev(buffers)
 
 
 class SSLTransport(_AbstractTransport):
@@ -156,20 +279,10 @@ class SSLTransport(_AbstractTransport):
             self.sock = self.sslobj.unwrap()
             self.sslobj = None
 
-    def _read(self, n):
-        """It seems that SSL Objects :meth:`read` method may not supply
-        as much as you're asking for, at least with extremely large messages.
-        somewhere > 16K - found this in the test_channel.py test_large
-        unittest."""
-        result = self.sslobj.read(n)
-
-        while len(result) < n:
-            s = self.sslobj.read(n - len(result))
-            if not s:
-                raise IOError("Socket closed")
-            result += s
-
-        return result
+    def _recv_into(self, view):
+        """The SSL object may not supply as much as we're asking for,
+        a read never returns more than one SSL record (16K)."""
+        return self.sslobj.recv_into(view)
 
     def _write(self, s):
         """Write a string out to the SSL socket fully."""
@@ -184,23 +297,34 @@ class TCPTransport(_AbstractTransport):
     """Transport that deals directly with TCP socket."""
 
     def _setup_transport(self):
-        """Setup to :meth:`_write` directly to the socket, and
-        do our own buffered reads."""
+        """Setup to :meth:`_write` directly to the socket."""
         self._write = self.sock.sendall
-        self._read_buffer = bytes()
-
-    def _read(self, n):
-        """Read exactly n bytes from the socket."""
-        while len(self._read_buffer) < n:
-            s = self.sock.recv(65536)
-            if not s:
-                raise IOError("Socket closed")
-            self._read_buffer += s
-
-        result = self._read_buffer[:n]
-        self._read_buffer = self._read_buffer[n:]
-
-        return result
+        if HAVE_SENDMSG:
+            self._writev = self._sendmsg
+
+    def _sendmsg(self, buffers):
+        """Write a sequence of strings to the socket with as few
+        :meth:`~socket.socket.sendmsg` calls as possible, without
+        joining them first."""
+        sendmsg = self.sock.sendmsg
+        buffers = list(buffers)
+        while buffers:
+            chunk = buffers[:IOV_MAX]
+            sent = sendmsg(chunk)
+            # skip the buffers that were written completely
+            for i, buf in enumerate(chunk):
+                if sent < len(buf):
+                    break
+                sent -= len(buf)
+            else:
+                i = len(chunk)
+            if i < len(chunk) and sent:
+                # partial write, continue from the middle of the buffer.
+                buffers[i] = memoryview(buffers[i])[sent:]
+            del buffers[:i]
+
+    def _recv_into(self, view):
+        return self.sock.recv_into(view)
 
 
 def create_transport(host, connect_timeout, ssl=False):
@@ -27,9 +27,16 @@ import settings
 TEST_NAMES = [
         'test_exceptions',
         'test_serialization',
+        'test_method_codecs',
+        'test_abstract_channel',
+        'test_protocol',
+        'test_aio',
         'test_basic_message',
         'test_connection',
         'test_channel',
+        'test_hub',
+        'test_threaded',
+        'test_recovery',
         ]
 
 if sys.version_info >= (2, 5):
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""
+Test kamqp.client_0_8.abstract_channel module
+
+"""
+# Copyright (C) 2007-2008 Barry Pederson <bp@barryp.org>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+
+import unittest
+
+import settings
+
+
+from kamqp.client_0_8.abstract_channel import MethodQueue
+
+
+DELIVER = (60, 60)
+DECLARE_OK = (50, 11)
+CLOSE = (20, 40)
+
+
+class TestMethodQueue(unittest.TestCase):
+    def test_get(self):
+        q = MethodQueue()
+        for i in range(3):
+            q.append((DELIVER, 'deliver %d' % i, None))
+        q.append((DECLARE_OK, 'declare_ok', None))
+        q.append((DELIVER, 'deliver 3', None))
+        self.assertEqual(len(q), 5)
+
+        self.assertEqual(q.get([(50, 21)]), None)
+        self.assertEqual(q.get([DECLARE_OK, CLOSE]),
+                         (DECLARE_OK, 'declare_ok', None))
+        self.assertEqual([args for sig, args, content in q],
+                         ['deliver %d' % i for i in range(4)])
+
+        # the rest comes back in the order it arrived
+        for i in range(4):
+            self.assertEqual(q.get()[1], 'deliver %d' % i)
+        self.assertEqual(q.get(), None)
+        self.assertEqual(len(q), 0)
+
+
+    def test_order(self):
+        q = MethodQueue()
+        for i in range(100):
+            q.append((DELIVER, i, None))
+            q.append((DECLARE_OK, i, None))
+
+        # taking methods by signature keeps the ordering compact
+        for i in range(50):
+            self.assertEqual(q.get([DECLARE_OK])[1], i)
+        self.assertTrue(len(q.order) <= 2 * len(q) + 16)
+
+        self.assertEqual(q.get([DELIVER, DECLARE_OK])[1], 0)
+        self.assertEqual(q.get()[1], 1)
+        self.assertEqual(q.get([DECLARE_OK])[1], 50)
+        self.assertEqual([args for sig, args, content in q][:3], [2, 3, 4])
+
+
+def main():
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestMethodQueue)
+    unittest.TextTestRunner(**settings.test_args).run(suite)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+"""
+Test kamqp.client_0_8.aio module, against a stand-in broker
+running on the same event loop.
+
+The module needs Python 3.5.2 or later, so these tests are skipped on
+Python 2.  Run them on the sources converted by 2to3 (along with the
+tests) under Python 3.
+
+"""
+# Copyright (C) 2007-2008 Barry Pederson <bp@barryp.org>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+
+import logging
+import sys
+import unittest
+from collections import deque
+
+if sys.version_info >= (3, 5, 2):
+    import asyncio
+else:
+    asyncio = None
+
+import settings
+
+
+from kamqp.client_0_8 import AMQPChannelError, Message
+from kamqp.client_0_8.protocol import Protocol
+from kamqp.client_0_8.serialization import AMQPWriter
+
+if asyncio is not None:
+    from kamqp.client_0_8 import aio
+
+    class StandInBroker(asyncio.Protocol):
+        """Just enough of a broker for the tests: queues on the
+        default exchange, basic.get and consumers."""
+
+        def __init__(self, queues):
+            self.queues = queues
+            self.consumers = {}  # queue -> [(channel, consumer_tag)]
+            self.delivery_tag = 0
+
+        def connection_made(self, transport):
+            self.transport = transport
+            self.protocol = Protocol()
+            self.started = False
+
+        def data_received(self, data):
+            if not self.started:
+                assert data[:8] == b'AMQP\x01\x01\x08\x00'
+                data = data[8:]
+                self.started = True
+                args = AMQPWriter()
+                args.write_octet(0)
+                args.write_octet(8)
+                args.write_table({})
+                args.write_longstr('AMQPLAIN')
+                args.write_longstr('en_US')
+                self.protocol.send_method(0, (10, 10), args)
+            for channel, method_sig, args, content in \
+                    self.protocol.receive_data(data):
+                self.handle(channel, method_sig, args, content)
+            self.transport.write(self.protocol.data_to_send())
+
+        def send(self, channel, method_sig, *values, **kwargs):
+            args = AMQPWriter()
+            for value in values:
+                if isinstance(value, str):
+                    args.write_shortstr(value)
+                elif isinstance(value, bool):
+                    args.write_bit(value)
+                else:
+                    args.write_short(value)
+            self.protocol.send_method(channel, method_sig, args,
+                                      kwargs.get('content'))
+
+        def handle(self, channel, method_sig, args, content):
+            if method_sig == (10, 11):
+                args = AMQPWriter()
+                args.write_short(0)
+                args.write_long(131072)
+                args.write_short(0)
+                self.protocol.send_method(0, (10, 30), args)
+            elif method_sig == (10, 40):
+                self.send(0, (10, 41), '')
+            elif method_sig == (10, 60):
+                self.send(0, (10, 61))
+            elif method_sig == (20, 10):
+                self.send(channel, (20, 11))
+            elif method_sig == (20, 40):
+                self.send(channel, (20, 41))
+            elif method_sig == (50, 10):
+                args.read_short()
+                queue = args.read_shortstr() or \
+                        'amq.gen-%d' % len(self.queues)
+                self.queues.setdefault(queue, deque())
+                args = AMQPWriter()
+                args.write_shortstr(queue)
+                args.write_long(len(self.queues[queue]))
+                args.write_long(0)
+                self.protocol.send_method(channel, (50, 11), args)
+            elif method_sig == (60, 40):
+                args.read_short()
+                args.read_shortstr()
+                queue = args.read_shortstr()
+                if queue in self.queues:
+                    self.queues[queue].append(content)
+                    self.deliver(queue)
+            elif method_sig == (60, 70):
+                args.read_short()
+                queue = args.read_shortstr()
+                if queue not in self.queues:
+                    self.send(channel, (20, 40), 404, 'NOT_FOUND', 60, 70)
+                elif self.queues[queue]:
+                    msg = self.queues[queue].popleft()
+                    self.delivery_tag += 1
+                    args = AMQPWriter()
+                    args.write_longlong(self.delivery_tag)
+                    args.write_bit(False)
+                    args.write_shortstr('')
+                    args.write_shortstr(queue)
+                    args.write_long(len(self.queues[queue]))
+                    self.protocol.send_method(channel, (60, 71), args, msg)
+                else:
+                    self.send(channel, (60, 72), '')
+            elif method_sig == (60, 20):
+                args.read_short()
+                queue = args.read_shortstr()
+                consumer_tag = args.read_shortstr() or \
+                               'ctag-%d.%d' % (channel, self.delivery_tag)
+                self.consumers.setdefault(queue, []).append(
+                    (channel, consumer_tag))
+                self.send(channel, (60, 21), consumer_tag)
+                self.deliver(queue)
+
+        def deliver(self, queue):
+            consumers = self.consumers.get(queue)
+            while consumers and self.queues[queue]:
+                channel, consumer_tag = consumers[0]
+                msg = self.queues[queue].popleft()
+                self.delivery_tag += 1
+                args = AMQPWriter()
+                args.write_shortstr(consumer_tag)
+                args.write_longlong(self.delivery_tag)
+                args.write_bit(False)
+                args.write_shortstr('')
+                args.write_shortstr(queue)
+                self.protocol.send_method(channel, (60, 60), args, msg)
+
+
+class TestAsyncio(unittest.TestCase):
+    def setUp(self):
+        if asyncio is None:
+            self.skipTest('needs Python 3.5.2 or later')
+        self.loop = asyncio.new_event_loop()
+        self.queues = {}
+        self.server = self.run_loop(self.loop.create_server(
+            lambda: StandInBroker(self.queues), '127.0.0.1', 0))
+        port = self.server.sockets[0].getsockname()[1]
+        self.conn = self.run_loop(aio.connect('127.0.0.1:%d' % port,
+                                              userid='guest',
+                                              password='guest',
+                                              loop=self.loop))
+
+
+    def tearDown(self):
+        if asyncio is None:
+            return
+        self.run_loop(self.conn.close())
+        self.server.close()
+        self.run_loop(self.server.wait_closed())
+        self.loop.close()
+
+
+    def run_loop(self, future):
+        return self.loop.run_until_complete(asyncio.wait_for(future, 5))
+
+
+    def test_basic_get(self):
+        ch = self.run_loop(self.conn.channel())
+        qname, _, _ = self.run_loop(ch.queue_declare())
+
+        for i in range(3):
+            ch.basic_publish(Message('message %d' % i,
+                                     content_type='text/plain'),
+                             routing_key=qname)
+        for i in range(3):
+            msg = self.run_loop(ch.basic_get(qname, no_ack=True))
+            self.assertEqual(msg.body, ('message %d' % i).encode('latin_1'))
+            self.assertEqual(msg.content_type, 'text/plain')
+            self.assertEqual(msg.delivery_info['message_count'], 2 - i)
+        self.assertEqual(self.run_loop(ch.basic_get(qname)), None)
+
+        self.run_loop(ch.close())
+        self.assertFalse(ch.channel_id in self.conn.channels)
+
+
+    def test_consumers(self):
+        done = self.loop.create_future()
+        received = []
+
+        def on_message(msg):
+            received.append(msg.body)
+            if len(received) == 100:
+                done.set_result(None)
+
+        channels = []
+        for i in range(100):
+            ch = self.run_loop(self.conn.channel())
+            qname, _, _ = self.run_loop(ch.queue_declare('q%d' % i))
+            self.run_loop(ch.basic_consume(qname, callback=on_message))
+            channels.append(ch)
+
+        for i, ch in enumerate(channels):
+            ch.basic_publish(Message('message %d' % i), routing_key='q%d' % i)
+        self.run_loop(done)
+        self.assertEqual(sorted(received),
+                         sorted([('message %d' % i).encode('latin_1')
+                                    for i in range(100)]))
+
+
+    def test_callback_error(self):
+        done = self.loop.create_future()
+        received = []
+
+        def on_message(msg):
+            received.append(msg.body)
+            if len(received) == 1:
+                raise ValueError('bad message')
+            if len(received) == 3:
+                done.set_result(None)
+
+        errors = []
+        handler = logging.Handler()
+        handler.emit = errors.append
+        aio.AMQP_LOGGER.addHandler(handler)
+        aio.AMQP_LOGGER.propagate = False
+        try:
+            ch = self.run_loop(self.conn.channel())
+            qname, _, _ = self.run_loop(ch.queue_declare())
+            self.run_loop(ch.basic_consume(qname, callback=on_message))
+            for i in range(3):
+                ch.basic_publish(Message('message %d' % i),
+                                 routing_key=qname)
+            self.run_loop(done)
+        finally:
+            aio.AMQP_LOGGER.removeHandler(handler)
+            aio.AMQP_LOGGER.propagate = True
+
+        # the error was logged, and the connection is still fine
+        self.assertEqual(len(received), 3)
+        self.assertEqual(len(errors), 1)
+        self.assertTrue(isinstance(errors[0].exc_info[1], ValueError))
+        self.run_loop(ch.queue_declare())
+
+
+    def test_channel_error(self):
+        ch = self.run_loop(self.conn.channel())
+        try:
+            self.run_loop(ch.basic_get('bogus_queue_that_does_not_exist'))
+        except AMQPChannelError, exc:
+            self.assertEqual(exc.amqp_reply_code, 404)
+        else:
+            self.fail('AMQPChannelError not raised')
+        self.assertFalse(ch.is_open)
+
+        # the connection is still fine
+        ch = self.run_loop(self.conn.channel())
+        self.run_loop(ch.queue_declare())
+
+
+def main():
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestAsyncio)
+    unittest.TextTestRunner(**settings.test_args).run(suite)
+
+if __name__ == '__main__':
+    main()
@@ -82,6 +82,24 @@ class TestBasicMessage(unittest.TestCase):
         self.assertEqual(msg, msg2)
 
 
+    def test_unpickle_old(self):
+        # pickled when 'properties' was stored in the instance dict
+        data = ("ccopy_reg\n_reconstructor\np0\n"
+                "(ckamqp.client_0_8.basic_message\nMessage\np1\n"
+                "c__builtin__\nobject\np2\nNtp3\nRp4\n(dp5\n"
+                "S'body'\np6\nS'hello'\np7\nsS'properties'\np8\n(dp9\n"
+                "S'application_headers'\np10\n(dp11\nS'foo'\np12\nI7\n"
+                "ssS'content_type'\np13\nS'text/plain'\np14\nssb.")
+        msg = pickle.loads(data.encode('latin_1'))
+
+        self.assertEqual(msg.content_type, 'text/plain')
+        self.assertEqual(msg.properties,
+                         {'content_type': 'text/plain',
+                          'application_headers': {'foo': 7}})
+        self.assertEqual(msg, Message('hello', content_type='text/plain',
+                                      application_headers={'foo': 7}))
+
+
     def test_roundtrip(self):
         """
         Check round-trip processing of content-properties.
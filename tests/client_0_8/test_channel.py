@@ -74,6 +74,31 @@ class TestChannel(unittest.TestCase):
         self.assertEqual(n, 0)
 
 
+    def test_confirm_select(self):
+        qname, _, _ = self.ch.queue_declare()
+        self.ch.confirm_select()
+
+        confirmed = []
+        acked = []
+        self.ch.events['basic_ack'].append(acked.append)
+
+        def on_confirm(seq_no, ack):
+            confirmed.append((seq_no, ack))
+
+        seq_no = self.ch.basic_publish(Message('first'), routing_key=qname,
+                                       confirm_callback=on_confirm)
+        self.assertEqual(seq_no, 1)
+        seq_nos = self.ch.basic_publish_many(
+            [Message('message %d' % i) for i in range(5)], routing_key=qname)
+        self.assertEqual(seq_nos, [2, 3, 4, 5, 6])
+        self.assertEqual(self.ch.unconfirmed, set(range(1, 7)))
+
+        self.assertEqual(self.ch.wait_for_confirms(timeout=5), True)
+        self.assertEqual(self.ch.unconfirmed, set())
+        self.assertEqual(confirmed, [(1, True)])
+        self.assertEqual(sorted(acked), range(1, 7))
+
+
     def test_encoding(self):
         self.ch.access_request('/data', active=True, write=True, read=True)
 
@@ -215,6 +240,47 @@ class TestChannel(unittest.TestCase):
             self.assertEqual(msg, msg2)
 
 
+    def test_pipeline(self):
+        p = self.ch.pipeline()
+        p.exchange_declare('unittest.pipeline', 'direct', auto_delete=True)
+        p.queue_declare('unittest.pipeline.q1')
+        p.queue_declare('unittest.pipeline.q2', nowait=True)
+        p.queue_bind('unittest.pipeline.q1', 'unittest.pipeline', 'key')
+        self.assertEqual(len(p), 4)
+
+        results = p.execute()
+        self.assertEqual(len(results), 4)
+        self.assertEqual(results[1], ('unittest.pipeline.q1', 0, 0))
+        self.assertEqual(results[2], None)
+
+        self.ch.basic_publish(Message('hello'), 'unittest.pipeline', 'key')
+        self.assertEqual(
+            self.ch.basic_get('unittest.pipeline.q1', no_ack=True).body,
+            'hello')
+
+        with self.ch.pipeline() as p:
+            p.queue_delete('unittest.pipeline.q1')
+            p.queue_delete('unittest.pipeline.q2')
+        self.assertEqual(p.results, [0, 0])
+
+
+    def test_pipeline_exception(self):
+        p = self.ch.pipeline()
+        p.queue_declare('unittest.pipeline.q3')
+        p.queue_bind('unittest.pipeline.q3', 'bogus_exchange_that_does_not_exist')
+        p.queue_declare('unittest.pipeline.q4')
+        try:
+            p.execute()
+        except AMQPChannelError, exc:
+            self.assertEqual(exc.pipeline_call,
+                ('queue_bind',
+                 ('unittest.pipeline.q3', 'bogus_exchange_that_does_not_exist'),
+                 {}))
+        else:
+            self.fail('AMQPChannelError not raised')
+        self.assertEqual(self.ch.is_open, False)
+
+
     def test_publish(self):
         tkt = self.ch.access_request('/data', active=True, write=True)
         self.assertEqual(tkt, self.ch.default_ticket)
@@ -228,6 +294,117 @@ class TestChannel(unittest.TestCase):
         self.ch.basic_publish(msg, 'unittest.fanout')
 
 
+    def test_publish_many(self):
+        self.ch.access_request('/data', active=True, write=True, read=True)
+
+        my_routing_key = 'unittest.test_publish_many'
+        qname, _, _ = self.ch.queue_declare()
+        qname2, _, _ = self.ch.queue_declare()
+        self.ch.queue_bind(qname, 'amq.direct', routing_key=my_routing_key)
+
+        messages = [Message('message %d' % i) for i in range(10)]
+        self.ch.basic_publish_many(messages, 'amq.direct', my_routing_key)
+        self.ch.basic_publish_many([(Message('to default'), '', qname2),
+                                    (Message('to direct'), 'amq.direct',
+                                     my_routing_key)])
+
+        for msg in messages + [Message('to direct')]:
+            msg2 = self.ch.basic_get(qname, no_ack=True)
+            self.assertEqual(msg, msg2)
+        self.assertEqual(self.ch.basic_get(qname, no_ack=True), None)
+        self.assertEqual(self.ch.basic_get(qname2, no_ack=True).body,
+                         'to default')
+
+
+    def test_ack_coalescing(self):
+        self.ch.access_request('/data', active=True, write=True, read=True)
+        acks = self.ch.enable_ack_coalescing(max_count=4)
+
+        qname, _, _ = self.ch.queue_declare(auto_delete=False)
+        for i in range(6):
+            self.ch.basic_publish(Message('message %d' % i),
+                                  routing_key=qname)
+
+        tags = [self.ch.basic_get(qname).delivery_info['delivery_tag']
+                    for i in range(6)]
+        self.assertEqual(len(acks.outstanding), 6)
+
+        # acked out of order, nothing can be sent until the first one
+        for tag in [tags[1], tags[2], tags[3]]:
+            self.ch.basic_ack(tag)
+        self.assertEqual(acks.acks_sent, 0)
+        self.ch.basic_ack(tags[0])
+        self.assertEqual(acks.acks_sent, 1)
+        self.assertEqual(acks.pending, [])
+
+        self.ch.basic_ack(tags[5])
+        self.ch.basic_reject(tags[4], requeue=False)
+        self.ch.flush_acks()
+        self.assertEqual(acks.acks_sent, 2)
+        self.assertEqual(acks.outstanding, set())
+
+        # an ack kept back too long goes out on the next heartbeat tick
+        self.ch.basic_publish(Message('message 6'), routing_key=qname)
+        acks.max_delay = 0.05
+        self.ch.basic_ack(
+            self.ch.basic_get(qname).delivery_info['delivery_tag'])
+        self.conn.heartbeat_tick()
+        self.assertEqual(acks.acks_sent, 2)
+        time.sleep(0.05)
+        self.conn.heartbeat_tick()
+        self.assertEqual(acks.acks_sent, 3)
+
+        # nothing was left unacked to be requeued
+        self.ch.close()
+        self.ch = self.conn.channel()
+        self.assertEqual(self.ch.basic_get(qname), None)
+        self.ch.queue_delete(qname)
+
+
+    def test_ack_coalescing_late(self):
+        self.ch.access_request('/data', active=True, write=True, read=True)
+        qname, _, _ = self.ch.queue_declare(auto_delete=False)
+        for i in range(4):
+            self.ch.basic_publish(Message('message %d' % i),
+                                  routing_key=qname)
+
+        # two messages received before coalescing is enabled
+        self.ch.basic_get(qname)
+        self.ch.basic_get(qname)
+        acks = self.ch.enable_ack_coalescing()
+        tags = [self.ch.basic_get(qname).delivery_info['delivery_tag']
+                    for i in range(2)]
+        self.assertEqual(len(acks.gaps), 2)
+
+        # a multiple ack would cover the first two messages too
+        for tag in tags:
+            self.ch.basic_ack(tag)
+        self.ch.flush_acks()
+        self.assertEqual(acks.acks_sent, 2)
+
+        # which are still unacked, and get requeued
+        self.ch.close()
+        self.ch = self.conn.channel()
+        self.assertEqual([self.ch.basic_get(qname, no_ack=True).body
+                            for i in range(2)],
+                         ['message 0', 'message 1'])
+        self.assertEqual(self.ch.basic_get(qname), None)
+        self.ch.queue_delete(qname)
+
+
+    def test_ack_coalescing_stuck(self):
+        acks = self.ch.enable_ack_coalescing()
+
+        # the first message is never acked, the others are settled
+        acks.delivered(1)
+        for tag in range(2, 1000):
+            acks.delivered(tag)
+            acks.settled(tag)
+        self.assertEqual(acks.outstanding, set([1]))
+        self.assertTrue(len(acks._heap) <= 4)
+        self.assertEqual(acks.lowest_outstanding(), 1)
+
+
     def test_queue(self):
         self.ch.access_request('/data', active=True, write=True, read=True)
 
@@ -19,15 +19,63 @@ Test kamqp.client_0_8.connection module
 # License along with this library; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
 
+from __future__ import with_statement
+
 import gc
+import socket
 import sys
+import threading
 import time
 import unittest
 
 import settings
 
 
-from kamqp.client_0_8 import Connection
+from kamqp.client_0_8 import (AMQPChannelError, AMQPConnectionError,
+                              BrokerList, ChannelPoolExhausted, Connection,
+                              Message)
+from kamqp.client_0_8.protocol import Protocol
+from kamqp.client_0_8.serialization import AMQPWriter
+
+def redirect_once(listener, dest):
+    """Stand in for a broker redirecting the first client
+    connecting to ``listener`` to ``dest``."""
+    sock, _ = listener.accept()
+    protocol = Protocol()
+    header = bytes()
+    while len(header) < 8:
+        header += sock.recv(8 - len(header))
+    args = AMQPWriter()
+    args.write_octet(8)
+    args.write_octet(0)
+    args.write_table({})
+    args.write_longstr('AMQPLAIN')
+    args.write_longstr('en_US')
+    protocol.send_method(0, (10, 10), args)
+    try:
+        while 1:
+            sock.sendall(protocol.data_to_send())
+            data = sock.recv(4096)
+            if not data:
+                return
+            for channel, method_sig, args, content in \
+                    protocol.receive_data(data):
+                if method_sig == (10, 11):
+                    args = AMQPWriter()
+                    args.write_short(0)
+                    args.write_long(131072)
+                    args.write_short(0)
+                    protocol.send_method(0, (10, 30), args)
+                elif method_sig == (10, 40):
+                    args = AMQPWriter()
+                    args.write_shortstr(dest)
+                    args.write_shortstr('')
+                    protocol.send_method(0, (10, 50), args)
+                    sock.sendall(protocol.data_to_send())
+                    return
+    finally:
+        sock.close()
+
 
 class TestConnection(unittest.TestCase):
     def setUp(self):
@@ -48,6 +96,24 @@ class TestConnection(unittest.TestCase):
         ch2.close()
 
 
+    def test_channel_id_reuse(self):
+        channels = [self.conn.channel() for i in range(5)]
+        self.assertEqual([ch.channel_id for ch in channels], [1, 2, 3, 4, 5])
+
+        channels.pop(3).close()
+        channels.pop(1).close()
+        ch6 = self.conn.channel(6)
+
+        # closed ids are reused lowest first, then new ones are
+        # handed out, skipping the one that was explicitly asked for
+        channels += [self.conn.channel() for i in range(3)]
+        self.assertEqual([ch.channel_id for ch in channels[-3:]], [2, 4, 7])
+
+        for ch in channels + [ch6]:
+            ch.close()
+        self.assertEqual(list(self.conn.channels), [0])
+
+
     def test_close(self):
         """
         Make sure we've broken various references when closing
@@ -126,6 +192,279 @@ class TestConnection(unittest.TestCase):
         gc.collect()
         self.assertEqual(unreachable_before, len(gc.garbage))
 
+    def test_coalesce_writes(self):
+        """
+        Check that buffered methods are only written when flushed,
+        or before waiting for a reply.
+
+        """
+        self.conn.close()
+        self.conn = Connection(coalesce_writes=True, **settings.connect_args)
+        ch = self.conn.channel()
+        qname, _, _ = ch.queue_declare()
+
+        writer = self.conn.method_writer
+        bytes_sent = writer.bytes_sent
+        for i in range(3):
+            ch.basic_publish(Message('message %d' % i), routing_key=qname)
+        self.assertEqual(writer.pending_methods, 3)
+        # nothing written yet, as far as heartbeats are concerned
+        self.assertEqual(writer.bytes_sent, bytes_sent)
+
+        self.conn.flush()
+        self.assertEqual(writer.pending, [])
+        self.assertEqual(writer.bytes_sent, bytes_sent + 1)
+
+        ch.basic_publish(Message('message 3'), routing_key=qname)
+        for i in range(4):
+            msg = ch.basic_get(qname, no_ack=True)
+            self.assertEqual(msg.body, 'message %d' % i)
+
+        ch.close()
+
+    def test_declaration_cache(self):
+        self.conn.close()
+        self.conn = Connection(declaration_cache=True, **settings.connect_args)
+        cache = self.conn.declaration_cache
+        ch = self.conn.channel()
+
+        for i in range(3):
+            ch.exchange_declare('unittest.cache', 'direct', auto_delete=True)
+            qinfo = ch.queue_declare('unittest.cache.q')
+            ch.queue_bind('unittest.cache.q', 'unittest.cache', 'key')
+        self.assertEqual(qinfo, ('unittest.cache.q', 0, 0))
+        self.assertEqual((cache.hits, cache.misses), (6, 3))
+
+        # the counts of a cached queue_declare aren't live, a passive
+        # declare gets them from the server.
+        ch.basic_publish(Message('hello'), routing_key='unittest.cache.q')
+        self.assertEqual(ch.queue_declare('unittest.cache.q'),
+                         ('unittest.cache.q', 0, 0))
+        self.assertEqual(ch.queue_declare('unittest.cache.q', passive=True),
+                         ('unittest.cache.q', 1, 0))
+        self.assertEqual((cache.hits, cache.misses), (7, 3))
+
+        # different arguments are a different declaration
+        ch.queue_bind('unittest.cache.q', 'unittest.cache', 'key2')
+        self.assertEqual((cache.hits, cache.misses), (7, 4))
+
+        # deleting the queue forgets the queue and its bindings
+        ch.queue_delete('unittest.cache.q')
+        self.assertEqual(len(cache), 1)
+
+        # channel errors invalidate the cache
+        self.assertRaises(AMQPChannelError, ch.exchange_declare,
+                          'unittest.cache', 'fanout')
+        self.assertEqual(len(cache), 0)
+
+    def test_header_cache(self):
+        self.conn.close()
+        self.conn = Connection(header_cache_size=2, **settings.connect_args)
+        cache = self.conn.method_writer.header_cache
+        ch = self.conn.channel()
+        qname, _, _ = ch.queue_declare()
+
+        headers = {'tenant': 'a'}
+        for i in range(3):
+            ch.basic_publish(Message('message %d' % i,
+                                     content_type='text/plain',
+                                     application_headers=headers),
+                             routing_key=qname)
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+
+        # changing the headers dict in place isn't missed
+        headers['tenant'] = 'b'
+        ch.basic_publish(Message('message 3', content_type='text/plain',
+                                 application_headers=headers),
+                         routing_key=qname)
+        self.assertEqual((cache.hits, cache.misses), (2, 2))
+
+        # the least recently used entry is dropped
+        ch.basic_publish(Message('message 4', delivery_mode=2),
+                         routing_key=qname)
+        self.assertEqual(len(cache), 2)
+
+        for i, tenant in enumerate('aaab'):
+            msg = ch.basic_get(qname, no_ack=True)
+            self.assertEqual(msg.body, 'message %d' % i)
+            self.assertEqual(msg.application_headers, {'tenant': tenant})
+        msg = ch.basic_get(qname, no_ack=True)
+        self.assertEqual(msg.delivery_mode, 2)
+
+        ch.close()
+
+    def test_channel_pool(self):
+        pool = self.conn.channel_pool(2)
+
+        ch = pool.acquire()
+        ch2 = pool.acquire()
+        self.assertNotEqual(ch.channel_id, ch2.channel_id)
+        self.assertRaises(ChannelPoolExhausted, pool.acquire, block=False)
+        self.assertRaises(ChannelPoolExhausted, pool.acquire, timeout=0.01)
+
+        qname, _, _ = ch.queue_declare()
+        ch.basic_consume(qname, callback=lambda msg: None)
+        ch.events['basic_return'].append(lambda *args: None)
+        pool.release(ch)
+        # released twice, it would be handed out twice
+        self.assertRaises(ValueError, pool.release, ch)
+        self.assertEqual(len(pool.idle), 1)
+
+        # the same channel is handed out again, without its old state
+        with pool.channel() as ch3:
+            self.assertTrue(ch3 is ch)
+            self.assertEqual(ch3.callbacks, {})
+            self.assertEqual(ch3.events['basic_return'], [])
+
+        # channels closed by the server are dropped from the pool
+        self.assertRaises(AMQPChannelError, ch2.queue_delete,
+                          'bogus_queue_that_does_not_exist')
+        pool.release(ch2)
+        self.assertEqual(len(pool), 1)
+
+        stats = pool.stats
+        self.assertEqual((stats['acquired'], stats['created'],
+                          stats['discarded'], stats['waits']), (3, 2, 1, 1))
+
+        pool.close()
+        self.assertFalse(ch.is_open)
+
+    def test_channel_pool_requeue(self):
+        pool = self.conn.channel_pool(1)
+
+        ch = pool.acquire()
+        qname, _, _ = ch.queue_declare()
+        for i in range(3):
+            ch.basic_publish(Message('message %d' % i), routing_key=qname)
+        received = []
+        ch.basic_consume(qname, callback=received.append)
+        # the deliveries are still queued on the channel when it's
+        # released, so they go back to the queue
+        pool.release(ch)
+
+        with pool.channel() as ch2:
+            self.assertTrue(ch2 is ch)
+            bodies = [ch2.basic_get(qname, no_ack=True).body
+                        for i in range(3)]
+            self.assertEqual(sorted(bodies),
+                             ['message %d' % i for i in range(3)])
+            self.assertEqual(received, [])
+        pool.close()
+
+    def test_broker_list(self):
+        args = dict(settings.connect_args)
+        host = args.pop('host')
+        # nothing listens on port 1
+        brokers = BrokerList(['127.0.0.1:1', host])
+
+        for i in range(3):
+            conn = Connection(host=brokers, **args)
+            self.assertEqual(conn.host, host)
+            conn.close()
+
+        # the dead broker was only tried once
+        stats = brokers.stats
+        self.assertEqual(stats['127.0.0.1:1']['failures'], 1)
+        self.assertEqual(stats[host]['connections'], 3)
+        self.assertTrue(stats[host]['latency'] > 0)
+        self.assertEqual(brokers.candidates(), [host, '127.0.0.1:1'])
+
+        # a plain list of hosts is fine too
+        conn = Connection(host=['127.0.0.1:1', host], **args)
+        self.assertEqual(conn.host, host)
+        conn.close()
+
+        # brokers failing too often aren't tried for a while
+        brokers = BrokerList(['127.0.0.1:1', '127.0.0.1:2'],
+                             failure_threshold=1)
+        self.assertRaises(IOError, Connection, host=brokers, **args)
+        self.assertEqual(brokers.candidates(), [])
+        self.assertFalse(brokers.stats['127.0.0.1:2']['available'])
+        self.assertRaises(IOError, Connection, host=brokers, **args)
+        self.assertEqual(brokers.stats['127.0.0.1:2']['failures'], 1)
+
+        # a virtual host missing on one broker is missing on all of
+        # them, it's not the broker failing
+        brokers = BrokerList([host, '127.0.0.1:1'])
+        self.assertRaises(AMQPConnectionError, Connection, host=brokers,
+                          virtual_host='/kamqp-no-such-vhost', **args)
+        self.assertEqual([brokers.stats[h]['failures'] for h in brokers.hosts],
+                         [0, 0])
+
+
+    def test_broker_list_redirect(self):
+        args = dict(settings.connect_args)
+        host = args.pop('host')
+        listener = socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+        redirector = '127.0.0.1:%d' % listener.getsockname()[1]
+        # redirected to a dead broker
+        thread = threading.Thread(target=redirect_once,
+                                  args=(listener, '127.0.0.1:1'))
+        thread.start()
+        try:
+            conn = Connection(host=[redirector, host], **args)
+        finally:
+            thread.join(5)
+            listener.close()
+        # the other brokers are still tried
+        self.assertEqual(conn.host, host)
+        conn.close()
+
+
+    def test_heartbeat(self):
+        self.conn.close()
+        self.conn = Connection(heartbeat=1, **settings.connect_args)
+        checker = self.conn.heartbeat_checker
+
+        # heartbeats are sent while waiting for nothing in particular
+        self.assertRaises(socket.timeout, self.conn.drain_events,
+                          timeout=1.5)
+        self.assertTrue(checker.heartbeats_sent >= 1)
+
+        # a server silent for more than two heartbeats is dead
+        checker.last_recv_time -= 3
+        self.assertRaises(AMQPConnectionError, self.conn.heartbeat_tick)
+        self.assertEqual(self.conn.channels, None)
+        self.conn = None
+
+
+    def test_heartbeat_partial_frame(self):
+        self.conn.close()
+        self.conn = Connection(heartbeat=1, **settings.connect_args)
+        received = []
+        ch = self.conn.channel()
+        qname, _, _ = ch.queue_declare()
+        ctag = ch.basic_consume(qname, callback=received.append, no_ack=True)
+
+        args = AMQPWriter()
+        args.write_shortstr(ctag)
+        args.write_longlong(1)
+        args.write_bit(False)
+        args.write_shortstr('')
+        args.write_shortstr(qname)
+        protocol = Protocol()
+        protocol.send_method(ch.channel_id, (60, 60), args, Message('split'))
+        data = protocol.data_to_send()
+
+        # Stand in for the broker, the rest of the frame arrives after
+        # the wait was interrupted to check the heartbeats.
+        transport = self.conn.transport
+        sock, peer = socket.socketpair()
+        real_sock, transport.sock = transport.sock, sock
+        try:
+            peer.sendall(data[:10])
+            timer = threading.Timer(1.3, peer.sendall, [data[10:]])
+            timer.start()
+            self.conn.drain_events(timeout=3)
+            timer.join()
+            self.assertEqual([msg.body for msg in received], ['split'])
+        finally:
+            transport.sock = real_sock
+            sock.close()
+            peer.close()
+
 
 def main():
     suite = unittest.TestLoader().loadTestsFromTestCase(TestConnection)
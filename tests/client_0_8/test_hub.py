@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+"""
+Test kamqp.client_0_8.hub module
+
+"""
+# Copyright (C) 2007-2008 Barry Pederson <bp@barryp.org>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+
+import socket
+import time
+import unittest
+
+import settings
+
+
+from kamqp.client_0_8 import Connection, Hub, Message
+from kamqp.client_0_8.protocol import Protocol
+from kamqp.client_0_8.serialization import AMQPWriter
+
+
+class TestHub(unittest.TestCase):
+    def setUp(self):
+        self.hub = Hub()
+        self.conns = [Connection(**settings.connect_args) for i in range(3)]
+        for conn in self.conns:
+            self.hub.register(conn)
+
+
+    def tearDown(self):
+        for conn in self.conns:
+            conn.close()
+
+
+    def test_consume(self):
+        received = []
+        channels = []
+        for conn in self.conns:
+            ch = conn.channel()
+            qname, _, _ = ch.queue_declare()
+            ch.basic_consume(qname, callback=received.append, no_ack=True)
+            channels.append((ch, qname))
+
+        for ch, qname in channels:
+            for i in range(5):
+                ch.basic_publish(Message('message %d' % i), routing_key=qname)
+
+        deadline = time.time() + 5
+        while len(received) < 15 and time.time() < deadline:
+            self.hub.run_once(timeout=1)
+        self.assertEqual(len(received), 15)
+        for ch, qname in channels:
+            self.assertEqual(
+                [msg.body for msg in received
+                    if msg.delivery_info['channel'] is ch],
+                ['message %d' % i for i in range(5)])
+
+
+    def test_partial_frame(self):
+        received = []
+        conn = self.conns[0]
+        ch = conn.channel()
+        qname, _, _ = ch.queue_declare()
+        ctag = ch.basic_consume(qname, callback=received.append, no_ack=True)
+
+        # Stand in for the broker, reading from a socket we write to
+        self.hub.unregister(conn)
+        sock, peer = socket.socketpair()
+        real_sock, conn.transport.sock = conn.transport.sock, sock
+        self.hub.register(conn)
+        try:
+            args = AMQPWriter()
+            args.write_shortstr(ctag)
+            args.write_longlong(1)
+            args.write_bit(False)
+            args.write_shortstr('')
+            args.write_shortstr(qname)
+            protocol = Protocol()
+            protocol.send_method(ch.channel_id, (60, 60), args,
+                                 Message('split'))
+            data = protocol.data_to_send()
+
+            peer.sendall(data[:10])
+            self.assertEqual(self.hub.run_once(timeout=0.1), 0)
+            peer.sendall(data[10:])
+            self.assertEqual(self.hub.run_once(timeout=1), 1)
+            self.assertEqual([msg.body for msg in received], ['split'])
+        finally:
+            self.hub.unregister(conn)
+            conn.transport.sock = real_sock
+            sock.close()
+            peer.close()
+
+
+    def test_timers(self):
+        calls = []
+        self.hub.call_later(0.05, calls.append, 'later')
+        self.hub.call_later(0.01, calls.append, 'sooner')
+        self.hub.call_later(0.02, calls.append, 'cancelled').cancel()
+        timer = self.hub.call_repeatedly(0.02, calls.append, 'repeat')
+
+        deadline = time.time() + 0.2
+        while time.time() < deadline:
+            self.hub.run_once(timeout=0.2)
+        timer.cancel()
+
+        self.assertEqual(calls[0], 'sooner')
+        self.assertTrue('later' in calls)
+        self.assertFalse('cancelled' in calls)
+        self.assertTrue(calls.count('repeat') >= 5)
+
+
+    def test_unregister_closed(self):
+        errors = []
+        self.hub.on_error = lambda conn, exc: errors.append(conn)
+        conn = self.conns[0]
+        conn.transport.sock.shutdown(2)
+        self.hub.run_once(timeout=1)
+        self.assertEqual(errors, [conn])
+        self.assertEqual(len(self.hub), 2)
+        self.conns.remove(conn)
+
+
+def main():
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestHub)
+    unittest.TextTestRunner(**settings.test_args).run(suite)
+
+if __name__ == '__main__':
+    main()
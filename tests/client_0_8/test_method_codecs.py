@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+"""
+Test kamqp.client_0_8.method_codecs, checking the generated codecs
+encode and decode method arguments like AMQPWriter and AMQPReader.
+
+"""
+# Copyright (C) 2007-2008 Barry Pederson <bp@barryp.org>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+
+import unittest
+
+try:
+    bytes
+except NameError:
+    # Python 2.5 and lower
+    bytes = str
+
+import settings
+
+from kamqp.client_0_8 import method_codecs
+from kamqp.client_0_8.method_codecs import (decode_basic_deliver,
+    decode_channel_alert, decode_tx_select_ok, encode_access_request,
+    encode_basic_publish, encode_queue_declare, encode_tx_select)
+from kamqp.client_0_8.serialization import AMQPWriter
+
+
+class TestMethodCodecs(unittest.TestCase):
+    def test_encode(self):
+        w = AMQPWriter()
+        w.write_short(1)
+        w.write_shortstr('amq.direct')
+        w.write_shortstr(u'caf\xe9')
+        w.write_bit(True)
+        w.write_bit(False)
+        self.assertEqual(encode_basic_publish(1, 'amq.direct', u'caf\xe9',
+                                              True, False),
+                         w.getvalue())
+
+        w = AMQPWriter()
+        w.write_short(0)
+        w.write_shortstr('')
+        for bit in [False, True, False, True, True]:
+            w.write_bit(bit)
+        w.write_table({'x-expires': 1000})
+        self.assertEqual(encode_queue_declare(0, '', False, 1, None, 'y',
+                                              True, {'x-expires': 1000}),
+                         w.getvalue())
+
+        self.assertRaises(ValueError, encode_access_request, 'x' * 256,
+                          False, False, False, False, False)
+
+
+    def test_decode(self):
+        w = AMQPWriter()
+        # the arguments follow the class and method ids in a frame
+        w.write_short(60)
+        w.write_short(60)
+        w.write_shortstr('ctag')
+        w.write_longlong(2 ** 40)
+        w.write_bit(True)
+        w.write_shortstr('amq.direct')
+        w.write_shortstr(u'caf\xe9')
+        self.assertEqual(decode_basic_deliver(w.getvalue(), 4),
+                         (u'ctag', 2 ** 40, True, u'amq.direct', u'caf\xe9'))
+
+        w = AMQPWriter()
+        w.write_short(320)
+        w.write_shortstr('CONNECTION_FORCED')
+        w.write_table({'reason': 'shutdown'})
+        self.assertEqual(decode_channel_alert(w.getvalue()),
+                         (320, u'CONNECTION_FORCED', {'reason': u'shutdown'}))
+
+
+    def test_directions(self):
+        # close and flow go both ways
+        for name in ['encode_channel_close', 'decode_channel_close',
+                     'encode_channel_flow', 'decode_channel_flow']:
+            self.assertTrue(hasattr(method_codecs, name))
+        self.assertFalse(hasattr(method_codecs, 'encode_basic_deliver'))
+        self.assertFalse(hasattr(method_codecs, 'decode_basic_publish'))
+        self.assertEqual(encode_tx_select(), bytes())
+        self.assertEqual(decode_tx_select_ok(bytes()), ())
+
+
+def main():
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestMethodCodecs)
+    unittest.TextTestRunner(**settings.test_args).run(suite)
+
+
+if __name__ == '__main__':
+    main()
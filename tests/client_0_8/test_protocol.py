@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+"""
+Test kamqp.client_0_8.protocol module
+
+"""
+# Copyright (C) 2007-2008 Barry Pederson <bp@barryp.org>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+
+import unittest
+
+try:
+    bytes
+except NameError:
+    # Python 2.5 and lower
+    bytes = str
+
+import settings
+
+
+from kamqp.client_0_8 import Message
+from kamqp.client_0_8.protocol import Protocol
+from kamqp.client_0_8.serialization import AMQPWriter
+
+
+class TestProtocol(unittest.TestCase):
+    def setUp(self):
+        self.client = Protocol(frame_max=64)
+        self.server = Protocol()
+
+
+    def test_initiate(self):
+        self.client.initiate()
+        self.assertEqual(self.client.data_to_send(),
+                         'AMQP\x01\x01\x08\x00'.encode('latin_1'))
+        self.assertEqual(self.client.data_to_send(), bytes())
+
+
+    def test_methods(self):
+        args = AMQPWriter()
+        args.write_short(0)
+        args.write_shortstr('unittest.q')
+        msg = Message('x'.encode('latin_1') * 200, content_type='text/plain')
+        self.client.send_method(1, (50, 10), args)
+        self.client.send_method(1, (60, 60), args, msg)
+        data = self.client.data_to_send()
+
+        # fed a byte at a time, methods come out as they complete
+        events = []
+        for i in range(len(data)):
+            events.extend(self.server.receive_data(data[i:i + 1]))
+            if i == 7 + 17:  # end of the queue_declare frame
+                self.assertEqual(len(events), 1)
+        self.assertEqual(len(events), 2)
+
+        channel, method_sig, args, content = events[0]
+        self.assertEqual((channel, method_sig), (1, (50, 10)))
+        self.assertEqual(args.read_short(), 0)
+        self.assertEqual(args.read_shortstr(), 'unittest.q')
+        self.assertEqual(content, None)
+
+        channel, method_sig, args, content = events[1]
+        self.assertEqual((channel, method_sig), (1, (60, 60)))
+        self.assertEqual(content, msg)
+
+
+    def test_heartbeat(self):
+        self.server.send_heartbeat()
+        data = self.server.data_to_send()
+        self.assertEqual(data,
+                         u'\x08\x00\x00\x00\x00\x00\x00\xce'.encode('latin_1'))
+        self.assertEqual(self.client.reader.last_heartbeat, None)
+        self.assertEqual(self.client.receive_data(data), [])
+        self.assertNotEqual(self.client.reader.last_heartbeat, None)
+        # not answered, sending heartbeats is up to the caller
+        self.assertEqual(self.client.data_to_send(), bytes())
+
+
+    def test_framing_error(self):
+        bad_frame = u'\x01\x00\x01\x00\x00\x00\x00\xcf'.encode('latin_1')
+        self.assertRaises(Exception, self.server.receive_data, bad_frame)
+
+        # the methods received before the error aren't lost
+        self.server.send_method(0, (10, 50), AMQPWriter())
+        events = self.client.receive_data(self.server.data_to_send()
+                                          + bad_frame)
+        self.assertEqual([event[:2] for event in events], [(0, (10, 50))])
+        self.assertRaises(Exception, self.client.receive_data, bytes())
+        self.assertRaises(Exception, self.client.receive_data, bytes())
+
+
+    def test_bad_frame(self):
+        for method_sig in [(10, 50), (10, 51)]:
+            self.server.send_method(0, method_sig, AMQPWriter())
+        data = self.server.data_to_send()
+        # a method frame too short for the method signature
+        bad_frame = u'\x01\x00\x00\x00\x00\x00\x02\x00\x0a\xce'.encode(
+            'latin_1')
+        events = self.client.receive_data(data[:12] + bad_frame + data[12:])
+        self.assertEqual([event[:2] for event in events], [(0, (10, 50))])
+        self.assertRaises(Exception, self.client.receive_data, bytes())
+        # the frames after the bad one are still there
+        events = self.client.receive_data(bytes())
+        self.assertEqual([event[:2] for event in events], [(0, (10, 51))])
+
+
+def main():
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestProtocol)
+    unittest.TextTestRunner(**settings.test_args).run(suite)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+"""
+Test kamqp.client_0_8.recovery module
+
+"""
+# Copyright (C) 2007-2008 Barry Pederson <bp@barryp.org>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+
+import time
+import unittest
+
+import settings
+
+
+from kamqp.client_0_8 import (AMQPConnectionError, Message,
+                              RecoveringConnection)
+
+
+class TestRecovery(unittest.TestCase):
+    def setUp(self):
+        self.conn = RecoveringConnection(retry_delay=0.01,
+                                         **settings.connect_args)
+        self.ch = self.conn.channel()
+
+
+    def tearDown(self):
+        self.conn.close()
+
+
+    def lose_connection(self):
+        self.conn.connection.transport.sock.shutdown(2)
+
+
+    def test_recover(self):
+        recovered = []
+        self.conn.on_recover = recovered.append
+
+        ch = self.ch
+        ch.basic_qos(0, 10, False)
+        ch.exchange_declare('unittest.recovery', 'direct')
+        qname, _, _ = ch.queue_declare(exclusive=True)
+        ch.queue_bind(qname, 'unittest.recovery', routing_key='key')
+        received = []
+        consumer_tag = ch.basic_consume(qname, callback=received.append,
+                                        no_ack=True)
+        channel, channel_id = ch.channel, ch.channel_id
+
+        self.lose_connection()
+        self.assertEqual(self.conn.drain_events(timeout=1), None)
+        self.assertEqual(recovered, [self.conn])
+        self.assertEqual(self.conn.stats['recoveries'], 1)
+
+        # the same channel id, a new server-named queue, and the
+        # consumer is back with the same tag
+        self.assertFalse(ch.channel is channel)
+        self.assertEqual(ch.channel.channel_id, channel_id)
+        self.assertNotEqual(self.conn.queue_name(qname), qname)
+        self.assertEqual(list(ch.callbacks), [consumer_tag])
+
+        ch.basic_publish(Message('after'), 'unittest.recovery',
+                         routing_key='key')
+        deadline = time.time() + 5
+        while not received and time.time() < deadline:
+            self.conn.drain_events(timeout=1)
+        self.assertEqual([msg.body for msg in received], ['after'])
+
+        # the server-named queue can still be used by its first name
+        ch.basic_publish(Message('direct'), routing_key=qname)
+        deadline = time.time() + 5
+        while len(received) < 2 and time.time() < deadline:
+            self.conn.drain_events(timeout=1)
+        self.assertEqual(received[1].body, 'direct')
+
+        ch.queue_delete(qname)
+        ch.exchange_delete('unittest.recovery')
+        self.assertEqual(self.conn.topology, {})
+        self.assertEqual(ch.consumers, {})
+
+
+    def test_retry(self):
+        self.lose_connection()
+        qname, _, _ = self.ch.queue_declare('unittest.recovery.retry')
+        self.assertEqual(qname, 'unittest.recovery.retry')
+        self.assertEqual(self.conn.stats['recoveries'], 1)
+        self.assertEqual(list(self.conn.topology),
+                         [('queue', 'unittest.recovery.retry')])
+        self.ch.queue_delete(qname)
+
+
+    def test_refused(self):
+        self.conn.connection_kwargs['virtual_host'] = '/kamqp-no-such-vhost'
+        self.lose_connection()
+        self.assertRaises(AMQPConnectionError, self.conn.drain_events,
+                          timeout=1)
+        self.assertEqual(self.conn.stats['failed_attempts'], 1)
+        self.assertEqual(self.conn.stats['recoveries'], 0)
+
+
+    def test_no_retry(self):
+        self.lose_connection()
+        self.assertRaises(IOError, self.ch.basic_recover)
+        self.assertEqual(self.conn.stats['recoveries'], 1)
+        self.assertTrue(self.ch.is_open)
+
+
+def main():
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestRecovery)
+    unittest.TextTestRunner(**settings.test_args).run(suite)
+
+if __name__ == '__main__':
+    main()
@@ -22,6 +22,7 @@ between byte streams and higher level objects.
 
 from datetime import datetime
 from decimal import Decimal
+from io import BytesIO
 from random import randint
 import sys
 import unittest
@@ -347,6 +348,37 @@ class TestSerialization(unittest.TestCase):
         r = AMQPReader(s)
         self.assertEqual(r.read_table(), val)
 
+    #
+    # Reading in place, and from a file-like object
+    #
+    def test_offset(self):
+        w = AMQPWriter()
+        w.write_short(60)
+        w.write_bit(True)
+        w.write_bit(False)
+        w.write_shortstr('hello')
+        w.write_table({'foo': 7, 'bar': {'baz': 'x'}})
+        w.write_longlong(2 ** 40)
+        s = w.getvalue()
+
+        for r in [AMQPReader(s, 2), AMQPReader(BytesIO(s[2:])),
+                  AMQPReader(bytearray(s), 2)]:
+            self.assertEqual(r.read_bit(), True)
+            self.assertEqual(r.read_bit(), False)
+            self.assertEqual(r.read_shortstr(), 'hello')
+            self.assertEqual(r.read_table(), {'foo': 7, 'bar': {'baz': 'x'}})
+            self.assertEqual(r.read_longlong(), 2 ** 40)
+
+        r = AMQPReader(s, 2)
+        r.read_bit()
+        r.read_shortstr()
+        # the short, the bits' octet and the shortstr
+        self.assertEqual(r.offset, 2 + 1 + 6)
+
+    def test_reader_source(self):
+        self.assertRaises(ValueError, AMQPReader, u'unicode')
+        self.assertRaises(ValueError, AMQPReader, None)
+
     #
     # GenericContent
     #
@@ -361,6 +393,101 @@ class TestSerialization(unittest.TestCase):
         self.assertNotEqual(msg_1, None)
 
 
+    def test_property_codec(self):
+        class Content(GenericContent):
+            PROPERTIES = [
+                ('content_type', 'shortstr'),
+                ('headers', 'table'),
+                ('delivery_mode', 'octet'),
+                ('priority', 'octet'),
+                ('timestamp', 'timestamp'),
+                ('app_id', 'shortstr'),
+                ]
+
+        codec = Content._property_codec()
+        self.assertTrue(Content._property_codec() is codec)
+        self.assertFalse(GenericContent._property_codec() is codec)
+
+        now = datetime.fromtimestamp(1234567890)
+        for props in [{},
+                      {'content_type': u'caf\xe9'},
+                      {'content_type': 'text/plain', 'delivery_mode': 2},
+                      {'content_type': 'text/plain', 'delivery_mode': 2,
+                       'priority': 9},
+                      {'headers': {'a': 1}, 'delivery_mode': 1,
+                       'priority': 0, 'timestamp': now, 'app_id': 'x'},
+                      {'delivery_mode': 2, 'app_id': None}]:
+            raw = codec.encode(props)
+            self.assertEqual(raw, codec._encode_generic(props))
+            msg = Content()
+            msg._load_properties(bytes(bytearray(3)) + raw, 3)
+            self.assertEqual(msg.properties,
+                             dict((name, value)
+                                  for name, value in props.items()
+                                      if value is not None))
+
+        # one encoder and decoder per shape
+        self.assertEqual(len(codec.encoders), 6)
+        self.assertEqual(len(codec.decoders), 6)
+
+        self.assertRaises(ValueError, codec.encode, {'priority': 256})
+        self.assertRaises(ValueError, codec.encode, {'app_id': 'x' * 256})
+
+        # more than 15 properties take more than one word of flags,
+        # and are always encoded by _encode_generic
+        class BigContent(GenericContent):
+            PROPERTIES = [('p%d' % i, 'octet') for i in range(20)]
+
+        codec = BigContent._property_codec()
+        for props in [{}, {'p0': 1, 'p19': 4},
+                      {'p0': 1, 'p14': 2, 'p15': 3, 'p19': 4}]:
+            raw = codec.encode(props)
+            self.assertEqual(len(raw), 4 + len(props))
+            self.assertEqual(codec.decode(raw), props)
+
+        self.assertRaises(ValueError, codec.encode, {'p17': 256})
+        if sys.version_info[0] >= 3:
+            # struct doesn't truncate floats any more
+            self.assertRaises(ValueError, codec.encode, {'p17': 1.5})
+
+
+    def test_lazy_properties(self):
+        class Content(GenericContent):
+            PROPERTIES = [
+                ('content_type', 'shortstr'),
+                ('headers', 'table'),
+                ('delivery_mode', 'octet'),
+                ('extra', 'table'),
+                ]
+
+        props = {'content_type': 'text/plain', 'headers': {'a': 1},
+                 'delivery_mode': 2, 'extra': {'b': {'c': 'd'}}}
+        raw = Content(**props)._serialize_properties()
+
+        msg = Content()
+        msg._load_properties(raw, lazy=True)
+        self.assertTrue('_raw_properties' in msg.__dict__)
+
+        # the tables aren't decoded until they're used
+        self.assertEqual(msg.delivery_mode, 2)
+        self.assertEqual(sorted(msg.__dict__['_raw_tables']),
+                         ['extra', 'headers'])
+        self.assertEqual(msg.headers, {'a': 1})
+        self.assertEqual(list(msg.__dict__['_raw_tables']), ['extra'])
+        self.assertRaises(AttributeError, getattr, msg, 'missing')
+
+        self.assertEqual(msg.properties, props)
+        self.assertFalse('_raw_tables' in msg.__dict__)
+
+        msg = Content()
+        msg._load_properties(raw, lazy=True)
+        self.assertEqual(msg, Content(**props))
+        msg._load_properties(raw, lazy=True)
+        msg.properties = {'content_type': 'text/html'}
+        self.assertEqual(msg.content_type, 'text/html')
+        self.assertRaises(AttributeError, getattr, msg, 'headers')
+
+
 def main():
     suite = unittest.TestLoader().loadTestsFromTestCase(TestSerialization)
     unittest.TextTestRunner(**settings.test_args).run(suite)
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+"""
+Test kamqp.client_0_8.threaded module
+
+"""
+# Copyright (C) 2007-2008 Barry Pederson <bp@barryp.org>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+
+import os
+import threading
+import time
+import unittest
+
+import settings
+
+
+from kamqp.client_0_8 import AMQPChannelError, Message, ThreadedConnection
+
+
+class TestThreaded(unittest.TestCase):
+    def setUp(self):
+        self.conn = ThreadedConnection(max_pending=16,
+                                       **settings.connect_args)
+        self.ch = self.conn.channel()
+
+
+    def tearDown(self):
+        self.conn.close()
+        self.assertFalse(self.conn.connection.transport)
+
+
+    def test_publish_threads(self):
+        qname, _, _ = self.ch.queue_declare()
+
+        def publisher(n):
+            ch = self.conn.channel()
+            for i in range(50):
+                ch.basic_publish(Message('%d.%d' % (n, i)),
+                                 routing_key=qname)
+
+        threads = [threading.Thread(target=publisher, args=(n, ))
+                    for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.conn.flush()
+
+        _, message_count, _ = self.ch.queue_declare(qname, passive=True)
+        self.assertEqual(message_count, 200)
+        bodies = []
+        for i in range(200):
+            msg = self.ch.basic_get(qname, no_ack=True)
+            bodies.append(msg.body)
+        for n in range(4):
+            self.assertEqual([body for body in bodies
+                                if body.startswith('%d.' % n)],
+                             ['%d.%d' % (n, i) for i in range(50)])
+
+
+    def test_consume(self):
+        qname, _, _ = self.ch.queue_declare()
+        received = []
+        done = threading.Event()
+
+        def callback(msg):
+            # consumer callbacks run in the I/O thread, and can
+            # still use the channel
+            self.ch.basic_ack(msg.delivery_tag)
+            received.append(msg.body)
+            if len(received) == 10:
+                done.set()
+
+        self.ch.basic_consume(qname, callback=callback)
+        for i in range(10):
+            self.ch.basic_publish(Message('message %d' % i),
+                                  routing_key=qname)
+        done.wait(5)
+        self.assertEqual(received, ['message %d' % i for i in range(10)])
+
+
+    def test_close_from_callback(self):
+        qname, _, _ = self.ch.queue_declare()
+        closed = threading.Event()
+
+        def callback(msg):
+            self.conn.close()
+            closed.set()
+
+        self.ch.basic_consume(qname, callback=callback, no_ack=True)
+        thread = self.conn.thread
+        self.ch.basic_publish(Message('bye'), routing_key=qname)
+        self.assertTrue(closed.wait(5))
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(self.conn.thread, None)
+        self.assertRaises(ValueError, self.ch.queue_declare)
+
+
+    def test_close_stopped_thread(self):
+        # the I/O thread leaves the hub before close() wakes it up
+        close_connection = self.conn._close_connection
+
+        def stop_first():
+            self.conn.hub.stop()
+            close_connection()
+
+        self.conn._close_connection = stop_first
+        wakeup_r, wakeup_w = self.conn._wakeup_r, self.conn._wakeup_w
+        self.conn.close()
+        self.assertEqual(self.conn.thread, None)
+        self.assertRaises(ValueError, self.ch.queue_declare)
+        for fd in (wakeup_r, wakeup_w):
+            self.assertRaises(OSError, os.fstat, fd)
+
+
+    def test_channel_error(self):
+        self.assertRaises(AMQPChannelError, self.ch.queue_delete,
+                          'bogus_queue_that_does_not_exist')
+        self.assertFalse(self.ch.is_open)
+
+        # the connection is still usable
+        ch = self.conn.channel()
+        ch.queue_declare()
+
+
+    def test_connection_lost(self):
+        errors = []
+        self.conn.on_error = lambda conn, exc: errors.append(exc)
+        self.conn.connection.transport.sock.shutdown(2)
+
+        deadline = time.time() + 5
+        while self.conn.error is None and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(errors, [self.conn.error])
+        self.assertRaises(Exception, self.ch.queue_declare)
+
+
+def main():
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestThreaded)
+    unittest.TextTestRunner(**settings.test_args).run(suite)
+
+if __name__ == '__main__':
+    main()